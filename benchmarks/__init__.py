@@ -0,0 +1,11 @@
+"""
+Route benchmarks on a synthetic dataset (SQLite, no external services).
+
+    python -m benchmarks.run --scale small
+
+dataset.py seeds users, a deep course tree, quiz history and exam attempts
+through the real models; run.py drives the hot routes with the Flask test
+client and writes p50/p99 latency and query counts to a JSON baseline.
+exam_day.py replays an exam sitting (start/autosave/submit from many
+students at once) against a real gunicorn to check capacity and integrity.
+"""
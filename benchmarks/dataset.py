@@ -0,0 +1,415 @@
+"""
+Synthetic dataset for the benchmarks.
+
+Rows are written through the real model tables with bulk inserts (mapper
+events do not fire for those), so Course.path and the lesson/exam counters
+are rebuilt afterwards with the same repair helpers the CLI exposes.
+Everything is derived from a seeded random generator: the same scale gives
+the same database.
+"""
+import json
+import random
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import text
+
+from website import (
+    app, db, bcrypt,
+    User, CourseEnrollment, Course, Lesson, Quiz, Exam, ExamQuestion, ExamAttempt, ExamAnswer,
+    CourseAccess, CourseAgreement, UserCourseProgress, QuizAttempt, QuizRetakeAttempt,
+    rebuild_course_counters, rebuild_course_paths,
+)
+
+ROOT_COURSE_NAMES = ('seerah', 'arabic', 'fiqh', 'aqeedah', 'hadith', 'tafsir', 'tajweed', 'usul')
+DEFAULT_ENROLLMENTS = ('seerah', 'arabic')
+OPTION_LETTERS = ('A', 'B', 'C', 'D')
+BATCH_SIZE = 5000
+BENCH_PASSWORD = 'benchmark'
+
+# Courses per root = 1 + branching + branching**2 + ... (depth levels)
+SCALES = {
+    'small': {
+        'users': 500, 'root_courses': 3, 'depth': 3, 'branching': 2,
+        'lessons_per_course': 6, 'quizzes_per_lesson': 3,
+        'exams_per_root': 2, 'questions_per_exam': 20,
+        'exam_attempts_per_user': 2, 'quiz_attempts_per_user': 15, 'retakes_per_user': 2,
+    },
+    'medium': {
+        'users': 5000, 'root_courses': 6, 'depth': 4, 'branching': 2,
+        'lessons_per_course': 8, 'quizzes_per_lesson': 3,
+        'exams_per_root': 3, 'questions_per_exam': 25,
+        'exam_attempts_per_user': 3, 'quiz_attempts_per_user': 40, 'retakes_per_user': 4,
+    },
+    'full': {
+        'users': 25000, 'root_courses': 8, 'depth': 4, 'branching': 3,
+        'lessons_per_course': 8, 'quizzes_per_lesson': 3,
+        'exams_per_root': 4, 'questions_per_exam': 25,
+        'exam_attempts_per_user': 4, 'quiz_attempts_per_user': 60, 'retakes_per_user': 6,
+    },
+}
+
+
+class _Ids:
+    """Hands out primary keys so child rows can be built before anything is flushed."""
+
+    def __init__(self):
+        self._next = {}
+
+    def __call__(self, model) -> int:
+        value = self._next.get(model, 1)
+        self._next[model] = value + 1
+        return value
+
+
+def _insert(model, rows) -> int:
+    """Bulk insert an iterable of row dicts in batches. Returns rows written."""
+    written = 0
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH_SIZE:
+            db.session.execute(db.insert(model), batch)
+            written += len(batch)
+            batch = []
+    if batch:
+        db.session.execute(db.insert(model), batch)
+        written += len(batch)
+    return written
+
+
+def _build_catalogue(scale: dict, rng: random.Random, ids: _Ids) -> dict:
+    courses, lessons, quizzes, exams, questions = [], [], [], [], []
+    lessons_by_root = {}
+    exam_questions = {}
+    exam_root = {}
+
+    def add_course(name, parent_id, level, order_index, root_id):
+        course_id = ids(Course)
+        courses.append({
+            'id': course_id,
+            'name': name,
+            'year': 1,
+            'description': f"Synthetic course {name}",
+            'course_type': 'year_based' if parent_id is None else 'sub_course',
+            'parent_id': parent_id,
+            'order_index': order_index,
+            'is_published': True,
+            'price': None if level < 2 else 15,
+            'show_on_homepage': parent_id is None,
+            'course_assignment': 'year_1' if parent_id is None else 'standalone',
+        })
+        root_id = root_id or course_id
+        for week in range(1, scale['lessons_per_course'] + 1):
+            lesson_id = ids(Lesson)
+            lessons.append({
+                'id': lesson_id,
+                'week': week,
+                'title': f"{name} week {week}",
+                'video_file': f"courses/{name.replace(' ', '_')}/week{week}.mp4",
+                'description': f"Lesson {week} of {name}",
+                'course_id': course_id,
+            })
+            lessons_by_root.setdefault(root_id, []).append((lesson_id, course_id, week))
+            for number in range(scale['quizzes_per_lesson']):
+                quizzes.append({
+                    'id': ids(Quiz),
+                    'question': f"{name} week {week} question {number + 1}",
+                    'option_a': 'First option',
+                    'option_b': 'Second option',
+                    'option_c': 'Third option',
+                    'correct_answer': rng.choice(OPTION_LETTERS[:3]),
+                    'lesson_id': lesson_id,
+                })
+        return course_id
+
+    roots = []
+    for index in range(scale['root_courses']):
+        base = ROOT_COURSE_NAMES[index % len(ROOT_COURSE_NAMES)]
+        name = base if index < len(ROOT_COURSE_NAMES) else f"{base} {index // len(ROOT_COURSE_NAMES) + 1}"
+        root_id = add_course(name, None, 0, index, None)
+        roots.append(root_id)
+
+        # Breadth-first so the first few courses of each subtree are the shallow ones
+        subtree = [root_id]
+        level = [(root_id, name)]
+        for depth in range(1, scale['depth']):
+            next_level = []
+            for parent_id, parent_name in level:
+                for position in range(scale['branching']):
+                    child_name = f"{parent_name} {position + 1}" if depth > 1 else f"{name} part {position + 1}"
+                    child_id = add_course(child_name, parent_id, depth, position, root_id)
+                    subtree.append(child_id)
+                    next_level.append((child_id, child_name))
+            level = next_level
+
+        lessons_by_course = {}
+        for lesson_id, course_id, week in lessons_by_root[root_id]:
+            lessons_by_course.setdefault(course_id, []).append(lesson_id)
+        for position, course_id in enumerate(subtree[:scale['exams_per_root']]):
+            exam_id = ids(Exam)
+            course_lessons = lessons_by_course[course_id]
+            exams.append({
+                'id': exam_id,
+                'course_id': course_id,
+                'title': f"Exam {position + 1}",
+                'description': 'Synthetic exam',
+                'duration_minutes': 45,
+                'pass_mark': 70.0,
+                'is_required': position == 0,
+                'is_active': True,
+                'allow_retakes': True,
+                'trigger_lesson_id': course_lessons[len(course_lessons) // 2],
+                'required_to_complete_course': position == 0,
+                'settings': {},
+            })
+            exam_root[exam_id] = root_id
+            exam_questions[exam_id] = []
+            for order_index in range(scale['questions_per_exam']):
+                question_id = ids(ExamQuestion)
+                correct = rng.choice(OPTION_LETTERS)
+                questions.append({
+                    'id': question_id,
+                    'exam_id': exam_id,
+                    'question_type': 'multiple_choice',
+                    'text': f"Exam {exam_id} question {order_index + 1}",
+                    'options': list(OPTION_LETTERS),
+                    'correct_answers': [correct],
+                    'points': 1.0,
+                    'is_required': True,
+                    'order_index': order_index,
+                    'config': {},
+                })
+                exam_questions[exam_id].append((question_id, correct))
+
+    for model, rows in ((Course, courses), (Lesson, lessons), (Quiz, quizzes), (Exam, exams), (ExamQuestion, questions)):
+        _insert(model, rows)
+
+    return {
+        'roots': roots,
+        'root_names': {course['id']: course['name'] for course in courses if course['parent_id'] is None},
+        'lessons_by_root': lessons_by_root,
+        'exams': [(exam['id'], exam['course_id']) for exam in exams],
+        'exam_root': exam_root,
+        'exam_questions': exam_questions,
+        'counts': {'courses': len(courses), 'lessons': len(lessons), 'quizzes': len(quizzes),
+                   'exams': len(exams), 'exam_questions': len(questions)},
+    }
+
+
+def _build_users(scale: dict, rng: random.Random, ids: _Ids, catalogue: dict, now: datetime) -> dict:
+    password = bcrypt.generate_password_hash(BENCH_PASSWORD).decode('utf-8')
+    admin_id = ids(User)
+    users = [{
+        'id': admin_id, 'username': 'bench_admin', 'password': password, 'full_name': 'Benchmark Admin',
+        'email': 'bench_admin@example.com', 'role': 'admin', 'created_at': now - timedelta(days=900),
+        'accepted_terms': True,
+    }]
+    grants = {}
+    for number in range(1, scale['users'] + 1):
+        user_id = ids(User)
+        users.append({
+            'id': user_id,
+            'username': f"student{number:05d}",
+            'password': password,
+            'full_name': f"Student {number}",
+            'email': f"student{number:05d}@example.com",
+            'role': 'paid' if rng.random() < 0.7 else 'user',
+            'created_at': now - timedelta(days=rng.randint(1, 720)),
+            'accepted_terms': True,
+        })
+        # The first student is the benchmark subject and owns every course
+        if number == 1:
+            grants[user_id] = list(catalogue['roots'])
+        else:
+            grants[user_id] = rng.sample(catalogue['roots'], k=min(len(catalogue['roots']), rng.randint(1, 3)))
+    _insert(User, users)
+    return {'admin_id': admin_id, 'student_ids': [row['id'] for row in users[1:]], 'grants': grants}
+
+
+def _enrollment_rows(people: dict, catalogue: dict):
+    names = [name for name in DEFAULT_ENROLLMENTS if name in catalogue['root_names'].values()]
+    for user_id in people['student_ids']:
+        for name in names:
+            yield {'user_id': user_id, 'course_name': name, 'name_key': name.lower()}
+
+
+def _access_rows(people: dict, rng: random.Random, now: datetime):
+    for user_id, roots in people['grants'].items():
+        for root_id in roots:
+            yield {
+                'user_id': user_id, 'course_id': root_id, 'granted_at': now - timedelta(days=rng.randint(1, 365)),
+                'access_type': rng.choice(('purchased', 'subscription', 'admin_grant')), 'is_locked': False,
+                'progress': 0.0,
+            }
+
+
+def _progress_rows(scale: dict, people: dict, rng: random.Random):
+    for user_id, roots in people['grants'].items():
+        for root_id in roots:
+            yield {
+                'user_id': user_id, 'course_id': root_id,
+                'progress': rng.randint(1, scale['lessons_per_course'] + 1), 'is_finished': rng.random() < 0.1,
+            }
+
+
+def _agreement_rows(people: dict, rng: random.Random, now: datetime):
+    for user_id, roots in people['grants'].items():
+        for root_id in roots:
+            yield {'user_id': user_id, 'course_id': root_id, 'accepted_at': now - timedelta(days=rng.randint(1, 365))}
+
+
+def _quiz_details(rng: random.Random, total: int) -> tuple[int, str]:
+    details = []
+    for number in range(total):
+        correct = rng.choice(OPTION_LETTERS[:3])
+        selected = correct if rng.random() < 0.75 else rng.choice(OPTION_LETTERS[:3])
+        details.append({'question': f"Question {number + 1}", 'correct': correct,
+                        'selected': selected, 'is_correct': selected == correct})
+    return sum(1 for item in details if item['is_correct']), json.dumps(details)
+
+
+def _quiz_attempt_rows(scale: dict, people: dict, catalogue: dict, rng: random.Random, now: datetime):
+    total = scale['quizzes_per_lesson']
+    for user_id, roots in people['grants'].items():
+        available = [lesson for root_id in roots for lesson in catalogue['lessons_by_root'][root_id]]
+        for lesson_id, _course_id, _week in rng.sample(available, k=min(len(available), scale['quiz_attempts_per_user'])):
+            correct, detail_json = _quiz_details(rng, total)
+            yield {
+                'user_id': user_id, 'lesson_id': lesson_id, 'attempt_count': rng.randint(1, 4),
+                'last_score': correct, 'best_score': max(correct, rng.randint(0, total)),
+                'total_questions': total, 'correct_count': correct, 'wrong_count': total - correct,
+                'passed': correct >= max(1, round(total * 2 / 3)), 'detail_json': detail_json,
+                'last_attempt_at': now - timedelta(minutes=rng.randint(1, 260000)),
+            }
+
+
+def _retake_rows(scale: dict, people: dict, catalogue: dict, rng: random.Random, now: datetime):
+    total = scale['quizzes_per_lesson']
+    for user_id, roots in people['grants'].items():
+        available = [lesson for root_id in roots for lesson in catalogue['lessons_by_root'][root_id]]
+        for number in range(scale['retakes_per_user']):
+            lesson_id, course_id, _week = rng.choice(available)
+            correct, answers_json = _quiz_details(rng, total)
+            wrong = [item for item in json.loads(answers_json) if not item['is_correct']]
+            yield {
+                'user_id': user_id, 'course_id': course_id, 'lesson_id': lesson_id, 'attempt_number': number + 1,
+                'score': correct, 'total_questions': total, 'is_randomized': rng.random() < 0.5,
+                'attempt_type': 'lesson_list', 'is_complete': True, 'current_index': total,
+                'answers_json': answers_json, 'wrong_questions_json': json.dumps(wrong),
+                'created_at': now - timedelta(minutes=rng.randint(1, 260000)),
+            }
+
+
+def _exam_rows(scale: dict, people: dict, catalogue: dict, rng: random.Random, ids: _Ids, now: datetime):
+    """Yield (attempt, answers) pairs; attempt numbers count up per (user, exam)."""
+    exams_by_root = {}
+    for exam_id, course_id in catalogue['exams']:
+        exams_by_root.setdefault(catalogue['exam_root'][exam_id], []).append((exam_id, course_id))
+
+    for user_id, roots in people['grants'].items():
+        available = [exam for root_id in roots for exam in exams_by_root.get(root_id, [])]
+        if not available:
+            continue
+        attempt_numbers = {}
+        for _ in range(scale['exam_attempts_per_user']):
+            exam_id, course_id = rng.choice(available)
+            attempt_numbers[exam_id] = attempt_numbers.get(exam_id, 0) + 1
+            attempt_id = ids(ExamAttempt)
+            skill = rng.random()
+            answers = []
+            score = 0.0
+            for question_id, correct in catalogue['exam_questions'][exam_id]:
+                selected = correct if rng.random() < 0.35 + skill * 0.6 else rng.choice(OPTION_LETTERS)
+                is_correct = selected == correct
+                score += 1.0 if is_correct else 0.0
+                answers.append({
+                    'attempt_id': attempt_id, 'question_id': question_id, 'response_data': {'selected': selected},
+                    'is_correct': is_correct, 'points_awarded': 1.0 if is_correct else 0.0,
+                })
+            max_score = float(len(answers))
+            duration = rng.randint(300, 2700)
+            start_time = now - timedelta(minutes=rng.randint(60, 260000))
+            yield {
+                'id': attempt_id, 'user_id': user_id, 'exam_id': exam_id, 'course_id': course_id,
+                'start_time': start_time, 'end_time': start_time + timedelta(seconds=duration),
+                'status': 'graded', 'score': score, 'max_score': max_score, 'duration_seconds': duration,
+                'attempt_number': attempt_numbers[exam_id], 'autosave_payload': None,
+                'passed': max_score > 0 and score / max_score * 100 >= 70.0,
+            }, answers
+
+
+def seed_dataset(scale_name: str = 'small', seed: int = 20261017, log=print) -> dict:
+    """
+    Fill an empty database with the named scale. Returns a manifest: row
+    counts plus the ids the route benchmarks need (admin, subject student,
+    a course and an exam the subject can sit).
+    """
+    scale = SCALES[scale_name]
+    rng = random.Random(seed)
+    ids = _Ids()
+    now = datetime.now(timezone.utc).replace(tzinfo=None)
+
+    with app.app_context():
+        if db.session.query(User.id).first() is not None:
+            raise RuntimeError('seed_dataset() needs an empty database')
+
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(text('PRAGMA synchronous=OFF'))
+
+        catalogue = _build_catalogue(scale, rng, ids)
+        log(f"  catalogue: {catalogue['counts']}")
+        people = _build_users(scale, rng, ids, catalogue, now)
+        counts = dict(catalogue['counts'], users=len(people['student_ids']) + 1)
+
+        counts['course_enrollments'] = _insert(CourseEnrollment, _enrollment_rows(people, catalogue))
+        counts['course_access'] = _insert(CourseAccess, _access_rows(people, rng, now))
+        counts['course_progress'] = _insert(UserCourseProgress, _progress_rows(scale, people, rng))
+        counts['course_agreements'] = _insert(CourseAgreement, _agreement_rows(people, rng, now))
+        db.session.commit()
+        log(f"  users and access: {counts['users']} users")
+
+        counts['quiz_attempts'] = _insert(QuizAttempt, _quiz_attempt_rows(scale, people, catalogue, rng, now))
+        counts['quiz_retake_attempts'] = _insert(QuizRetakeAttempt, _retake_rows(scale, people, catalogue, rng, now))
+        db.session.commit()
+        log(f"  quiz history: {counts['quiz_attempts']} attempts, {counts['quiz_retake_attempts']} retakes")
+
+        counts['exam_attempts'] = counts['exam_answers'] = 0
+        attempts, answers = [], []
+        for attempt, attempt_answers in _exam_rows(scale, people, catalogue, rng, ids, now):
+            attempts.append(attempt)
+            answers.extend(attempt_answers)
+            if len(answers) >= BATCH_SIZE * 4:
+                counts['exam_attempts'] += _insert(ExamAttempt, attempts)
+                counts['exam_answers'] += _insert(ExamAnswer, answers)
+                attempts, answers = [], []
+        counts['exam_attempts'] += _insert(ExamAttempt, attempts)
+        counts['exam_answers'] += _insert(ExamAnswer, answers)
+        db.session.commit()
+        log(f"  exams: {counts['exam_attempts']} attempts, {counts['exam_answers']} answers")
+
+        rebuild_course_paths()
+        rebuild_course_counters()
+
+        subject_id = people['student_ids'][0]
+        subject_root = catalogue['roots'][0]
+        exam_id, exam_course_id = next(
+            (exam_id, course_id) for exam_id, course_id in catalogue['exams']
+            if catalogue['exam_root'][exam_id] == subject_root
+        )
+        busiest_exam = db.session.query(ExamAttempt.exam_id).group_by(ExamAttempt.exam_id).order_by(
+            db.func.count(ExamAttempt.id).desc()
+        ).limit(1).scalar()
+
+    return {
+        'scale': scale_name,
+        'seed': seed,
+        'counts': counts,
+        'admin_id': people['admin_id'],
+        'subject_id': subject_id,
+        'course': {'id': subject_root, 'name': catalogue['root_names'][subject_root], 'year': 1},
+        'exam': {'id': exam_id, 'course_id': exam_course_id, 'question_ids': [
+            question_id for question_id, _ in catalogue['exam_questions'][exam_id]
+        ]},
+        'results_exam_id': busiest_exam or exam_id,
+        'last_attempt_id': counts['exam_attempts'],
+    }
@@ -0,0 +1,367 @@
+"""
+Exam-day load scenario: N students start, autosave and submit the same exam at once.
+
+Usage:
+    python -m benchmarks.exam_day --students 200 --workers 4
+    python -m benchmarks.exam_day --database-url postgresql://localhost/albaqi_bench --students 400
+    python -m benchmarks.exam_day --url http://127.0.0.1:5005 --server-log /var/log/albaqi/error.log
+
+Without --url a local gunicorn is started against the benchmark database
+(see benchmarks/run.py). Every student logs in first; the storm starts
+together once all are in. The report covers throughput, per-step tail
+latency, lock/busy errors from the server log and an integrity check of
+the attempts written: lost or unsubmitted attempts, missing answers and
+attempts created twice. Exits 1 when the integrity check fails.
+"""
+import argparse
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+from sqlalchemy.engine import make_url
+
+from benchmarks.run import BENCH_DIR, open_dataset, percentile
+
+STEPS = ('start', 'autosave', 'submit')
+# Server log lines that mean the database pushed back under contention
+SERVER_ERROR_PATTERNS = {
+    'sqlite_locked': re.compile(r'database is locked', re.I),
+    'sqlite_busy': re.compile(r'database is busy|SQLITE_BUSY', re.I),
+    'pg_deadlock': re.compile(r'deadlock detected', re.I),
+    'pg_serialization': re.compile(r'could not serialize access', re.I),
+    'pool_timeout': re.compile(r'QueuePool limit of size', re.I),
+    'worker_timeout': re.compile(r'WORKER TIMEOUT', re.I),
+    'internal_error': re.compile(r'Internal Server Error:'),
+}
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--students', type=int, default=100, help='Concurrent students (default 100)')
+    parser.add_argument('--autosaves', type=int, default=5, help='Autosaves per student before submitting')
+    parser.add_argument('--autosave-interval', type=float, default=1.0, help='Mean seconds between autosaves')
+    parser.add_argument('--ramp', type=float, default=0.0, help='Spread exam starts over this many seconds')
+    parser.add_argument('--double-start', action='store_true', help='Send two concurrent start requests per student')
+    parser.add_argument('--timeout', type=float, default=60.0, help='Client request timeout in seconds')
+    parser.add_argument('--scale', default='small', help='Benchmark dataset scale (default small)')
+    parser.add_argument('--db', help='SQLite file for the dataset (default: <tmp>/albaqi-bench-<scale>.db)')
+    parser.add_argument('--database-url', help='Use this (empty or previously seeded) database instead of SQLite')
+    parser.add_argument('--reseed', action='store_true', help='Rebuild the dataset first')
+    parser.add_argument('--workers', type=int, default=4, help='gunicorn workers to start (default 4, as in the Procfile)')
+    parser.add_argument('--url', help='Target an already running server instead of starting gunicorn')
+    parser.add_argument('--server-log', help='Error log of the server given with --url, scanned for lock errors')
+    parser.add_argument('--output', help='Also write the report as JSON here')
+    return parser.parse_args()
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_gunicorn(database_url: str, workers: int, log_path: str) -> tuple[subprocess.Popen, str]:
+    port = _free_port()
+    env = dict(os.environ, DATABASE_URL=database_url,
+               # Keep the harness from clearing a real server's metrics directory
+               PROMETHEUS_MULTIPROC_DIR=tempfile.mkdtemp(prefix='albaqi-bench-metrics-'))
+    log = open(log_path, 'w')
+    process = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', 'website:app', '--workers', str(workers),
+         '--bind', f"127.0.0.1:{port}", '--timeout', '120', '--error-logfile', '-'],
+        cwd=os.path.dirname(BENCH_DIR), env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"gunicorn exited early; see {log_path}")
+        try:
+            requests.get(f"{base_url}/login", timeout=10)
+            return process, base_url
+        except requests.RequestException:
+            time.sleep(0.25)
+    process.terminate()
+    raise RuntimeError(f"gunicorn did not come up within 60s; see {log_path}")
+
+
+class Student:
+    def __init__(self, user_id: int, username: str):
+        self.user_id = user_id
+        self.username = username
+        self.session = requests.Session()
+        self.attempt_ids = set()
+        self.started_ok = False
+        self.submitted_ok = False
+        self.submitted_attempt_id = None
+
+
+class ExamDay:
+    """Runs the storm and collects (step, latency, outcome) samples from every student thread."""
+
+    def __init__(self, base_url: str, manifest: dict, password: str, args):
+        exam = manifest['exam']
+        self.password = password
+        self.base_url = base_url
+        self.exam_url = f"{base_url}/courses/{exam['course_id']}/exam/{exam['id']}"
+        self.question_ids = exam['question_ids']
+        self.args = args
+        self.samples = []
+        self.lock = threading.Lock()
+
+    def _call(self, student: Student, step: str, session=None, **kwargs):
+        started = time.perf_counter()
+        try:
+            response = (session or student.session).post(
+                f"{self.exam_url}/{step}", timeout=self.args.timeout, **kwargs
+            )
+            outcome = response.status_code
+        except requests.RequestException as exc:
+            response = None
+            outcome = type(exc).__name__
+        elapsed = (time.perf_counter() - started) * 1000
+        with self.lock:
+            self.samples.append((step, elapsed, outcome))
+        return response if response is not None and response.status_code == 200 else None
+
+    def login(self, student: Student) -> bool:
+        response = student.session.post(
+            f"{self.base_url}/login",
+            data={'username': student.username, 'password': self.password},
+            allow_redirects=False, timeout=self.args.timeout
+        )
+        return response.status_code == 302 and 'session' in student.session.cookies
+
+    def _start(self, student: Student):
+        if not self.args.double_start:
+            return self._call(student, 'start', json={})
+
+        # Two tabs racing: both should get the same attempt back
+        twin = requests.Session()
+        twin.cookies.update(student.session.cookies)
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            responses = list(pool.map(lambda session: self._call(student, 'start', session=session, json={}),
+                                      (student.session, twin)))
+        for response in responses:
+            if response is not None:
+                student.attempt_ids.add(response.json()['attempt_id'])
+        return next((response for response in responses if response is not None), None)
+
+    def sit_exam(self, student: Student, barrier: threading.Barrier) -> None:
+        rng = random.Random(student.user_id)
+        barrier.wait()
+        if self.args.ramp:
+            time.sleep(rng.uniform(0, self.args.ramp))
+
+        started = self._start(student)
+        if started is None:
+            return
+        attempt_id = started.json()['attempt_id']
+        student.attempt_ids.add(attempt_id)
+        student.started_ok = True
+
+        answers = {str(question_id): {'selected': rng.choice('ABCD')} for question_id in self.question_ids}
+        for _ in range(self.args.autosaves):
+            time.sleep(rng.uniform(0.5, 1.5) * self.args.autosave_interval)
+            self._call(student, 'autosave', json={'attempt_id': attempt_id, 'responses': answers})
+
+        submitted = self._call(student, 'submit', json={
+            'attempt_id': attempt_id,
+            'responses': [{'question_id': int(question_id), 'response': response}
+                          for question_id, response in answers.items()]
+        })
+        if submitted is not None:
+            student.submitted_ok = True
+            student.submitted_attempt_id = submitted.json()['attempt']['attempt_id']
+
+    def run(self, students: list[Student]) -> float:
+        barrier = threading.Barrier(len(students))
+        threads = [threading.Thread(target=self.sit_exam, args=(student, barrier)) for student in students]
+        for thread in threads:
+            thread.start()
+        started = time.perf_counter()
+        for thread in threads:
+            thread.join()
+        return time.perf_counter() - started
+
+    def step_report(self, wall_seconds: float) -> dict:
+        report = {
+            'requests': len(self.samples),
+            'throughput_rps': round(len(self.samples) / wall_seconds, 1) if wall_seconds else None,
+            'steps': {},
+        }
+        for step in STEPS:
+            rows = [(elapsed, outcome) for name, elapsed, outcome in self.samples if name == step]
+            if not rows:
+                continue
+            timings = [elapsed for elapsed, _ in rows]
+            failures = {}
+            for _, outcome in rows:
+                if outcome != 200:
+                    failures[str(outcome)] = failures.get(str(outcome), 0) + 1
+            report['steps'][step] = {
+                'requests': len(rows),
+                'ok': len(rows) - sum(failures.values()),
+                'failures': failures,
+                'p50_ms': round(percentile(timings, 0.50), 1),
+                'p95_ms': round(percentile(timings, 0.95), 1),
+                'p99_ms': round(percentile(timings, 0.99), 1),
+                'max_ms': round(max(timings), 1),
+            }
+        return report
+
+
+def scan_server_log(path: str | None, offset: int = 0) -> dict:
+    if not path or not os.path.exists(path):
+        return {}
+    counts = {}
+    with open(path, errors='replace') as handle:
+        handle.seek(offset)
+        for line in handle:
+            for name, pattern in SERVER_ERROR_PATTERNS.items():
+                if pattern.search(line):
+                    counts[name] = counts.get(name, 0) + 1
+    return counts
+
+
+def check_integrity(website, manifest: dict, students: list[Student]) -> dict:
+    """Compare what each student was told with the attempts actually stored."""
+    ExamAttempt, ExamAnswer = website.ExamAttempt, website.ExamAnswer
+    exam_id = manifest['exam']['id']
+    expected_answers = len(manifest['exam']['question_ids'])
+    problems = {'lost_attempts': [], 'unsubmitted': [], 'missing_answers': [], 'double_created': [], 'stuck_in_progress': []}
+
+    with website.app.app_context():
+        rows = website.db.session.query(ExamAttempt.id, ExamAttempt.user_id, ExamAttempt.status).filter(
+            ExamAttempt.exam_id == exam_id,
+            ExamAttempt.id > manifest['last_attempt_id']
+        ).all()
+        answer_counts = dict(website.db.session.query(ExamAnswer.attempt_id, website.func.count(ExamAnswer.id)).filter(
+            ExamAnswer.attempt_id.in_([row.id for row in rows])
+        ).group_by(ExamAnswer.attempt_id).all()) if rows else {}
+
+    attempts_by_user = {}
+    for row in rows:
+        attempts_by_user.setdefault(row.user_id, []).append(row)
+
+    for student in students:
+        stored = attempts_by_user.get(student.user_id, [])
+        stored_ids = {row.id for row in stored}
+        if len(stored) > 1 or len(student.attempt_ids) > 1:
+            problems['double_created'].append({'user_id': student.user_id, 'attempt_ids': sorted(stored_ids | student.attempt_ids)})
+        if student.started_ok and not (student.attempt_ids & stored_ids):
+            problems['lost_attempts'].append({'user_id': student.user_id, 'attempt_ids': sorted(student.attempt_ids)})
+        for row in stored:
+            if row.status == 'in-progress':
+                # A submit that returned 200 must have finished the attempt it named
+                key = 'unsubmitted' if row.id == student.submitted_attempt_id else 'stuck_in_progress'
+                problems[key].append({'user_id': student.user_id, 'attempt_id': row.id})
+        if student.submitted_ok and answer_counts.get(student.submitted_attempt_id, 0) != expected_answers:
+            problems['missing_answers'].append({
+                'user_id': student.user_id, 'attempt_id': student.submitted_attempt_id,
+                'answers': answer_counts.get(student.submitted_attempt_id, 0), 'expected': expected_answers
+            })
+
+    return {
+        'attempts_stored': len(rows),
+        'students_started': sum(1 for student in students if student.started_ok),
+        'students_submitted': sum(1 for student in students if student.submitted_ok),
+        'problems': {name: entries for name, entries in problems.items() if entries},
+    }
+
+
+def print_report(report: dict) -> None:
+    print(f"\n{report['students']} students, {report['requests']} exam requests in {report['wall_seconds']}s "
+          f"({report['throughput_rps']} req/s)")
+    print(f"{'step':<10}{'ok':>8}{'failed':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'max ms':>10}")
+    for step, row in report['steps'].items():
+        print(f"{step:<10}{row['ok']:>8}{sum(row['failures'].values()):>8}"
+              f"{row['p50_ms']:>10}{row['p95_ms']:>10}{row['p99_ms']:>10}{row['max_ms']:>10}")
+        for outcome, count in row['failures'].items():
+            print(f"{'':<10}  {count} x {outcome}")
+
+    if report['server_errors']:
+        print('\nServer log:')
+        for name, count in report['server_errors'].items():
+            print(f"  {name}: {count}")
+
+    integrity = report['integrity']
+    print(f"\nAttempts stored: {integrity['attempts_stored']} "
+          f"(started {integrity['students_started']}, submitted {integrity['students_submitted']})")
+    if integrity['problems']:
+        for name, entries in integrity['problems'].items():
+            print(f"  {name}: {len(entries)} e.g. {entries[0]}")
+    else:
+        print('  No lost, unsubmitted or duplicate attempts.')
+
+
+def main() -> int:
+    args = parse_args()
+    website, manifest = open_dataset(args.scale, db_path=args.db, database_url=args.database_url, reseed=args.reseed)
+    database_url = os.environ['DATABASE_URL']
+    from benchmarks.dataset import BENCH_PASSWORD
+
+    with website.app.app_context():
+        students = [
+            Student(user_id, username) for user_id, username in website.db.session.query(
+                website.User.id, website.User.username
+            ).filter(website.User.role != 'admin').order_by(website.User.id).limit(args.students)
+        ]
+    if len(students) < args.students:
+        print(f"Only {len(students)} students in the {args.scale} dataset; use a larger --scale for more.")
+
+    process = None
+    log_path = args.server_log
+    log_offset = 0
+    if args.url:
+        base_url = args.url.rstrip('/')
+        if log_path and os.path.exists(log_path):
+            log_offset = os.path.getsize(log_path)
+    else:
+        log_path = os.path.join(tempfile.gettempdir(), 'albaqi-exam-day-gunicorn.log')
+        print(f"Starting gunicorn with {args.workers} workers (log: {log_path})")
+        process, base_url = start_gunicorn(database_url, args.workers, log_path)
+
+    try:
+        day = ExamDay(base_url, manifest, BENCH_PASSWORD, args)
+        with ThreadPoolExecutor(max_workers=16) as pool:
+            logged_in = list(pool.map(day.login, students))
+        students = [student for student, ok in zip(students, logged_in) if ok]
+        print(f"{len(students)} students logged in; starting the exam")
+
+        wall_seconds = day.run(students)
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=30)
+
+    report = {
+        'students': len(students),
+        'database': make_url(database_url).render_as_string(hide_password=True),
+        'workers': None if args.url else args.workers,
+        'wall_seconds': round(wall_seconds, 2),
+        **day.step_report(wall_seconds),
+        'server_errors': scan_server_log(log_path, log_offset),
+        'integrity': check_integrity(website, manifest, students),
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, 'w') as handle:
+            json.dump(report, handle, indent=2)
+            handle.write('\n')
+        print(f"\nWrote {args.output}")
+    return 1 if report['integrity']['problems'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,285 @@
+"""
+Drive the hot routes against a synthetic dataset and record latency and query counts.
+
+Usage:
+    python -m benchmarks.run                                  # small scale -> benchmarks/baseline_small.json
+    python -m benchmarks.run --scale full --iterations 50
+    python -m benchmarks.run --compare benchmarks/baseline_small.json --output /tmp/bench.json
+
+The seeded SQLite file is kept next to a manifest and reused by later runs
+of the same scale; pass --reseed to rebuild it. With --compare the run exits
+with status 1 when a route issues more queries than the baseline or its p99
+grows past the tolerance.
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+from sqlalchemy.engine import make_url
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+# Latency changes smaller than this are noise on a shared machine
+P99_NOISE_FLOOR_MS = 5.0
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scale', default='small', help='Dataset size: small, medium or full')
+    parser.add_argument('--db', help='SQLite file to seed/reuse (default: <tmp>/albaqi-bench-<scale>.db)')
+    parser.add_argument('--reseed', action='store_true', help='Rebuild the dataset even if the file exists')
+    parser.add_argument('--iterations', type=int, default=30, help='Measured requests per route')
+    parser.add_argument('--warmup', type=int, default=3, help='Unmeasured requests per route first')
+    parser.add_argument('--only', action='append', help='Run only these routes (repeatable)')
+    parser.add_argument('--output', help='Where to write results (default: benchmarks/baseline_<scale>.json)')
+    parser.add_argument('--compare', help='Baseline JSON to check this run against')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative p99 growth (default 0.25)')
+    return parser.parse_args()
+
+
+def percentile(values: list, share: float) -> float:
+    """Nearest-rank percentile; share in 0..1."""
+    ordered = sorted(values)
+    rank = max(1, min(len(ordered), int(round(share * len(ordered) + 0.5))))
+    return ordered[rank - 1]
+
+
+class RouteBench:
+    """Times test-client requests and counts the SQL statements each one runs."""
+
+    def __init__(self, app, engine):
+        self.app = app
+        self.queries = 0
+        self.recording = True
+        self.samples = {}
+
+        from sqlalchemy import event
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def _count(conn, cursor, statement, parameters, context, executemany):
+            self.queries += 1
+
+    def client(self, user_id: int, username: str, role: str):
+        client = self.app.test_client()
+        with client.session_transaction() as session:
+            session['user'] = username
+            session['user_id'] = user_id
+            session['role'] = role
+        return client
+
+    def request(self, client, name: str, method: str, url: str, expect: int = 200, **kwargs):
+        queries_before = self.queries
+        started = time.perf_counter()
+        response = client.open(url, method=method, **kwargs)
+        elapsed = time.perf_counter() - started
+        if response.status_code != expect:
+            raise RuntimeError(f"{name}: {method} {url} returned {response.status_code}, expected {expect}")
+        if self.recording:
+            self.samples.setdefault(name, []).append((elapsed * 1000, self.queries - queries_before))
+        return response
+
+    def summary(self) -> dict:
+        routes = {}
+        for name, samples in self.samples.items():
+            timings = [elapsed for elapsed, _ in samples]
+            queries = [count for _, count in samples]
+            routes[name] = {
+                'samples': len(samples),
+                'p50_ms': round(percentile(timings, 0.50), 2),
+                'p99_ms': round(percentile(timings, 0.99), 2),
+                'mean_ms': round(sum(timings) / len(timings), 2),
+                'max_ms': round(max(timings), 2),
+                'queries': max(queries),
+                'queries_min': min(queries),
+            }
+        return routes
+
+
+def build_scenarios(bench: RouteBench, manifest: dict, website) -> dict:
+    """Route name -> callable making one pass. Exam start/autosave/submit share one pass."""
+    student = bench.client(manifest['subject_id'], 'student00001', 'paid')
+    admin = bench.client(manifest['admin_id'], 'bench_admin', 'admin')
+    course = manifest['course']
+    exam = manifest['exam']
+    exam_base = f"/courses/{exam['course_id']}/exam/{exam['id']}"
+    results_exam_id = manifest['results_exam_id']
+    with bench.app.test_request_context():
+        # Year 1 has its own canonical URL; let the router pick it
+        course_url = website.url_for('course_page', course_name=course['name'], year=course['year'])
+
+    def exam_cycle():
+        started = bench.request(student, 'exam_start', 'POST', f"{exam_base}/start", json={})
+        attempt_id = started.get_json()['attempt_id']
+        responses = {str(question_id): {'selected': 'A'} for question_id in exam['question_ids']}
+        bench.request(student, 'exam_autosave', 'POST', f"{exam_base}/autosave",
+                      json={'attempt_id': attempt_id, 'responses': responses})
+        bench.request(student, 'exam_submit', 'POST', f"{exam_base}/submit", json={
+            'attempt_id': attempt_id,
+            'responses': [{'question_id': question_id, 'response': {'selected': 'B'}}
+                          for question_id in exam['question_ids']]
+        })
+
+    def course_page_revalidate():
+        # A revisit from a browser that already holds the page
+        etag = student.get(course_url).headers['ETag']
+        bench.request(student, 'course_page_revalidate', 'GET', course_url, expect=304,
+                      headers={'If-None-Match': etag})
+
+    def analytics_cold():
+        with bench.app.app_context():
+            website.invalidate_exam_analytics(results_exam_id)
+            website.db.session.commit()
+        bench.request(admin, 'admin_exam_results_analytics_cold', 'GET',
+                      f"/admin/exams/results/{results_exam_id}/analytics")
+
+    return {
+        'courses_dashboard': lambda: bench.request(student, 'courses_dashboard', 'GET', '/courses'),
+        'course_page': lambda: bench.request(student, 'course_page', 'GET', course_url),
+        'course_page_revalidate': course_page_revalidate,
+        'exam': exam_cycle,
+        'stats': lambda: bench.request(student, 'stats', 'GET', '/stats'),
+        'admin_user_tracking': lambda: bench.request(
+            admin, 'admin_user_tracking', 'GET', f"/admin/users/{manifest['subject_id']}/tracking"),
+        'admin_exam_results': lambda: bench.request(
+            admin, 'admin_exam_results', 'GET', f"/admin/exams/results/{results_exam_id}"),
+        'admin_exam_results_attempts': lambda: bench.request(
+            admin, 'admin_exam_results_attempts', 'GET', f"/admin/exams/results/{results_exam_id}/attempts?limit=50"),
+        'admin_exam_results_analytics_cold': analytics_cold,
+    }
+
+
+def open_dataset(scale: str, db_path: str | None = None, database_url: str | None = None, reseed: bool = False):
+    """
+    Point website.py at the benchmark database, seeding it on first use, and
+    return (website module, manifest). SQLite by default; database_url may
+    name an empty local Postgres database instead.
+    """
+    if database_url is None:
+        db_path = os.path.abspath(db_path or os.path.join(tempfile.gettempdir(), f"albaqi-bench-{scale}.db"))
+        database_url = f"sqlite:///{db_path}"
+        manifest_path = db_path + '.manifest.json'
+        if reseed or not os.path.exists(manifest_path):
+            for path in (db_path, manifest_path):
+                if os.path.exists(path):
+                    os.remove(path)
+    else:
+        url_key = hashlib.sha1(database_url.encode()).hexdigest()[:8]
+        manifest_path = os.path.join(tempfile.gettempdir(), f"albaqi-bench-{scale}-{url_key}.manifest.json")
+        if reseed and os.path.exists(manifest_path):
+            os.remove(manifest_path)
+
+    # website.py reads its configuration at import time
+    os.environ['DATABASE_URL'] = database_url
+    os.environ.setdefault('SECRET_KEY', 'benchmark')
+    sys.path.insert(0, os.path.dirname(BENCH_DIR))
+
+    import website
+    from benchmarks.dataset import SCALES, seed_dataset
+
+    if scale not in SCALES:
+        raise SystemExit(f"Unknown scale {scale!r}; choose from {', '.join(SCALES)}")
+
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as handle:
+            manifest = json.load(handle)
+        print(f"Reusing {scale} dataset ({manifest_path})")
+    else:
+        print(f"Seeding {scale} dataset into {make_url(database_url).render_as_string(hide_password=True)} ...")
+        started = time.perf_counter()
+        with website.app.app_context():
+            website.db.create_all()
+        manifest = seed_dataset(scale)
+        with open(manifest_path, 'w') as handle:
+            json.dump(manifest, handle, indent=2)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    reset_run_state(website, manifest)
+    return website, manifest
+
+
+def reset_run_state(website, manifest: dict) -> None:
+    """Drop exam attempts left by earlier runs so a reused dataset stays the seeded size."""
+    ExamAttempt, ExamAnswer = website.ExamAttempt, website.ExamAnswer
+    with website.app.app_context():
+        extra_ids = website.db.select(ExamAttempt.id).where(ExamAttempt.id > manifest['last_attempt_id'])
+        website.db.session.execute(website.db.delete(ExamAnswer).where(ExamAnswer.attempt_id.in_(extra_ids)))
+        website.db.session.execute(website.db.delete(ExamAttempt).where(ExamAttempt.id > manifest['last_attempt_id']))
+        website.db.session.commit()
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for name, before in baseline.get('routes', {}).items():
+        after = results['routes'].get(name)
+        if after is None:
+            continue
+        if after['queries'] > before['queries']:
+            regressions.append(f"{name}: {after['queries']} queries (baseline {before['queries']})")
+        allowed = max(before['p99_ms'] * (1 + tolerance), before['p99_ms'] + P99_NOISE_FLOOR_MS)
+        if after['p99_ms'] > allowed:
+            regressions.append(f"{name}: p99 {after['p99_ms']} ms (baseline {before['p99_ms']} ms)")
+    return regressions
+
+
+def main() -> int:
+    args = parse_args()
+    website, manifest = open_dataset(args.scale, db_path=args.db, reseed=args.reseed)
+
+    website.app.config['TESTING'] = True
+    with website.app.app_context():
+        bench = RouteBench(website.app, website.db.engine)
+    scenarios = build_scenarios(bench, manifest, website)
+    selected = args.only or list(scenarios)
+
+    for name in selected:
+        run_once = scenarios[name]
+        bench.recording = False
+        for _ in range(args.warmup):
+            run_once()
+        bench.recording = True
+        for _ in range(args.iterations):
+            run_once()
+
+    results = {
+        'generated_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'scale': manifest['scale'],
+        'dataset': manifest['counts'],
+        'iterations': args.iterations,
+        'environment': {
+            'python': platform.python_version(),
+            'sqlite': sqlite3.sqlite_version,
+            'machine': platform.machine(),
+        },
+        'routes': bench.summary(),
+    }
+
+    print(f"\n{'route':<36}{'p50 ms':>10}{'p99 ms':>10}{'queries':>10}")
+    for name, row in results['routes'].items():
+        print(f"{name:<36}{row['p50_ms']:>10}{row['p99_ms']:>10}{row['queries']:>10}")
+
+    output = args.output or os.path.join(BENCH_DIR, f"baseline_{manifest['scale']}.json")
+    with open(output, 'w') as handle:
+        json.dump(results, handle, indent=2)
+        handle.write('\n')
+    print(f"\nWrote {output}")
+
+    if args.compare:
+        with open(args.compare) as handle:
+            regressions = compare(results, json.load(handle), args.tolerance)
+        if regressions:
+            print('\nRegressions against baseline:')
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print('\nNo regressions against baseline.')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
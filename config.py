@@ -9,6 +9,16 @@ from dotenv import load_dotenv
 load_dotenv()
 
 
+def _parse_query_budgets(value: str) -> dict:
+    """Parse "endpoint=limit,endpoint=limit" into {endpoint: limit}."""
+    budgets = {}
+    for item in (value or '').split(','):
+        endpoint, _, limit = item.partition('=')
+        if endpoint.strip() and limit.strip().isdigit():
+            budgets[endpoint.strip()] = int(limit)
+    return budgets
+
+
 class Config:
     """Base configuration."""
 
@@ -19,8 +29,55 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get('DATABASE_URL') or 'sqlite:///site.db'
     SQLALCHEMY_TRACK_MODIFICATIONS = False
 
+    # Request instrumentation: SQL counts/time, Server-Timing header, query budgets
+    SQL_INSTRUMENTATION = os.environ.get('SQL_INSTRUMENTATION', 'False').lower() == 'true'
+    SQL_QUERY_BUDGET = int(os.environ.get('SQL_QUERY_BUDGET', 30))  # 0 disables the warning
+    # Per-endpoint overrides, e.g. "admin_user_tracking=40,courses_dashboard=10"
+    SQL_QUERY_BUDGETS = _parse_query_budgets(os.environ.get('SQL_QUERY_BUDGETS', ''))
+
+    # Prometheus scrape token for /admin/metrics (admins can also view it while logged in)
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')
+
+    # Version files for the homepage fragment cache, shared by all workers (default: instance/fragment_cache)
+    FRAGMENT_CACHE_DIR = os.environ.get('FRAGMENT_CACHE_DIR')
+
+    # Static copies of /, /terms and /qa/public for nginx to serve to anonymous visitors (unset = off)
+    PRERENDER_DIR = os.environ.get('PRERENDER_DIR')
+
+    # Lesson video/slide delivery after the access check: empty streams from Flask,
+    # 'x-accel-redirect' hands the transfer to nginx, 'x-sendfile' to Apache/lighttpd
+    MEDIA_SENDFILE_MODE = os.environ.get('MEDIA_SENDFILE_MODE', '').lower()
+    # nginx `internal` location aliasing MEDIA_ROOT (x-accel-redirect only)
+    MEDIA_ACCEL_PREFIX = os.environ.get('MEDIA_ACCEL_PREFIX', '/protected-media/')
+    # Browser cache lifetime for lesson media; always private so shared caches skip it
+    MEDIA_MAX_AGE = int(os.environ.get('MEDIA_MAX_AGE', 3600))
+
+    # Signed lesson/Student Hub media URLs (/media/...): key and expiry window in seconds.
+    # URLs stay valid for one to two windows; a separate secret lets an edge verifier check them.
+    MEDIA_URL_SECRET = os.environ.get('MEDIA_URL_SECRET')
+    MEDIA_URL_WINDOW = int(os.environ.get('MEDIA_URL_WINDOW', 4 * 3600))
+
+    # Where lesson media and Student Hub files live: 'local' (MEDIA_ROOT) or 's3'
+    # (any S3-compatible service; set the endpoint for MinIO/R2). See media_storage.py.
+    MEDIA_STORAGE = os.environ.get('MEDIA_STORAGE', 'local').lower()
+    # Local media store and upload scratch space; must not be under static/ (default: instance/media)
+    MEDIA_ROOT = os.environ.get('MEDIA_ROOT')
+    MEDIA_S3_BUCKET = os.environ.get('MEDIA_S3_BUCKET')
+    MEDIA_S3_PREFIX = os.environ.get('MEDIA_S3_PREFIX', '')
+    MEDIA_S3_ENDPOINT_URL = os.environ.get('MEDIA_S3_ENDPOINT_URL')
+    MEDIA_S3_REGION = os.environ.get('MEDIA_S3_REGION')
+    MEDIA_S3_ACCESS_KEY_ID = os.environ.get('MEDIA_S3_ACCESS_KEY_ID')
+    MEDIA_S3_SECRET_ACCESS_KEY = os.environ.get('MEDIA_S3_SECRET_ACCESS_KEY')
+
     # File Upload
     STUDENT_HUB_MAX_FILE_SIZE = int(os.environ.get('STUDENT_HUB_MAX_FILE_SIZE', 50 * 1024 * 1024))
+    # Resumable lesson uploads (/admin/uploads): whole file, and one PUT chunk (keep under nginx client_max_body_size)
+    LESSON_UPLOAD_MAX_SIZE = int(os.environ.get('LESSON_UPLOAD_MAX_SIZE', 10 * 1024 * 1024 * 1024))
+    LESSON_UPLOAD_MAX_CHUNK_SIZE = int(os.environ.get('LESSON_UPLOAD_MAX_CHUNK_SIZE', 32 * 1024 * 1024))
+    # Threads per gunicorn worker that move finalized uploads into media storage
+    LESSON_UPLOAD_STORE_WORKERS = int(os.environ.get('LESSON_UPLOAD_STORE_WORKERS', 2))
+    # Processes per gunicorn worker that parse slides for quiz drafting (started on first use)
+    TEXT_EXTRACTION_WORKERS = int(os.environ.get('TEXT_EXTRACTION_WORKERS', 1))
 
     # Session Security
     SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'False').lower() == 'true'
@@ -0,0 +1,181 @@
+"""
+Exam statistics and item analysis.
+
+Works on plain rows loaded by website.py so the maths stays free of the ORM:
+per-question difficulty, a top/bottom group discrimination index, how often
+each option was picked, and the distribution of scores.
+"""
+from collections import Counter
+
+import numpy as np
+
+# Share of finished attempts in each of the top and bottom scoring groups
+DISCRIMINATION_GROUP_SHARE = 0.27
+SCORE_BUCKETS = np.linspace(0, 100, 11)
+CHOICE_QUESTION_TYPES = {'multiple_choice', 'mcq', 'radio', 'checkbox', 'multi_select'}
+
+
+def _optional_float(value):
+    return None if value is None or np.isnan(value) else float(value)
+
+
+def _optional_round(value, digits=2):
+    value = _optional_float(value)
+    return None if value is None else round(value, digits)
+
+
+def _column(values) -> np.ndarray:
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def _summary(finished: list) -> tuple[dict, np.ndarray]:
+    scores = _column(row[2] for row in finished)
+    max_scores = _column(row[3] for row in finished)
+    durations = _column(row[4] for row in finished)
+    passed_total = sum(1 for row in finished if row[5] is True)
+    attempt_count = len(finished)
+
+    def reduce(func, values):
+        values = values[~np.isnan(values)]
+        return func(values) if values.size else np.nan
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        percentages = np.where(max_scores > 0, scores / max_scores * 100, np.nan)
+
+    summary = {
+        'attempt_count': attempt_count,
+        'average_score': _optional_round(reduce(np.mean, scores)),
+        'highest_score': _optional_float(reduce(np.max, scores)),
+        'lowest_score': _optional_float(reduce(np.min, scores)),
+        'average_duration': _optional_round(reduce(np.mean, durations)),
+        'pass_rate': round((passed_total / attempt_count) * 100, 2) if attempt_count else None,
+        'passed_total': passed_total,
+        'most_missed': None
+    }
+    return summary, percentages
+
+
+def _score_distribution(percentages: np.ndarray) -> list[dict]:
+    scored = np.clip(percentages[~np.isnan(percentages)], 0, 100)
+    counts, edges = np.histogram(scored, bins=SCORE_BUCKETS)
+    return [
+        {'label': f"{int(edges[index])}–{int(edges[index + 1])}%", 'count': int(count)}
+        for index, count in enumerate(counts)
+    ]
+
+
+def _selected_options(response_data) -> list:
+    selected = response_data.get('selected') if isinstance(response_data, dict) else response_data
+    if selected is None or selected == '':
+        return []
+    if isinstance(selected, (list, tuple)):
+        return [str(item) for item in selected if item is not None]
+    return [str(selected)]
+
+
+def _option_breakdown(question: dict, responses: list) -> list[dict]:
+    counts = Counter()
+    for response_data in responses:
+        counts.update(_selected_options(response_data))
+
+    correct = {str(option) for option in (question.get('correct_answers') or [])}
+    ordered = [str(option) for option in (question.get('options') or [])]
+    ordered += sorted(option for option in counts if option not in ordered)
+    answered = len(responses)
+    return [
+        {
+            'option': option,
+            'count': counts[option],
+            'share': round(counts[option] / answered * 100, 2) if answered else None,
+            'is_correct': option in correct
+        }
+        for option in ordered
+    ]
+
+
+def compute_exam_analytics(attempt_rows, answer_rows, questions) -> dict:
+    """
+    attempt_rows: (attempt_id, status, score, max_score, duration_seconds, passed)
+    answer_rows:  (attempt_id, question_id, is_correct, response_data)
+    questions:    dicts with id, text, question_type, options, correct_answers, in display order
+
+    Summary figures and discrimination use finished attempts; per-question
+    counts cover every stored answer, as the marking table always has.
+    Difficulty is the share of graded answers marked correct.
+    """
+    finished = [row for row in attempt_rows if row[1] is not None and row[1] != 'in-progress']
+    summary, percentages = _summary(finished)
+
+    question_ids = [question['id'] for question in questions]
+    question_index = {question_id: index for index, question_id in enumerate(question_ids)}
+    attempt_index = {row[0]: index for index, row in enumerate(finished)}
+
+    rows = [row for row in answer_rows if row[1] in question_index]
+    q_idx = np.array([question_index[row[1]] for row in rows], dtype=int)
+    is_correct = np.array([row[2] is True for row in rows], dtype=bool)
+    is_graded = np.array([row[2] is not None for row in rows], dtype=bool)
+
+    size = len(question_ids)
+    totals = np.bincount(q_idx, minlength=size)
+    correct = np.bincount(q_idx, weights=is_correct, minlength=size).astype(int)
+    graded = np.bincount(q_idx, weights=is_graded, minlength=size).astype(int)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        difficulty = np.where(graded > 0, correct / graded, np.nan)
+
+    # attempts x questions matrix: 1 correct, 0 incorrect, nan unanswered or ungraded
+    matrix = np.full((len(finished), size), np.nan)
+    a_idx = np.array([attempt_index.get(row[0], -1) for row in rows], dtype=int)
+    scored = (a_idx >= 0) & is_graded
+    matrix[a_idx[scored], q_idx[scored]] = is_correct[scored]
+
+    discrimination = np.full(size, np.nan)
+    ranked = np.flatnonzero(~np.isnan(percentages))
+    if ranked.size >= 2:
+        ranked = ranked[np.argsort(percentages[ranked], kind='stable')]
+        group = max(1, int(round(ranked.size * DISCRIMINATION_GROUP_SHARE)))
+        bottom, top = matrix[ranked[:group]], matrix[ranked[-group:]]
+
+        def group_rate(block):
+            answered = (~np.isnan(block)).sum(axis=0)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                return np.where(answered > 0, np.nansum(block, axis=0) / answered, np.nan)
+
+        discrimination = group_rate(top) - group_rate(bottom)
+
+    responses_by_question = {}
+    for row in rows:
+        responses_by_question.setdefault(row[1], []).append(row[3])
+
+    question_analytics = []
+    for position, question in enumerate(questions):
+        total = int(totals[position])
+        is_choice = (question.get('question_type') or '').lower() in CHOICE_QUESTION_TYPES
+        question_analytics.append({
+            'question': {'id': question['id'], 'text': question.get('text')},
+            'total': total,
+            'correct': int(correct[position]),
+            'incorrect': total - int(correct[position]),
+            'difficulty': _optional_round(difficulty[position], 3),
+            'discrimination': _optional_round(discrimination[position], 3),
+            'options': _option_breakdown(question, responses_by_question.get(question['id'], [])) if is_choice else []
+        })
+
+    answered = np.flatnonzero(totals > 0)
+    if answered.size:
+        # Ties go to the lowest question id, matching the old per-row scan
+        answered = answered[np.argsort([question_ids[index] for index in answered], kind='stable')]
+        missed_ratio = (totals[answered] - correct[answered]) / totals[answered]
+        worst = answered[int(np.argmax(missed_ratio))]
+        summary['most_missed'] = {
+            'question_id': question_ids[worst],
+            'question_text': questions[worst].get('text'),
+            'missed': int(totals[worst] - correct[worst]),
+            'total': int(totals[worst]),
+            'ratio': float(missed_ratio.max())
+        }
+
+    return {
+        'analytics': summary,
+        'question_analytics': question_analytics,
+        'score_distribution': _score_distribution(percentages)
+    }
@@ -0,0 +1,26 @@
+"""
+Gunicorn settings, loaded automatically from the project root.
+
+Worker count, bind address and timeouts stay on the command line (Procfile);
+this file only gives the workers a shared Prometheus metrics directory so
+/admin/metrics reports all of them, not just the one that served the scrape.
+"""
+import os
+import shutil
+import tempfile
+
+metrics_dir = os.environ.setdefault(
+    'PROMETHEUS_MULTIPROC_DIR',
+    os.path.join(tempfile.gettempdir(), 'albaqi-metrics')
+)
+
+
+def on_starting(server):
+    # Samples left by a previous master would be added to the new totals
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+    multiprocess.mark_process_dead(worker.pid)
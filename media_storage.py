@@ -0,0 +1,226 @@
+"""
+Storage drivers for uploaded media.
+
+Keys are the values kept in Lesson.video_file / ppt_file and
+StudentHubFile.file_path, e.g. 'blobs/ab/cd/<sha256>.mp4'.
+
+    MEDIA_STORAGE=local   files under MEDIA_ROOT (the default, instance/media)
+    MEDIA_STORAGE=s3      objects in an S3-compatible bucket (AWS, MinIO, R2, ...)
+
+Both drivers stream: save() moves or uploads a finished local file, write()
+copies from a readable stream, open() returns a readable stream. Neither
+holds a whole file in memory. A driver that can hand out direct links
+(S3) returns a presigned URL from download_url(); the app redirects there
+instead of sending the bytes itself. LocalStorage returns None, and the app
+sends the file from local_path().
+"""
+import mimetypes
+import os
+import shutil
+from urllib.parse import quote
+
+from werkzeug.utils import safe_join
+
+COPY_CHUNK_SIZE = 1024 * 1024
+# S3 CopyObject refuses larger sources; touch() leaves such objects alone
+S3_MAX_COPY_SIZE = 5 * 1024 * 1024 * 1024
+
+
+def attachment_header(download_name: str) -> str:
+    """Content-Disposition for a download under download_name (RFC 6266, UTF-8 safe)."""
+    fallback = download_name.encode('ascii', 'ignore').decode().replace('"', '') or 'download'
+    return f"attachment; filename=\"{fallback}\"; filename*=UTF-8''{quote(download_name)}"
+
+
+class LocalStorage:
+    """Files under one directory (MEDIA_ROOT); keys are paths relative to it."""
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def local_path(self, key: str) -> str | None:
+        """Filesystem path for key, or None when the key would escape the root."""
+        return safe_join(self.root, key.replace(os.sep, '/'))
+
+    def _path(self, key: str) -> str:
+        path = self.local_path(key)
+        if path is None:
+            raise ValueError(f"Invalid storage key: {key!r}")
+        return path
+
+    def exists(self, key: str) -> bool:
+        path = self.local_path(key)
+        return path is not None and os.path.isfile(path)
+
+    def size(self, key: str) -> int:
+        return os.path.getsize(self._path(key))
+
+    def modified(self, key: str) -> float:
+        return os.path.getmtime(self._path(key))
+
+    def touch(self, key: str) -> None:
+        os.utime(self._path(key))
+
+    def save(self, key: str, source_path: str) -> None:
+        """Move a finished local file to key; a rename when both are on one filesystem."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        shutil.move(source_path, path)
+
+    def write(self, key: str, stream) -> None:
+        """Copy a readable binary stream to key, replacing it atomically."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, 'wb') as handle:
+                shutil.copyfileobj(stream, handle, COPY_CHUNK_SIZE)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def open(self, key: str):
+        return open(self._path(key), 'rb')
+
+    def delete(self, key: str) -> None:
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def list(self, prefix: str):
+        """Yield (key, modified timestamp) for every file under prefix."""
+        base = self._path(prefix)
+        for folder, _, files in os.walk(base):
+            for name in files:
+                full_path = os.path.join(folder, name)
+                yield os.path.relpath(full_path, self.root).replace(os.sep, '/'), os.path.getmtime(full_path)
+
+    def download_url(self, key: str, expires_in: int, download_name: str | None = None) -> str | None:
+        # The app (or the front web server) sends local files itself
+        return None
+
+
+class S3Storage:
+    """
+    Objects in an S3-compatible bucket, optionally under a key prefix.
+    Needs boto3, imported only when this driver is configured. With an
+    endpoint_url (MinIO and friends) path-style addressing is used.
+    """
+
+    def __init__(self, bucket: str, prefix: str = '', endpoint_url: str | None = None, region: str | None = None,
+                 access_key_id: str | None = None, secret_access_key: str | None = None):
+        import boto3
+        from botocore.config import Config
+        from botocore.exceptions import ClientError
+
+        if not bucket:
+            raise ValueError('MEDIA_S3_BUCKET is required for MEDIA_STORAGE=s3')
+        self._client_error = ClientError
+        self.bucket = bucket
+        self.prefix = f"{prefix.strip('/')}/" if prefix and prefix.strip('/') else ''
+        self.client = boto3.client(
+            's3',
+            endpoint_url=endpoint_url or None,
+            region_name=region or None,
+            aws_access_key_id=access_key_id or None,
+            aws_secret_access_key=secret_access_key or None,
+            config=Config(signature_version='s3v4', s3={'addressing_style': 'path' if endpoint_url else 'auto'}),
+        )
+
+    def _key(self, key: str) -> str:
+        return self.prefix + key.replace(os.sep, '/').lstrip('/')
+
+    def _missing(self, exc) -> bool:
+        return exc.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound')
+
+    def _head(self, key: str) -> dict | None:
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=self._key(key))
+        except self._client_error as exc:
+            if self._missing(exc):
+                return None
+            raise
+
+    def _upload_args(self, key: str) -> dict:
+        # Presigned links go straight to the browser, so players need the real type
+        return {'ContentType': mimetypes.guess_type(key)[0] or 'application/octet-stream'}
+
+    def local_path(self, key: str) -> str | None:
+        return None
+
+    def exists(self, key: str) -> bool:
+        return self._head(key) is not None
+
+    def size(self, key: str) -> int:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['ContentLength']
+
+    def modified(self, key: str) -> float:
+        head = self._head(key)
+        if head is None:
+            raise FileNotFoundError(key)
+        return head['LastModified'].timestamp()
+
+    def touch(self, key: str) -> None:
+        """Refresh LastModified by copying the object onto itself."""
+        head = self._head(key)
+        if head is None or head['ContentLength'] > S3_MAX_COPY_SIZE:
+            return
+        self.client.copy_object(
+            Bucket=self.bucket, Key=self._key(key),
+            CopySource={'Bucket': self.bucket, 'Key': self._key(key)},
+            MetadataDirective='REPLACE', Metadata=head.get('Metadata', {}),
+            ContentType=head.get('ContentType') or 'application/octet-stream',
+        )
+
+    def save(self, key: str, source_path: str) -> None:
+        """Upload a finished local file (multipart for large ones), then remove it."""
+        self.client.upload_file(source_path, self.bucket, self._key(key), ExtraArgs=self._upload_args(key))
+        os.remove(source_path)
+
+    def write(self, key: str, stream) -> None:
+        self.client.upload_fileobj(stream, self.bucket, self._key(key), ExtraArgs=self._upload_args(key))
+
+    def open(self, key: str):
+        try:
+            return self.client.get_object(Bucket=self.bucket, Key=self._key(key))['Body']
+        except self._client_error as exc:
+            if self._missing(exc):
+                raise FileNotFoundError(key) from exc
+            raise
+
+    def delete(self, key: str) -> None:
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(key))
+
+    def list(self, prefix: str):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self._key(prefix)):
+            for item in page.get('Contents', []):
+                yield item['Key'][len(self.prefix):], item['LastModified'].timestamp()
+
+    def download_url(self, key: str, expires_in: int, download_name: str | None = None) -> str | None:
+        params = {'Bucket': self.bucket, 'Key': self._key(key)}
+        if download_name:
+            params['ResponseContentDisposition'] = attachment_header(download_name)
+        return self.client.generate_presigned_url('get_object', Params=params, ExpiresIn=expires_in)
+
+
+def from_config(config, root: str):
+    """Build the driver named by MEDIA_STORAGE; root is the LocalStorage directory."""
+    driver = (config.get('MEDIA_STORAGE') or 'local').lower()
+    if driver == 'local':
+        return LocalStorage(root)
+    if driver == 's3':
+        return S3Storage(
+            bucket=config.get('MEDIA_S3_BUCKET'),
+            prefix=config.get('MEDIA_S3_PREFIX') or '',
+            endpoint_url=config.get('MEDIA_S3_ENDPOINT_URL'),
+            region=config.get('MEDIA_S3_REGION'),
+            access_key_id=config.get('MEDIA_S3_ACCESS_KEY_ID'),
+            secret_access_key=config.get('MEDIA_S3_SECRET_ACCESS_KEY'),
+        )
+    raise ValueError(f"Unknown MEDIA_STORAGE {driver!r}; use 'local' or 's3'")
@@ -0,0 +1,91 @@
+"""
+Prometheus metrics for the web app.
+
+Under gunicorn every worker writes its samples to PROMETHEUS_MULTIPROC_DIR
+(set up in gunicorn.conf.py) and a scrape aggregates all of them. Without
+that variable, e.g. under the Flask dev server, the in-process registry is
+used instead.
+"""
+import os
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+REQUESTS = Counter(
+    'albaqi_http_requests_total',
+    'HTTP requests by endpoint, method and status code.',
+    ['endpoint', 'method', 'status']
+)
+REQUEST_LATENCY = Histogram(
+    'albaqi_http_request_duration_seconds',
+    'HTTP request latency by endpoint.',
+    ['endpoint', 'method'],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_PROGRESS = Gauge(
+    'albaqi_http_requests_in_progress',
+    'Requests currently being handled across all workers.',
+    multiprocess_mode='livesum'
+)
+EXAM_AUTOSAVES = Counter(
+    'albaqi_exam_autosaves_total',
+    'Exam answer autosaves stored.'
+)
+EMAILS = Counter(
+    'albaqi_emails_total',
+    'Emails handed to the mailer, by kind and result.',
+    ['kind', 'result']
+)
+DB_POOL_CHECKED_OUT = Gauge(
+    'albaqi_db_pool_checked_out',
+    'Database connections currently checked out, summed over live workers.',
+    multiprocess_mode='livesum'
+)
+DB_POOL_SIZE = Gauge(
+    'albaqi_db_pool_size',
+    'Configured database pool size, summed over live workers.',
+    multiprocess_mode='livesum'
+)
+
+
+def record_email(kind: str, sent: int = 0, failed: int = 0) -> None:
+    if sent:
+        EMAILS.labels(kind=kind, result='sent').inc(sent)
+    if failed:
+        EMAILS.labels(kind=kind, result='failed').inc(failed)
+
+
+class ScrapeCollector:
+    """Wraps a callable yielding metric families that are computed at scrape time (e.g. from the database)."""
+
+    def __init__(self, collect):
+        self._collect = collect
+
+    def collect(self):
+        return self._collect()
+
+
+def render_metrics(scrape_collect=None) -> tuple[bytes, str]:
+    """Return (body, content type) for a scrape, aggregating all workers when running multiprocess."""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    body = generate_latest(registry)
+
+    if scrape_collect is not None:
+        scrape_registry = CollectorRegistry()
+        scrape_registry.register(ScrapeCollector(scrape_collect))
+        body += generate_latest(scrape_registry)
+    return body, CONTENT_TYPE_LATEST
@@ -0,0 +1,35 @@
+"""Add denormalized lesson_count and exam_count to Course
+
+Revision ID: 3a7c19d2e4b1
+Revises: 461af13a3876
+Create Date: 2026-10-17 09:12:41.530217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '3a7c19d2e4b1'
+down_revision = '461af13a3876'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('lesson_count', sa.Integer(), nullable=False, server_default='0'))
+        batch_op.add_column(sa.Column('exam_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from existing rows
+    op.execute(
+        "UPDATE course SET "
+        "lesson_count = (SELECT COUNT(*) FROM lesson WHERE lesson.course_id = course.id), "
+        "exam_count = (SELECT COUNT(*) FROM exam WHERE exam.course_id = course.id)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.drop_column('exam_count')
+        batch_op.drop_column('lesson_count')
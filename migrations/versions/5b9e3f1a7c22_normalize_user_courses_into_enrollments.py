@@ -0,0 +1,72 @@
+"""Normalize User.courses into course_enrollment
+
+Revision ID: 5b9e3f1a7c22
+Revises: 7d2e5b8c1f04
+Create Date: 2026-10-17 11:20:41.604913
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e3f1a7c22'
+down_revision = '7d2e5b8c1f04'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    enrollment = op.create_table('course_enrollment',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('user_id', sa.Integer(), nullable=False),
+        sa.Column('course_name', sa.String(length=100), nullable=False),
+        sa.Column('name_key', sa.String(length=100), nullable=False),
+        sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+        sa.PrimaryKeyConstraint('id'),
+        sa.UniqueConstraint('user_id', 'course_name', name='uq_user_course_enrollment')
+    )
+    with op.batch_alter_table('course_enrollment', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_course_enrollment_user_id'), ['user_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_course_enrollment_course_name'), ['course_name'], unique=False)
+        batch_op.create_index(batch_op.f('ix_course_enrollment_name_key'), ['name_key'], unique=False)
+
+    # Split the comma-separated strings into one row per (user, course name)
+    bind = op.get_bind()
+    rows = []
+    for user_id, courses in bind.execute(sa.text('SELECT id, courses FROM "user"')).fetchall():
+        seen = set()
+        for name in (courses or '').split(','):
+            name = name.strip()[:100]
+            if name and name not in seen:
+                seen.add(name)
+                rows.append({'user_id': user_id, 'course_name': name, 'name_key': name.lower()})
+    if rows:
+        op.bulk_insert(enrollment, rows)
+
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.drop_column('courses')
+
+
+def downgrade():
+    with op.batch_alter_table('user', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('courses', sa.String(length=500), nullable=True))
+
+    bind = op.get_bind()
+    courses_by_user = {}
+    for user_id, course_name in bind.execute(sa.text(
+        'SELECT user_id, course_name FROM course_enrollment ORDER BY id'
+    )).fetchall():
+        courses_by_user.setdefault(user_id, []).append(course_name)
+    for user_id, names in courses_by_user.items():
+        bind.execute(
+            sa.text('UPDATE "user" SET courses = :courses WHERE id = :user_id'),
+            {'courses': ','.join(names)[:500], 'user_id': user_id}
+        )
+
+    with op.batch_alter_table('course_enrollment', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_course_enrollment_name_key'))
+        batch_op.drop_index(batch_op.f('ix_course_enrollment_course_name'))
+        batch_op.drop_index(batch_op.f('ix_course_enrollment_user_id'))
+
+    op.drop_table('course_enrollment')
@@ -0,0 +1,53 @@
+"""Add materialized hierarchy path to Course
+
+Revision ID: 7d2e5b8c1f04
+Revises: 3a7c19d2e4b1
+Create Date: 2026-10-17 10:03:55.118402
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2e5b8c1f04'
+down_revision = '3a7c19d2e4b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('path', sa.String(length=255), nullable=True))
+        batch_op.create_index(batch_op.f('ix_course_path'), ['path'], unique=False)
+
+    # Backfill "root/.../id/" paths from parent_id
+    bind = op.get_bind()
+    parents = dict(bind.execute(sa.text("SELECT id, parent_id FROM course")).fetchall())
+    paths = {}
+
+    def resolve(course_id, trail=()):
+        if course_id in paths:
+            return paths[course_id]
+        parent_id = parents.get(course_id)
+        if parent_id is None or parent_id not in parents or parent_id in trail:
+            prefix = ''
+        else:
+            prefix = resolve(parent_id, trail + (course_id,))
+        paths[course_id] = f"{prefix}{course_id}/"
+        return paths[course_id]
+
+    for course_id in parents:
+        resolve(course_id)
+
+    if paths:
+        bind.execute(
+            sa.text("UPDATE course SET path = :path WHERE id = :id"),
+            [{'id': course_id, 'path': path} for course_id, path in paths.items()]
+        )
+
+
+def downgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_course_path'))
+        batch_op.drop_column('path')
@@ -0,0 +1,26 @@
+"""Index exam attempts by user, exam and start time
+
+Revision ID: 9c4d7a2e6b13
+Revises: 5b9e3f1a7c22
+Create Date: 2026-10-17 12:05:17.339820
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9c4d7a2e6b13'
+down_revision = '5b9e3f1a7c22'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('exam_attempt', schema=None) as batch_op:
+        batch_op.create_index('ix_exam_attempt_user_exam_start', ['user_id', 'exam_id', 'start_time'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exam_attempt', schema=None) as batch_op:
+        batch_op.drop_index('ix_exam_attempt_user_exam_start')
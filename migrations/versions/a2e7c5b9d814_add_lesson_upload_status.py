@@ -0,0 +1,30 @@
+"""Add LessonUpload.status, error and updated_at for background finalize
+
+Revision ID: a2e7c5b9d814
+Revises: f4c9a2d7b531
+Create Date: 2026-10-18 14:02:51.337904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a2e7c5b9d814'
+down_revision = 'f4c9a2d7b531'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('lesson_upload', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('status', sa.String(length=20), nullable=False, server_default='receiving'))
+        batch_op.add_column(sa.Column('error', sa.String(length=300), nullable=True))
+        batch_op.add_column(sa.Column('updated_at', sa.DateTime(), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('lesson_upload', schema=None) as batch_op:
+        batch_op.drop_column('updated_at')
+        batch_op.drop_column('error')
+        batch_op.drop_column('status')
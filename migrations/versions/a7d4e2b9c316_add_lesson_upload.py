@@ -0,0 +1,41 @@
+"""Add lesson_upload for resumable lesson media uploads
+
+Revision ID: a7d4e2b9c316
+Revises: f1c3a8e6d259
+Create Date: 2026-10-17 19:41:27.518320
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a7d4e2b9c316'
+down_revision = 'f1c3a8e6d259'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('lesson_upload',
+        sa.Column('id', sa.String(length=32), nullable=False),
+        sa.Column('lesson_id', sa.Integer(), nullable=False),
+        sa.Column('field', sa.String(length=20), nullable=False),
+        sa.Column('filename', sa.String(length=300), nullable=False),
+        sa.Column('total_size', sa.BigInteger(), nullable=False),
+        sa.Column('sha256', sa.String(length=64), nullable=True),
+        sa.Column('created_by', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['created_by'], ['user.id'], ),
+        sa.ForeignKeyConstraint(['lesson_id'], ['lesson.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('lesson_upload', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_lesson_upload_lesson_id'), ['lesson_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('lesson_upload', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_lesson_upload_lesson_id'))
+
+    op.drop_table('lesson_upload')
@@ -0,0 +1,30 @@
+"""Add exam statistics cache table
+
+Revision ID: b3f6c9e1a254
+Revises: e2a8f5c3d917
+Create Date: 2026-10-17 14:52:36.470215
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b3f6c9e1a254'
+down_revision = 'e2a8f5c3d917'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('exam_statistics_cache',
+        sa.Column('exam_id', sa.Integer(), nullable=False),
+        sa.Column('payload', sa.JSON(), nullable=False),
+        sa.Column('computed_at', sa.DateTime(), nullable=True),
+        sa.ForeignKeyConstraint(['exam_id'], ['exam.id'], ),
+        sa.PrimaryKeyConstraint('exam_id')
+    )
+
+
+def downgrade():
+    op.drop_table('exam_statistics_cache')
@@ -0,0 +1,32 @@
+"""Add extracted_text cache for slide text
+
+Revision ID: b9e6f3c1d427
+Revises: a7d4e2b9c316
+Create Date: 2026-10-17 21:03:52.186407
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e6f3c1d427'
+down_revision = 'a7d4e2b9c316'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('extracted_text',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('status', sa.String(length=20), nullable=False),
+        sa.Column('text', sa.Text(), nullable=True),
+        sa.Column('error', sa.String(length=300), nullable=True),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.Column('updated_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256')
+    )
+
+
+def downgrade():
+    op.drop_table('extracted_text')
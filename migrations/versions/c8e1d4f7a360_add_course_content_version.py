@@ -0,0 +1,26 @@
+"""Add Course.content_version for conditional course page responses
+
+Revision ID: c8e1d4f7a360
+Revises: b3f6c9e1a254
+Create Date: 2026-10-17 15:40:12.118530
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c8e1d4f7a360'
+down_revision = 'b3f6c9e1a254'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('course', schema=None) as batch_op:
+        batch_op.drop_column('content_version')
@@ -0,0 +1,26 @@
+"""Index exams by course
+
+Revision ID: d3a7f9c2e518
+Revises: b9e6f3c1d427
+Create Date: 2026-10-17 23:12:40.517306
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a7f9c2e518'
+down_revision = 'b9e6f3c1d427'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('exam', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_exam_course_id'), ['course_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exam', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_exam_course_id'))
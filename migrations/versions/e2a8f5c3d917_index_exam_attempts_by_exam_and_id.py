@@ -0,0 +1,26 @@
+"""Index exam attempts by exam and id
+
+Revision ID: e2a8f5c3d917
+Revises: 9c4d7a2e6b13
+Create Date: 2026-10-17 13:41:08.215774
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e2a8f5c3d917'
+down_revision = '9c4d7a2e6b13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('exam_attempt', schema=None) as batch_op:
+        batch_op.create_index('ix_exam_attempt_exam_id_id', ['exam_id', 'id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exam_attempt', schema=None) as batch_op:
+        batch_op.drop_index('ix_exam_attempt_exam_id_id')
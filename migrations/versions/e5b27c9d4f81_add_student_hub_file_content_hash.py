@@ -0,0 +1,26 @@
+"""Add StudentHubFile.content_hash
+
+Revision ID: e5b27c9d4f81
+Revises: c8e1d4f7a360
+Create Date: 2026-10-17 17:05:48.204117
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b27c9d4f81'
+down_revision = 'c8e1d4f7a360'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('student_hub_file', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('content_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('student_hub_file', schema=None) as batch_op:
+        batch_op.drop_column('content_hash')
@@ -0,0 +1,32 @@
+"""Add Exam.analytics_version and versioned exam statistics cache rows
+
+Revision ID: e6b4c8d1f273
+Revises: d3a7f9c2e518
+Create Date: 2026-10-17 23:41:08.902614
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e6b4c8d1f273'
+down_revision = 'd3a7f9c2e518'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('exam', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('analytics_version', sa.Integer(), nullable=False, server_default='0'))
+
+    with op.batch_alter_table('exam_statistics_cache', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('version', sa.Integer(), nullable=False, server_default='0'))
+
+
+def downgrade():
+    with op.batch_alter_table('exam_statistics_cache', schema=None) as batch_op:
+        batch_op.drop_column('version')
+
+    with op.batch_alter_table('exam', schema=None) as batch_op:
+        batch_op.drop_column('analytics_version')
@@ -0,0 +1,167 @@
+"""Add media_blob and copy lesson and Student Hub files into the blob store
+
+Legacy files are copied, never moved or deleted: a failed upgrade leaves
+them where the old code expects them. Once the upgrade has committed,
+`flask --app website remove-legacy-media` deletes the copies the store holds.
+
+Revision ID: f1c3a8e6d259
+Revises: e5b27c9d4f81
+Create Date: 2026-10-17 18:22:09.731644
+
+"""
+import hashlib
+import os
+import shutil
+
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1c3a8e6d259'
+down_revision = 'e5b27c9d4f81'
+branch_labels = None
+depends_on = None
+
+BLOB_PREFIX = 'blobs/'
+
+
+def _blob_path(sha256, extension):
+    # Must match media_blob_path() in website.py
+    return f"{BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def _sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        for chunk in iter(lambda: handle.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def upgrade():
+    media_blob = op.create_table('media_blob',
+        sa.Column('sha256', sa.String(length=64), nullable=False),
+        sa.Column('path', sa.String(length=300), nullable=False),
+        sa.Column('size', sa.BigInteger(), nullable=False),
+        sa.Column('ref_count', sa.Integer(), server_default='0', nullable=False),
+        sa.Column('created_at', sa.DateTime(), nullable=True),
+        sa.PrimaryKeyConstraint('sha256'),
+        sa.UniqueConstraint('path')
+    )
+
+    static_folder = current_app.static_folder
+    # The store lives outside static/ (MEDIA_ROOT); legacy files are read from static/
+    media_root = current_app.config['MEDIA_ROOT']
+    bind = op.get_bind()
+    blobs = {}       # sha256 -> blob path
+    copied = {}      # legacy absolute path -> (sha256, blob path)
+    ref_counts = {}  # blob path -> references
+
+    def adopt(legacy_path):
+        """Copy one legacy file into the store (once per content); None if it is missing."""
+        if legacy_path in copied:
+            return copied[legacy_path]
+        if not os.path.isfile(legacy_path):
+            return None
+        sha256 = _sha256_of(legacy_path)
+        if sha256 not in blobs:
+            blobs[sha256] = _blob_path(sha256, os.path.splitext(legacy_path)[1].lower()[:10])
+            target = os.path.join(media_root, blobs[sha256])
+            # Left by an earlier, rolled back run: copies are atomic, so it is complete
+            if not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                temp_path = f"{target}.{os.getpid()}.tmp"
+                shutil.copyfile(legacy_path, temp_path)
+                os.replace(temp_path, target)
+        copied[legacy_path] = (sha256, blobs[sha256])
+        return copied[legacy_path]
+
+    lessons = bind.execute(sa.text('SELECT id, video_file, ppt_file FROM lesson ORDER BY id')).fetchall()
+    hub_files = bind.execute(sa.text(
+        'SELECT id, user_id, stored_name, file_path FROM student_hub_file ORDER BY id'
+    )).fetchall()
+
+    # Paths already in the store (left behind by a downgrade) are registered first,
+    # so legacy copies of the same content are deduplicated against them
+    existing = [row.video_file for row in lessons] + [row.ppt_file for row in lessons] + [row.file_path for row in hub_files]
+    for value in existing:
+        if value and value.startswith(BLOB_PREFIX) and os.path.isfile(os.path.join(media_root, value)):
+            sha256 = os.path.splitext(os.path.basename(value))[0]
+            blobs.setdefault(sha256, value)
+            ref_counts[value] = ref_counts.get(value, 0) + 1
+
+    # Files shared by several lessons under one name are copied once and counted per reference
+    for lesson_id, video_file, ppt_file in lessons:
+        updates = {}
+        for column, value in (('video_file', video_file), ('ppt_file', ppt_file)):
+            if not value or value.startswith(BLOB_PREFIX):
+                continue
+            adopted = adopt(os.path.join(static_folder, value))
+            if adopted:
+                updates[column] = adopted[1]
+                ref_counts[adopted[1]] = ref_counts.get(adopted[1], 0) + 1
+        if updates:
+            assignments = ', '.join(f"{column} = :{column}" for column in updates)
+            bind.execute(sa.text(f'UPDATE lesson SET {assignments} WHERE id = :lesson_id'),
+                         {**updates, 'lesson_id': lesson_id})
+
+    hub_folder = os.path.join(static_folder, 'uploads', 'student_hub')
+    for file_id, user_id, stored_name, file_path in hub_files:
+        if file_path and file_path.startswith(BLOB_PREFIX):
+            continue
+        legacy_path = file_path if file_path and os.path.isabs(file_path) and os.path.isfile(file_path) \
+            else os.path.join(hub_folder, str(user_id), stored_name)
+        adopted = adopt(legacy_path)
+        if adopted:
+            sha256, blob_path = adopted
+            bind.execute(sa.text(
+                'UPDATE student_hub_file SET file_path = :blob_path, content_hash = :sha256 WHERE id = :file_id'
+            ), {'blob_path': blob_path, 'sha256': sha256, 'file_id': file_id})
+            ref_counts[blob_path] = ref_counts.get(blob_path, 0) + 1
+
+    if blobs:
+        op.bulk_insert(media_blob, [
+            {
+                'sha256': sha256,
+                'path': blob_path,
+                'size': os.path.getsize(os.path.join(media_root, blob_path)),
+                'ref_count': ref_counts.get(blob_path, 0),
+            }
+            for sha256, blob_path in blobs.items()
+        ])
+
+
+def downgrade():
+    # The old code serves lesson paths from static/, so lesson blobs are copied
+    # there under the same blobs/ path. Student Hub files go back to
+    # <user_id>/<stored_name>, where the old code looks.
+    static_folder = current_app.static_folder
+    media_root = current_app.config['MEDIA_ROOT']
+    hub_folder = os.path.join(static_folder, 'uploads', 'student_hub')
+    bind = op.get_bind()
+    for video_file, ppt_file in bind.execute(sa.text('SELECT video_file, ppt_file FROM lesson ORDER BY id')).fetchall():
+        for value in (video_file, ppt_file):
+            if not value or not value.startswith(BLOB_PREFIX):
+                continue
+            source = os.path.join(media_root, value)
+            target = os.path.join(static_folder, value)
+            if os.path.isfile(source) and not os.path.exists(target):
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                shutil.copyfile(source, target)
+
+    for file_id, user_id, stored_name, file_path in bind.execute(sa.text(
+        'SELECT id, user_id, stored_name, file_path FROM student_hub_file ORDER BY id'
+    )).fetchall():
+        if not file_path or not file_path.startswith(BLOB_PREFIX):
+            continue
+        source = os.path.join(media_root, file_path)
+        target = os.path.join(hub_folder, str(user_id), stored_name)
+        if os.path.isfile(source):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            shutil.copyfile(source, target)
+        bind.execute(sa.text('UPDATE student_hub_file SET file_path = :target WHERE id = :file_id'),
+                     {'target': target, 'file_id': file_id})
+
+    op.drop_table('media_blob')
@@ -0,0 +1,26 @@
+"""Index exam answers by attempt and correctness
+
+Revision ID: f4c9a2d7b531
+Revises: e6b4c8d1f273
+Create Date: 2026-10-18 10:14:33.580217
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f4c9a2d7b531'
+down_revision = 'e6b4c8d1f273'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('exam_answer', schema=None) as batch_op:
+        batch_op.create_index('ix_exam_answer_attempt_correct', ['attempt_id', 'is_correct'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('exam_answer', schema=None) as batch_op:
+        batch_op.drop_index('ix_exam_answer_attempt_correct')
@@ -0,0 +1,67 @@
+"""
+Text extraction from lesson slides, run in a worker process.
+
+website.py hands these functions to a ProcessPoolExecutor so parsing a large
+deck never holds up a gunicorn worker. They take paths (or a media storage
+key) rather than bytes: python-pptx and PyMuPDF read straight from the file,
+and only the extracted text travels back to the web process, where it is
+cached per content hash in ExtractedText.
+"""
+import os
+import shutil
+import tempfile
+
+# For PPT parsing
+from pptx import Presentation
+
+# For PDF parsing
+import fitz  # PyMuPDF
+
+import media_storage
+
+# Plain-text uploads are only read this far; the quiz builder needs a few sentences
+MAX_PLAIN_TEXT_BYTES = 5 * 1024 * 1024
+
+
+def extract_text(path: str, extension: str) -> str:
+    """Return the text of the deck at path, or '' when it has none we can read."""
+    extension = extension.lower()
+    try:
+        if extension in {'.ppt', '.pptx'}:
+            prs = Presentation(path)
+            slide_text = []
+            for slide in prs.slides:
+                for shape in slide.shapes:
+                    if hasattr(shape, 'text') and shape.text:
+                        slide_text.append(shape.text)
+            text = "\n".join(slide_text)
+
+        elif extension == '.pdf':
+            with fitz.open(path, filetype='pdf') as doc:
+                text = "\n".join(page.get_text('text') for page in doc)
+
+        else:
+            # .txt/.md, and a best-effort UTF-8 read of anything else
+            with open(path, 'rb') as handle:
+                text = handle.read(MAX_PLAIN_TEXT_BYTES).decode('utf-8', errors='ignore')
+    except Exception:
+        return ""
+    # PostgreSQL text columns reject NUL characters
+    return text.replace('\x00', '')
+
+
+def extract_stored_text(storage_settings: dict, media_root: str, key: str) -> str:
+    """Extract text from a file in media storage, copying it to a temp file first when it is remote."""
+    storage = media_storage.from_config(storage_settings, media_root)
+    extension = os.path.splitext(key)[1]
+    local_path = storage.local_path(key)
+    if local_path is not None:
+        if not os.path.isfile(local_path):
+            raise FileNotFoundError(key)
+        return extract_text(local_path, extension)
+
+    with tempfile.NamedTemporaryFile(suffix=extension) as temp_file:
+        with storage.open(key) as source:
+            shutil.copyfileobj(source, temp_file, media_storage.COPY_CHUNK_SIZE)
+        temp_file.flush()
+        return extract_text(temp_file.name, extension)
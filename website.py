@@ -1,5 +1,6 @@
-from flask import Flask, redirect, url_for, render_template, request, flash, session, send_from_directory, jsonify, abort
-from functools import wraps
+from flask import Flask, redirect, url_for, render_template, request, flash, session, jsonify, abort, g, has_app_context, has_request_context, make_response, send_file
+from flask import request_started, before_render_template, template_rendered
+from functools import wraps, partial
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_migrate import Migrate
@@ -12,16 +13,30 @@ import csv
 import re
 import requests
 import random
-import io
+import gzip
+import time
+import hmac
+import hashlib
+import mimetypes
+import posixpath
+import multiprocessing
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+import fcntl
+import secrets
 from werkzeug.utils import secure_filename
+from werkzeug.sansio import multipart
+from urllib.parse import quote
+from markupsafe import Markup
 from sqlalchemy import or_, func, case
+from sqlalchemy.exc import IntegrityError
 from config import get_config
-
-# For PPT parsing
-from pptx import Presentation
-
-# For PDF parsing
-import fitz  # PyMuPDF
+from exam_analytics import compute_exam_analytics
+import metrics
+import media_urls
+import media_storage
+import slide_text
+from prometheus_client.core import GaugeMetricFamily
 
 
 app = Flask(__name__)
@@ -46,9 +61,18 @@ def _ensure_utc(dt: datetime | None) -> datetime | None:
 # -------------------- Database Setup -------------------- #
 app.config['STUDENT_HUB_UPLOAD_FOLDER'] = os.path.join(app.root_path, 'static', 'uploads', 'student_hub')
 
+# Blob store for MEDIA_STORAGE=local and upload scratch space; Flask must never serve it as static
+app.config['MEDIA_ROOT'] = app.config.get('MEDIA_ROOT') or os.path.join(app.instance_path, 'media')
+app.config['MEDIA_BLOB_FOLDER'] = os.path.join(app.config['MEDIA_ROOT'], 'blobs')
+
 ALLOWED_STUDENT_HUB_EXTENSIONS = {"pdf", "pptx", "docx", "png", "jpg", "jpeg"}
 
 os.makedirs(app.config['STUDENT_HUB_UPLOAD_FOLDER'], exist_ok=True)
+os.makedirs(app.config['MEDIA_BLOB_FOLDER'], exist_ok=True)
+# Lesson media and Student Hub files (MEDIA_ROOT or an S3-compatible bucket)
+media_store = media_storage.from_config(app.config, app.config['MEDIA_ROOT'])
+app.config['FRAGMENT_CACHE_DIR'] = app.config.get('FRAGMENT_CACHE_DIR') or os.path.join(app.instance_path, 'fragment_cache')
+os.makedirs(app.config['FRAGMENT_CACHE_DIR'], exist_ok=True)
 app.config['SESSION_PERMANENT'] = False
 app.config['SESSION_TYPE'] = 'filesystem'
 db = SQLAlchemy(app)
@@ -59,8 +83,118 @@ mail = Mail(app)  # ✅ Flask-Mail for password reset emails
 # Initialize password reset token serializer
 serializer = URLSafeTimedSerializer(app.config['SECRET_KEY'])
 
+# -------------------- Request Instrumentation -------------------- #
+def _request_stats() -> dict | None:
+    """SQL/template timings for the current request, when instrumentation is on."""
+    if not has_request_context():
+        return None
+    return g.get('_request_stats')
+
+
+def _instrument_engine(engine) -> None:
+    @db.event.listens_for(engine, 'before_cursor_execute')
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        context._query_started = time.perf_counter()
+
+    @db.event.listens_for(engine, 'after_cursor_execute')
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        stats = _request_stats()
+        if stats is not None:
+            stats['queries'] += 1
+            stats['db'] += time.perf_counter() - context._query_started
+
+
+def _start_request_stats(sender, **extra):
+    g._request_stats = {'started': time.perf_counter(), 'queries': 0, 'db': 0.0, 'template': 0.0}
+
+
+def _start_template_timer(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None:
+        stats['template_started'] = time.perf_counter()
+
+
+def _stop_template_timer(sender, template, context, **extra):
+    stats = _request_stats()
+    if stats is not None and 'template_started' in stats:
+        stats['template'] += time.perf_counter() - stats.pop('template_started')
+
+
+def _report_request_stats(response):
+    stats = _request_stats()
+    if stats is None:
+        return response
+
+    total = time.perf_counter() - stats['started']
+    response.headers['Server-Timing'] = ', '.join([
+        f'db;dur={stats["db"] * 1000:.1f};desc="{stats["queries"]} queries"',
+        f'template;dur={stats["template"] * 1000:.1f}',
+        f'total;dur={total * 1000:.1f}'
+    ])
+
+    budget = app.config.get('SQL_QUERY_BUDGETS', {}).get(request.endpoint, app.config.get('SQL_QUERY_BUDGET', 0))
+    if budget and stats['queries'] > budget:
+        app.logger.warning(
+            f"{request.method} {request.path} ({request.endpoint}) ran {stats['queries']} SQL queries, "
+            f"over its budget of {budget} ({stats['db'] * 1000:.1f} ms in the database)"
+        )
+    return response
+
+
+if app.config.get('SQL_INSTRUMENTATION'):
+    with app.app_context():
+        _instrument_engine(db.engine)
+    request_started.connect(_start_request_stats, app)
+    before_render_template.connect(_start_template_timer, app)
+    template_rendered.connect(_stop_template_timer, app)
+    app.after_request(_report_request_stats)
+
+# -------------------- Metrics -------------------- #
+def _start_request_metrics(sender, **extra):
+    g._metrics_started = time.perf_counter()
+    metrics.REQUESTS_IN_PROGRESS.inc()
+
+
+@app.after_request
+def _record_request_metrics(response):
+    started = g.get('_metrics_started')
+    if started is not None:
+        endpoint = request.endpoint or 'unmatched'
+        metrics.REQUEST_LATENCY.labels(endpoint=endpoint, method=request.method).observe(time.perf_counter() - started)
+        metrics.REQUESTS.labels(endpoint=endpoint, method=request.method, status=str(response.status_code)).inc()
+    return response
+
+
+@app.teardown_request
+def _finish_request_metrics(exc):
+    if g.pop('_metrics_started', None) is not None:
+        metrics.REQUESTS_IN_PROGRESS.dec()
+
+
+def _instrument_pool(engine) -> None:
+    size = getattr(engine.pool, 'size', None)
+    if callable(size):
+        metrics.DB_POOL_SIZE.set(size())
+
+    @db.event.listens_for(engine, 'checkout')
+    def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+        metrics.DB_POOL_CHECKED_OUT.inc()
+
+    @db.event.listens_for(engine, 'checkin')
+    def _on_checkin(dbapi_connection, connection_record):
+        metrics.DB_POOL_CHECKED_OUT.dec()
+
+
+request_started.connect(_start_request_metrics, app)
+with app.app_context():
+    _instrument_pool(db.engine)
+
 # -------------------- User Model -------------------- #
 # -------------------- User Model -------------------- #
+# Course names a new account is enrolled in when none are given
+DEFAULT_USER_COURSES = ("seerah", "arabic")
+
+
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(150), unique=True, nullable=False)
@@ -81,8 +215,14 @@ class User(db.Model):
     accepted_terms = db.Column(db.Boolean, default=False, nullable=False)
     terms_accepted_at = db.Column(db.DateTime, nullable=True)
 
-    # ✅ Courses allowed (comma-separated list for now)
-    courses = db.Column(db.String(500), default="seerah,arabic")
+    # ✅ Courses allowed by name (legacy access, normalized into CourseEnrollment)
+    enrollments = db.relationship(
+        'CourseEnrollment',
+        backref='user',
+        lazy=True,
+        cascade="all, delete-orphan",
+        order_by='CourseEnrollment.id'
+    )
 
     course_progress = db.relationship(
         'UserCourseProgress',
@@ -133,11 +273,32 @@ class User(db.Model):
         cascade="all, delete-orphan"
     )
 
+    def __init__(self, **kwargs):
+        courses = kwargs.pop('courses', None)
+        super().__init__(**kwargs)
+        if courses is None:
+            courses = DEFAULT_USER_COURSES
+        elif isinstance(courses, str):
+            courses = courses.split(",")
+        self.set_courses(courses)
+
     def get_courses(self):
-        return self.courses.split(",") if self.courses else []
+        return [enrollment.course_name for enrollment in self.enrollments]
 
     def set_courses(self, course_list):
-        self.courses = ",".join(course_list)
+        wanted = []
+        for name in course_list:
+            name = (name or "").strip()
+            if name and name not in wanted:
+                wanted.append(name)
+
+        current = {enrollment.course_name: enrollment for enrollment in self.enrollments}
+        for name, enrollment in current.items():
+            if name not in wanted:
+                self.enrollments.remove(enrollment)
+        for name in wanted:
+            if name not in current:
+                self.enrollments.append(CourseEnrollment(course_name=name))
 
     def has_course_access(self, course_id):
         """Check if user has access to a specific course via new access control system"""
@@ -145,6 +306,32 @@ class User(db.Model):
         if not course:
             return False
         return course.user_has_access(self.id)
+
+
+class CourseEnrollment(db.Model):
+    """
+    Name-based course membership (formerly the comma-separated User.courses).
+    A name covers every year of the course with that name.
+    """
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False, index=True)
+    course_name = db.Column(db.String(100), nullable=False, index=True)
+    name_key = db.Column(db.String(100), nullable=False, index=True)  # lower-cased, for admin filters
+
+    __table_args__ = (
+        db.UniqueConstraint('user_id', 'course_name', name='uq_user_course_enrollment'),
+    )
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        if self.course_name and not self.name_key:
+            self.name_key = course_name_key(self.course_name)
+
+
+def course_name_key(name: str | None) -> str:
+    return (name or "").strip().lower()
+
+
 # -------------------- Course & Lesson Models -------------------- #
 class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -161,6 +348,17 @@ class Course(db.Model):
     show_on_homepage = db.Column(db.Boolean, default=False)  # ✅ Show course on homepage
     course_assignment = db.Column(db.String(20), default='standalone')  # standalone, year_1, year_2
 
+    # ✅ Materialized ancestry ("1/5/9/"), maintained by the Course mapper events below
+    path = db.Column(db.String(255), index=True)
+
+    # ✅ Denormalized child counts for display, maintained by the Lesson/Exam mapper events below;
+    # unlock checks still query the exam table so a drifted count can't skip a required exam
+    lesson_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    exam_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # ✅ Bumped whenever the course page content changes; feeds the course page ETag
+    content_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     # ✅ Future Stripe integration
     stripe_product_id = db.Column(db.String(100), nullable=True)
     stripe_price_id = db.Column(db.String(100), nullable=True)
@@ -217,12 +415,23 @@ class Course(db.Model):
 
     # ✅ Helper methods for hierarchy and access control
     def get_all_children(self):
-        """Recursively get all child courses (years and sub-courses)"""
-        result = []
-        for child in self.children:
-            result.append(child)
-            result.extend(child.get_all_children())
-        return result
+        """Get all descendant courses (years and sub-courses), depth-first, in one query"""
+        if not self.path:
+            return []
+        return Course.query.filter(
+            Course.path.like(f"{self.path}%"),
+            Course.id != self.id
+        ).order_by(Course.path).all()
+
+    def ancestor_ids(self):
+        """Ids of every ancestor course, root first, read from the materialized path"""
+        if not self.path:
+            return [self.parent_id] if self.parent_id else []
+        return [int(part) for part in self.path.split('/') if part][:-1]
+
+    def is_descendant_of(self, other):
+        """True if this course sits anywhere below `other` in the hierarchy"""
+        return bool(self.path and other.path) and self.path != other.path and self.path.startswith(other.path)
 
     def is_parent_course(self):
         """Check if this is a parent course (has children)"""
@@ -233,25 +442,8 @@ class Course(db.Model):
         return self.price is None or self.price == 0
 
     def user_has_access(self, user_id):
-        """Check if a user has access to this course"""
-        # Check direct access
-        direct_access = CourseAccess.query.filter_by(
-            user_id=user_id,
-            course_id=self.id
-        ).first()
-        if direct_access:
-            return True
-
-        # Check if user has access via parent course
-        if self.parent_id:
-            parent_access = CourseAccess.query.filter_by(
-                user_id=user_id,
-                course_id=self.parent_id
-            ).first()
-            if parent_access:
-                return True
-
-        return False
+        """Check if a user has an unlocked grant for this course or an ancestor"""
+        return get_course_entitlements(user_id).has_grant(self)
 
 
 class Lesson(db.Model):
@@ -296,7 +488,7 @@ class Lesson(db.Model):
 
 class Exam(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    course_id = db.Column(db.Integer, db.ForeignKey('course.id'))
+    course_id = db.Column(db.Integer, db.ForeignKey('course.id'), index=True)
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text)
     duration_minutes = db.Column(db.Integer, nullable=False, default=30)
@@ -308,6 +500,9 @@ class Exam(db.Model):
     required_to_complete_course = db.Column(db.Boolean, default=False)
     settings = db.Column(db.JSON, default=dict)
 
+    # ✅ Bumped by invalidate_exam_analytics; ExamStatisticsCache rows for older versions are stale
+    analytics_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
     questions = db.relationship(
         'ExamQuestion',
         backref='exam',
@@ -323,6 +518,13 @@ class Exam(db.Model):
         cascade="all, delete-orphan"
     )
 
+    statistics_cache = db.relationship(
+        'ExamStatisticsCache',
+        lazy=True,
+        uselist=False,
+        cascade="all, delete-orphan"
+    )
+
 
 class ExamQuestion(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -362,6 +564,13 @@ class ExamAttempt(db.Model):
 
     course = db.relationship('Course')
 
+    __table_args__ = (
+        # Latest attempt per (user, exam) for the course unlock state
+        db.Index('ix_exam_attempt_user_exam_start', 'user_id', 'exam_id', 'start_time'),
+        # Keyset pagination of an exam's attempts on the admin results page
+        db.Index('ix_exam_attempt_exam_id_id', 'exam_id', 'id'),
+    )
+
     answers = db.relationship(
         'ExamAnswer',
         backref='attempt',
@@ -379,6 +588,20 @@ class ExamAnswer(db.Model):
     points_awarded = db.Column(db.Float, default=0.0)
     feedback = db.Column(db.Text)
 
+    __table_args__ = (
+        # Answers per attempt (selectinload on the results feed), and the
+        # needs_grading filter's "any answer with is_correct IS NULL" probe
+        db.Index('ix_exam_answer_attempt_correct', 'attempt_id', 'is_correct'),
+    )
+
+
+class ExamStatisticsCache(db.Model):
+    """Computed exam analytics, valid while version matches the exam's analytics_version."""
+    exam_id = db.Column(db.Integer, db.ForeignKey('exam.id'), primary_key=True)
+    payload = db.Column(db.JSON, nullable=False)
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    computed_at = db.Column(db.DateTime, default=utcnow)
+
 
 
 class Quiz(db.Model):
@@ -510,6 +733,43 @@ class StudentHubFile(db.Model):
     uploaded_at = db.Column(db.DateTime, default=utcnow)
     feedback_text = db.Column(db.Text)
     feedback_grade = db.Column(db.String(10))
+    content_hash = db.Column(db.String(64))  # SHA-256 hex, computed while the upload streams in
+
+
+class MediaBlob(db.Model):
+    """One stored copy per distinct file content; Lesson and StudentHubFile rows point at its path."""
+    sha256 = db.Column(db.String(64), primary_key=True)
+    path = db.Column(db.String(300), unique=True, nullable=False)  # relative to the media root
+    size = db.Column(db.BigInteger, nullable=False)
+    # Lesson.video_file / ppt_file and StudentHubFile.file_path values naming this blob
+    ref_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    created_at = db.Column(db.DateTime, default=utcnow)
+
+
+class LessonUpload(db.Model):
+    """A resumable admin upload of lesson media; received bytes collect in its .part file until finalize."""
+    id = db.Column(db.String(32), primary_key=True)  # random token, also names the .part file
+    lesson_id = db.Column(db.Integer, db.ForeignKey('lesson.id', ondelete='CASCADE'), nullable=False, index=True)
+    field = db.Column(db.String(20), nullable=False)  # 'video_file' or 'ppt_file'
+    filename = db.Column(db.String(300), nullable=False)
+    total_size = db.Column(db.BigInteger, nullable=False)
+    sha256 = db.Column(db.String(64))  # declared by the client at init, checked on finalize
+    # receiving, storing (finalize queued the move into media storage), done, failed
+    status = db.Column(db.String(20), nullable=False, default='receiving', server_default='receiving')
+    error = db.Column(db.String(300))
+    created_by = db.Column(db.Integer, db.ForeignKey('user.id'))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow)
+
+
+class ExtractedText(db.Model):
+    """Text of an uploaded deck, once per file content; doubles as the extraction job while it runs."""
+    sha256 = db.Column(db.String(64), primary_key=True)  # content hash, also the job id clients poll
+    status = db.Column(db.String(20), nullable=False, default='pending')  # pending, done, failed
+    text = db.Column(db.Text)
+    error = db.Column(db.String(300))
+    created_at = db.Column(db.DateTime, default=utcnow)
+    updated_at = db.Column(db.DateTime, default=utcnow)
 
 
 class QuizAttempt(db.Model):
@@ -600,23 +860,805 @@ class SiteSetting(db.Model):
     updated_at = db.Column(db.DateTime, default=utcnow, onupdate=utcnow)
 
 
-def _student_hub_file_path(file_record: StudentHubFile) -> str:
-    """Return absolute path for a stored student hub file."""
-    return os.path.join(
+# -------------------- Course Counters -------------------- #
+_COURSE_COUNTER_COLUMNS = {Lesson: 'lesson_count', Exam: 'exam_count'}
+
+
+def _bump_course_counter(connection, target, course_id, delta: int) -> None:
+    """Adjust Course.lesson_count / exam_count in SQL for one child row."""
+    if not course_id:
+        return
+    column = _COURSE_COUNTER_COLUMNS[type(target)]
+    course_table = Course.__table__
+    connection.execute(
+        course_table.update()
+        .where(course_table.c.id == course_id)
+        .values({column: func.coalesce(course_table.c[column], 0) + delta})
+    )
+    _mark_course_columns_stale(target, [course_id], column)
+
+
+def _mark_course_columns_stale(target, course_ids, column: str) -> None:
+    """Remember Course columns rewritten in SQL so they get expired after the flush."""
+    session = db.session.object_session(target)
+    if session is not None:
+        stale = session.info.setdefault('_stale_course_columns', set())
+        stale.update((course_id, column) for course_id in course_ids)
+
+
+def _course_child_inserted(mapper, connection, target):
+    _bump_course_counter(connection, target, target.course_id, 1)
+
+
+def _course_child_deleted(mapper, connection, target):
+    _bump_course_counter(connection, target, target.course_id, -1)
+
+
+def _course_child_updated(mapper, connection, target):
+    # Exams can be moved between courses from the builder
+    history = db.inspect(target).attrs.course_id.history
+    if not history.has_changes():
+        return
+    for old_course_id in history.deleted:
+        _bump_course_counter(connection, target, old_course_id, -1)
+    for new_course_id in history.added:
+        _bump_course_counter(connection, target, new_course_id, 1)
+
+
+for _model in _COURSE_COUNTER_COLUMNS:
+    db.event.listen(_model, 'after_insert', _course_child_inserted)
+    db.event.listen(_model, 'after_delete', _course_child_deleted)
+    db.event.listen(_model, 'after_update', _course_child_updated)
+
+
+@db.event.listens_for(db.session, 'after_flush_postexec')
+def _expire_stale_course_columns(session, flush_context):
+    """Reload columns changed in SQL so in-memory Course objects don't go stale."""
+    stale = session.info.pop('_stale_course_columns', None)
+    if not stale:
+        return
+    for course_id, column in stale:
+        course = session.identity_map.get(db.inspect(Course).identity_key_from_primary_key((course_id,)))
+        if course is not None:
+            session.expire(course, [column])
+
+
+def rebuild_course_counters() -> int:
+    """Recompute lesson_count and exam_count for every course. Returns courses updated."""
+    course_table = Course.__table__
+    lesson_total = db.select(func.count(Lesson.id)).where(Lesson.course_id == course_table.c.id).scalar_subquery()
+    exam_total = db.select(func.count(Exam.id)).where(Exam.course_id == course_table.c.id).scalar_subquery()
+    result = db.session.execute(
+        course_table.update().values(lesson_count=lesson_total, exam_count=exam_total)
+    )
+    db.session.commit()
+    return result.rowcount
+
+
+@app.cli.command('rebuild-course-counters')
+def rebuild_course_counters_command():
+    """Repair Course.lesson_count / exam_count after bulk imports or manual SQL."""
+    updated = rebuild_course_counters()
+    print(f"✅ Rebuilt lesson and exam counters for {updated} courses.")
+
+
+# -------------------- Course Content Versions -------------------- #
+def _bump_course_content_version(connection, target, course_ids) -> None:
+    """Increment Course.content_version in SQL so cached course pages stop validating."""
+    course_ids = [course_id for course_id in set(course_ids) if course_id]
+    if not course_ids:
+        return
+    course_table = Course.__table__
+    connection.execute(
+        course_table.update()
+        .where(course_table.c.id.in_(course_ids))
+        .values(content_version=func.coalesce(course_table.c.content_version, 0) + 1)
+    )
+    _mark_course_columns_stale(target, course_ids, 'content_version')
+
+
+def _lesson_or_exam_changed(mapper, connection, target):
+    # Moving an exam between courses changes both pages
+    course_ids = db.inspect(target).attrs.course_id.history.sum() + [target.course_id]
+    _bump_course_content_version(connection, target, course_ids)
+
+
+def _quiz_changed(mapper, connection, target):
+    lesson_table = Lesson.__table__
+    course_id = connection.execute(
+        db.select(lesson_table.c.course_id).where(lesson_table.c.id == target.lesson_id)
+    ).scalar()
+    _bump_course_content_version(connection, target, [course_id])
+
+
+def _course_changed(mapper, connection, target):
+    # Sub-course cards on the parent's page are covered by the children's own versions
+    _bump_course_content_version(connection, target, [target.id])
+
+
+for _model, _listener in ((Lesson, _lesson_or_exam_changed), (Exam, _lesson_or_exam_changed),
+                          (Quiz, _quiz_changed), (Course, _course_changed)):
+    for _event_name in ('after_insert', 'after_update', 'after_delete'):
+        db.event.listen(_model, _event_name, _listener)
+
+
+# -------------------- Course Hierarchy Paths -------------------- #
+def _parent_path(connection, parent_id) -> str:
+    if not parent_id:
+        return ''
+    course_table = Course.__table__
+    parent_path = connection.execute(
+        db.select(course_table.c.path).where(course_table.c.id == parent_id)
+    ).scalar()
+    return parent_path or f"{parent_id}/"
+
+
+@db.event.listens_for(Course, 'after_insert')
+def _course_path_inserted(mapper, connection, target):
+    course_table = Course.__table__
+    connection.execute(
+        course_table.update()
+        .where(course_table.c.id == target.id)
+        .values(path=f"{_parent_path(connection, target.parent_id)}{target.id}/")
+    )
+    _mark_course_columns_stale(target, [target.id], 'path')
+
+
+@db.event.listens_for(Course, 'after_update')
+def _course_path_moved(mapper, connection, target):
+    """Re-root the whole subtree in one UPDATE when a course changes parent."""
+    if not db.inspect(target).attrs.parent_id.history.has_changes():
+        return
+    course_table = Course.__table__
+    old_path = connection.execute(
+        db.select(course_table.c.path).where(course_table.c.id == target.id)
+    ).scalar() or f"{target.id}/"
+    new_path = f"{_parent_path(connection, target.parent_id)}{target.id}/"
+    if new_path == old_path:
+        return
+
+    subtree = course_table.c.path.like(f"{old_path}%")
+    moved_ids = connection.execute(db.select(course_table.c.id).where(subtree)).scalars().all()
+    connection.execute(
+        course_table.update()
+        .where(subtree)
+        .values(path=new_path + func.substr(course_table.c.path, len(old_path) + 1))
+    )
+    _mark_course_columns_stale(target, moved_ids or [target.id], 'path')
+
+
+def rebuild_course_paths() -> int:
+    """Recompute Course.path for the whole catalogue. Returns courses updated."""
+    parents = dict(db.session.query(Course.id, Course.parent_id).all())
+    paths = {}
+
+    def resolve(course_id, trail=()):
+        if course_id in paths:
+            return paths[course_id]
+        parent_id = parents.get(course_id)
+        if parent_id is None or parent_id not in parents or parent_id in trail:
+            prefix = ''
+        else:
+            prefix = resolve(parent_id, trail + (course_id,))
+        paths[course_id] = f"{prefix}{course_id}/"
+        return paths[course_id]
+
+    for course_id in parents:
+        resolve(course_id)
+
+    if paths:
+        db.session.execute(
+            Course.__table__.update().where(Course.__table__.c.id == db.bindparam('course_id')).values(path=db.bindparam('new_path')),
+            [{'course_id': course_id, 'new_path': path} for course_id, path in paths.items()]
+        )
+    db.session.commit()
+    return len(paths)
+
+
+@app.cli.command('rebuild-course-paths')
+def rebuild_course_paths_command():
+    """Repair Course.path after manual edits to parent_id."""
+    updated = rebuild_course_paths()
+    print(f"✅ Rebuilt hierarchy paths for {updated} courses.")
+
+
+# -------------------- Media Blob Store -------------------- #
+# Uploaded lesson media and Student Hub files live once per content at
+# blobs/<aa>/<bb>/<sha256><ext> in media_store (MEDIA_ROOT or an S3 bucket, see
+# media_storage.py). Scratch files stay local. Rows reference a blob by that path and
+# MediaBlob.ref_count follows them through the mapper events below; a blob is
+# deleted after the commit that drops its last reference.
+MEDIA_BLOB_PREFIX = 'blobs/'
+MEDIA_BLOB_CHUNK_SIZE = 1024 * 1024
+# Unreferenced blob files younger than this stay on disk: an upload of the same
+# content may be committing at that moment. rebuild-media-blobs clears them later.
+MEDIA_BLOB_GRACE_SECONDS = 600
+MEDIA_BLOB_REFERENCES = {Lesson: ('video_file', 'ppt_file'), StudentHubFile: ('file_path',)}
+
+
+def media_blob_path(sha256: str, extension: str) -> str:
+    return f"{MEDIA_BLOB_PREFIX}{sha256[:2]}/{sha256[2:4]}/{sha256}{extension}"
+
+
+def media_blob_partial_path() -> str:
+    """Local scratch file next to the store, so adopting it into local storage is a rename."""
+    folder = os.path.join(app.config['MEDIA_BLOB_FOLDER'], 'tmp')
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{os.getpid()}-{time.time_ns()}.part")
+
+
+def adopt_media_blob(partial_path: str, sha256: str, size: int, filename: str) -> str:
+    """
+    Move a fully written scratch file into media storage, or drop it when
+    that content is already stored, and make sure its MediaBlob row exists.
+    Returns the blob path; the reference is counted when the row using it is flushed.
+    """
+    blob = db.session.get(MediaBlob, sha256)
+    relative_path = blob.path if blob else media_blob_path(sha256, os.path.splitext(filename)[1].lower()[:10])
+
+    if media_store.exists(relative_path):
+        os.remove(partial_path)
+        # Refresh the grace period so a concurrent release leaves the file alone
+        media_store.touch(relative_path)
+    else:
+        media_store.save(relative_path, partial_path)
+
+    if blob is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(MediaBlob(sha256=sha256, path=relative_path, size=size))
+        except IntegrityError:
+            # Another upload of the same content stored the row first
+            relative_path = db.session.get(MediaBlob, sha256).path
+    return relative_path
+
+
+def store_media_blob(file_storage) -> str:
+    """Copy an uploaded FileStorage into the store; returns the blob path."""
+    partial_path = media_blob_partial_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(partial_path, 'wb') as handle:
+            for chunk in iter(lambda: file_storage.stream.read(MEDIA_BLOB_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                handle.write(chunk)
+                size += len(chunk)
+        return adopt_media_blob(partial_path, digest.hexdigest(), size, file_storage.filename or '')
+    finally:
+        if os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def _adjust_media_blob_refs(connection, target, paths, delta: int) -> None:
+    paths = [path for path in paths if path and path.startswith(MEDIA_BLOB_PREFIX)]
+    blob_table = MediaBlob.__table__
+    for path in paths:
+        connection.execute(
+            blob_table.update()
+            .where(blob_table.c.path == path)
+            .values(ref_count=blob_table.c.ref_count + delta)
+        )
+    session = db.session.object_session(target)
+    if delta < 0 and paths and session is not None:
+        session.info.setdefault('_released_media_blobs', set()).update(paths)
+
+
+def _media_blob_referrer_inserted(mapper, connection, target):
+    fields = MEDIA_BLOB_REFERENCES[type(target)]
+    _adjust_media_blob_refs(connection, target, [getattr(target, field) for field in fields], 1)
+
+
+def _media_blob_referrer_deleting(mapper, connection, target):
+    # before_delete: the paths can still be loaded if they were expired
+    fields = MEDIA_BLOB_REFERENCES[type(target)]
+    _adjust_media_blob_refs(connection, target, [getattr(target, field) for field in fields], -1)
+
+
+def _media_blob_referrer_updated(mapper, connection, target):
+    state = db.inspect(target)
+    for field in MEDIA_BLOB_REFERENCES[type(target)]:
+        history = state.attrs[field].history
+        if history.has_changes():
+            _adjust_media_blob_refs(connection, target, history.deleted, -1)
+            _adjust_media_blob_refs(connection, target, history.added, 1)
+
+
+for _model in MEDIA_BLOB_REFERENCES:
+    db.event.listen(_model, 'after_insert', _media_blob_referrer_inserted)
+    db.event.listen(_model, 'before_delete', _media_blob_referrer_deleting)
+    db.event.listen(_model, 'after_update', _media_blob_referrer_updated)
+
+
+def _delete_unreferenced_media_blobs(paths) -> int:
+    """Drop the rows and files of blobs in paths that nothing references any more."""
+    blob_table = MediaBlob.__table__
+    unreferenced = (blob_table.c.path.in_(list(paths))) & (blob_table.c.ref_count <= 0)
+    with db.engine.begin() as connection:
+        doomed = connection.execute(db.select(blob_table.c.path).where(unreferenced)).scalars().all()
+        if doomed:
+            connection.execute(blob_table.delete().where(unreferenced))
+
+    cutoff = time.time() - MEDIA_BLOB_GRACE_SECONDS
+    for path in doomed:
+        try:
+            if media_store.modified(path) < cutoff:
+                media_store.delete(path)
+        except FileNotFoundError:
+            pass
+    return len(doomed)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _release_media_blobs(session):
+    released = session.info.pop('_released_media_blobs', None)
+    if released:
+        try:
+            _delete_unreferenced_media_blobs(released)
+        except Exception:
+            app.logger.exception("Failed to delete unreferenced media blobs")
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_released_media_blobs(session):
+    session.info.pop('_released_media_blobs', None)
+
+
+def rebuild_media_blobs() -> tuple[int, int]:
+    """
+    Recount MediaBlob references from Lesson and StudentHubFile, then remove
+    unreferenced blobs and stray files older than the grace period, along with
+    abandoned resumable lesson uploads.
+
+    A referenced path with no MediaBlob row (a manual edit, or an upload that
+    reused a row just as a release dropped it) gets its row back when the file
+    is in storage, and a referenced path is never deleted.
+    Returns (blobs in use, files removed).
+    """
+    counts = {}
+    for model, fields in MEDIA_BLOB_REFERENCES.items():
+        for field in fields:
+            column = getattr(model, field)
+            for path, total in db.session.query(column, func.count()).filter(
+                column.like(f"{MEDIA_BLOB_PREFIX}%")
+            ).group_by(column):
+                counts[path] = counts.get(path, 0) + total
+
+    blob_table = MediaBlob.__table__
+    rows = dict(db.session.execute(db.select(blob_table.c.path, blob_table.c.sha256)).all())
+    stored_hashes = set(rows.values())
+    for path in counts.keys() - rows.keys():
+        # Blob paths name their content: blobs/aa/bb/<sha256><ext>
+        sha256 = os.path.splitext(posixpath.basename(path))[0]
+        if re.fullmatch(r'[0-9a-f]{64}', sha256) and sha256 not in stored_hashes and media_store.exists(path):
+            db.session.add(MediaBlob(sha256=sha256, path=path, size=media_store.size(path)))
+            stored_hashes.add(sha256)
+    db.session.flush()
+
+    db.session.execute(blob_table.update().values(ref_count=0))
+    if counts:
+        db.session.execute(
+            blob_table.update().where(blob_table.c.path == db.bindparam('blob_path')).values(ref_count=db.bindparam('total')),
+            [{'blob_path': path, 'total': total} for path, total in counts.items()]
+        )
+    db.session.execute(blob_table.delete().where(blob_table.c.ref_count <= 0))
+    db.session.commit()
+
+    known = set(db.session.scalars(db.select(MediaBlob.path))) | counts.keys()
+    cutoff = time.time() - MEDIA_BLOB_GRACE_SECONDS
+    removed = expire_lesson_uploads()
+    # tmp/ and incoming/ are local scratch space; uploads in progress there are expire_lesson_uploads()'s business
+    scratch = tuple(f"{MEDIA_BLOB_PREFIX}{folder}/" for folder in ('tmp', LESSON_UPLOAD_FOLDER))
+    for path, modified in list(media_store.list(MEDIA_BLOB_PREFIX)):
+        if path not in known and not path.startswith(scratch) and modified < cutoff:
+            media_store.delete(path)
+            removed += 1
+    scratch_folder = os.path.join(app.config['MEDIA_BLOB_FOLDER'], 'tmp')
+    for name in os.listdir(scratch_folder) if os.path.isdir(scratch_folder) else []:
+        full_path = os.path.join(scratch_folder, name)
+        if os.path.getmtime(full_path) < cutoff:
+            os.remove(full_path)
+            removed += 1
+    return len(known), removed
+
+
+@app.cli.command('rebuild-media-blobs')
+def rebuild_media_blobs_command():
+    """Repair MediaBlob reference counts and clear unreferenced blobs after manual edits."""
+    in_use, removed = rebuild_media_blobs()
+    print(f"✅ {in_use} media blobs in use, removed {removed} unreferenced files.")
+
+
+def remove_legacy_media() -> tuple[int, int]:
+    """
+    Delete media files left under static/ by the move to the blob store
+    (courses/, the Student Hub upload folder, and blobs/ copies made by a
+    downgrade) whose content the store holds. Anything else stays, so it is
+    safe to run again. Returns (files removed, files kept).
+    """
+    blobs_by_size = {}
+    for sha256, path, size in db.session.execute(db.select(MediaBlob.sha256, MediaBlob.path, MediaBlob.size)):
+        blobs_by_size.setdefault(size, {})[sha256] = path
+
+    removed = kept = 0
+    folders = (os.path.join(app.static_folder, 'courses'), app.config['STUDENT_HUB_UPLOAD_FOLDER'],
+               os.path.join(app.static_folder, 'blobs'))
+    for folder in folders:
+        for root, _, files in os.walk(folder, topdown=False):
+            for name in files:
+                full_path = os.path.join(root, name)
+                # Only hash files whose size matches a stored blob
+                candidates = blobs_by_size.get(os.path.getsize(full_path))
+                blob_path = None
+                if candidates:
+                    digest = hashlib.sha256()
+                    with open(full_path, 'rb') as handle:
+                        for chunk in iter(lambda: handle.read(MEDIA_BLOB_CHUNK_SIZE), b''):
+                            digest.update(chunk)
+                    blob_path = candidates.get(digest.hexdigest())
+                if blob_path and media_store.exists(blob_path):
+                    os.remove(full_path)
+                    removed += 1
+                else:
+                    kept += 1
+            if root != folder and not os.listdir(root):
+                os.rmdir(root)
+    return removed, kept
+
+
+@app.cli.command('remove-legacy-media')
+def remove_legacy_media_command():
+    """Delete the pre-blob-store copies of lesson media and Student Hub files (after flask db upgrade)."""
+    removed, kept = remove_legacy_media()
+    print(f"✅ Removed {removed} legacy media files already in the blob store; kept {kept} that are not.")
+
+
+@app.cli.command('copy-media-to-storage')
+def copy_media_to_storage_command():
+    """Upload blobs still in the local MEDIA_ROOT to MEDIA_STORAGE (run after switching to s3)."""
+    local = media_storage.LocalStorage(app.config['MEDIA_ROOT'])
+    copied = missing = 0
+    for path in db.session.scalars(db.select(MediaBlob.path).order_by(MediaBlob.path)):
+        if media_store.exists(path):
+            continue
+        if not local.exists(path):
+            missing += 1
+            continue
+        with local.open(path) as handle:
+            media_store.write(path, handle)
+        copied += 1
+    print(f"✅ Copied {copied} media blobs to {app.config['MEDIA_STORAGE']} storage ({missing} missing locally).")
+
+
+# -------------------- Resumable Lesson Uploads -------------------- #
+# Lecture videos too large for one request arrive as a LessonUpload:
+# POST /admin/uploads, then PUT /admin/uploads/<id>?offset=N per chunk, then
+# POST /admin/uploads/<id>/finalize. Chunks are appended straight from the
+# request stream to MEDIA_ROOT/blobs/incoming/<id>.part, so no request outlives the
+# worker timeout and an interrupted upload resumes from the size on disk.
+# Finalize only checks the size and answers 202: hashing the assembled file
+# and adopting it into the media blob store (an upload of many GB with S3
+# storage) run on a thread pool, and the client polls the upload until its
+# status is done or failed.
+LESSON_UPLOAD_FOLDER = 'incoming'
+# Uploads with no new chunk for this long are dropped by rebuild-media-blobs
+LESSON_UPLOAD_MAX_AGE = timedelta(days=2)
+# A storing upload this old lost its worker (restart or crash) and may be finalized again
+LESSON_UPLOAD_STORE_STALE_AFTER = timedelta(hours=1)
+_lesson_upload_pools = {}  # pid -> ThreadPoolExecutor, started on first use in each worker
+
+
+def lesson_upload_part_path(upload_id: str) -> str:
+    folder = os.path.join(app.config['MEDIA_BLOB_FOLDER'], LESSON_UPLOAD_FOLDER)
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, f"{upload_id}.part")
+
+
+def lesson_upload_received(upload: LessonUpload) -> int:
+    part_path = lesson_upload_part_path(upload.id)
+    return os.path.getsize(part_path) if os.path.exists(part_path) else 0
+
+
+def append_lesson_upload_chunk(upload: LessonUpload, offset: int, stream, length: int,
+                               chunk_sha256: str | None = None) -> tuple[bool, int]:
+    """
+    Append one chunk of `length` bytes from `stream` at byte `offset`.
+
+    The .part file is locked for the write, so a retried chunk racing its
+    original cannot interleave with it. Returns (appended, bytes received);
+    appended is False when `offset` is not where the file currently ends (a
+    duplicate or skipped chunk) or another request holds the lock, and the
+    client should continue from the returned size. A chunk that fails its
+    checksum or arrives short is cut off again and raises ValueError.
+    """
+    if length > app.config['LESSON_UPLOAD_MAX_CHUNK_SIZE']:
+        raise ValueError(f"Chunks can be at most {app.config['LESSON_UPLOAD_MAX_CHUNK_SIZE']} bytes.")
+    if offset + length > upload.total_size:
+        raise ValueError('Chunk runs past the declared file size.')
+
+    with open(lesson_upload_part_path(upload.id), 'ab') as handle:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False, os.fstat(handle.fileno()).st_size
+        received = os.fstat(handle.fileno()).st_size
+        if received != offset:
+            return False, received
+
+        digest = hashlib.sha256()
+        remaining = length
+        try:
+            while remaining:
+                data = stream.read(min(MEDIA_BLOB_CHUNK_SIZE, remaining))
+                if not data:
+                    raise ValueError('The chunk was interrupted; send it again.')
+                handle.write(data)
+                digest.update(data)
+                remaining -= len(data)
+            if chunk_sha256 and not hmac.compare_digest(digest.hexdigest(), chunk_sha256.lower()):
+                raise ValueError('Chunk checksum mismatch; send it again.')
+            handle.flush()
+        except BaseException:
+            handle.flush()
+            os.ftruncate(handle.fileno(), offset)
+            raise
+        return True, offset + length
+
+
+def _lesson_upload_pool() -> ThreadPoolExecutor:
+    pool = _lesson_upload_pools.get(os.getpid())
+    if pool is None:
+        pool = ThreadPoolExecutor(
+            max_workers=app.config['LESSON_UPLOAD_STORE_WORKERS'], thread_name_prefix='lesson-upload'
+        )
+        _lesson_upload_pools[os.getpid()] = pool
+    return pool
+
+
+def shutdown_lesson_upload_pool() -> None:
+    """Wait for queued finalizes to finish storing (scripts and tests, before exiting)."""
+    pool = _lesson_upload_pools.pop(os.getpid(), None)
+    if pool is not None:
+        pool.shutdown(wait=True)
+
+
+def finalize_lesson_upload(upload: LessonUpload) -> bool:
+    """
+    Check that every byte has arrived, mark the upload 'storing' and queue
+    _store_lesson_upload, which checks the SHA-256, moves the file into the
+    blob store and points the lesson at it. Raises ValueError when the file
+    is incomplete or the lesson is gone. Commits the claim before queuing.
+
+    Returns False when a chunk is still being written (the .part lock is
+    held), the upload is already storing or done, or its .part file is gone.
+    A failed upload, or one storing for LESSON_UPLOAD_STORE_STALE_AFTER, may
+    be finalized again.
+    """
+    if upload.status == 'storing':
+        if _ensure_utc(upload.updated_at) >= utcnow() - LESSON_UPLOAD_STORE_STALE_AFTER:
+            return False
+    elif upload.status not in ('receiving', 'failed'):
+        return False
+
+    part_path = lesson_upload_part_path(upload.id)
+    try:
+        handle = open(part_path, 'rb')
+    except FileNotFoundError:
+        return False
+    with handle:
+        try:
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        received = os.fstat(handle.fileno()).st_size
+    if received != upload.total_size:
+        raise ValueError(f"Upload is incomplete: {received} of {upload.total_size} bytes received.")
+    if db.session.get(Lesson, upload.lesson_id) is None:
+        raise ValueError('The lesson for this upload no longer exists.')
+
+    # Only one of two racing finalizes sees the row as it loaded it
+    table = LessonUpload.__table__
+    claimed = db.session.execute(
+        table.update()
+        .where(table.c.id == upload.id, table.c.status == upload.status,
+               table.c.updated_at.is_not_distinct_from(upload.updated_at))
+        .values(status='storing', error=None, updated_at=utcnow())
+    ).rowcount == 1
+    db.session.commit()
+    if claimed:
+        _lesson_upload_pool().submit(_store_lesson_upload, upload.id)
+    return claimed
+
+
+def _store_lesson_upload(upload_id: str) -> None:
+    """Pool job: hash the .part file, adopt it into media storage, attach it and record the outcome."""
+    with app.app_context():
+        part_path = lesson_upload_part_path(upload_id)
+        try:
+            handle = open(part_path, 'rb')
+        except FileNotFoundError:
+            return
+        try:
+            with handle:
+                # Blocking: a retried job waits for a stalled one, then finds the file moved away
+                fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+                try:
+                    if os.stat(part_path).st_ino != os.fstat(handle.fileno()).st_ino:
+                        return
+                except FileNotFoundError:
+                    return
+                upload = db.session.get(LessonUpload, upload_id)
+                if upload is None or upload.status != 'storing':
+                    return
+                lesson = db.session.get(Lesson, upload.lesson_id)
+                if lesson is None:
+                    raise ValueError('The lesson for this upload no longer exists.')
+
+                digest = hashlib.sha256()
+                for chunk in iter(lambda: handle.read(MEDIA_BLOB_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+                sha256 = digest.hexdigest()
+                if upload.sha256 and sha256 != upload.sha256:
+                    raise ValueError('File checksum does not match the one given at init.')
+
+                blob_path = adopt_media_blob(part_path, sha256, upload.total_size, upload.filename)
+                setattr(lesson, upload.field, blob_path)
+                upload.status = 'done'
+                upload.updated_at = utcnow()
+                db.session.commit()
+        except Exception as exc:
+            db.session.rollback()
+            if not isinstance(exc, ValueError):
+                app.logger.exception("Failed to store lesson upload %s", upload_id)
+            table = LessonUpload.__table__
+            try:
+                db.session.execute(
+                    table.update().where(table.c.id == upload_id)
+                    .values(status='failed', error=(str(exc) or type(exc).__name__)[:300], updated_at=utcnow())
+                )
+                db.session.commit()
+            except Exception:
+                app.logger.exception("Failed to record the failure of lesson upload %s", upload_id)
+
+
+def discard_lesson_upload(upload: LessonUpload) -> None:
+    """Delete the upload row and its .part file. The caller commits."""
+    part_path = lesson_upload_part_path(upload.id)
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    db.session.delete(upload)
+
+
+def expire_lesson_uploads() -> int:
+    """Drop uploads idle (or done) for LESSON_UPLOAD_MAX_AGE and .part files without an upload; returns files removed."""
+    cutoff = time.time() - LESSON_UPLOAD_MAX_AGE.total_seconds()
+    live = set()
+    removed = 0
+    for upload in LessonUpload.query.all():
+        part_path = lesson_upload_part_path(upload.id)
+        last_activity = _ensure_utc(upload.updated_at or upload.created_at).timestamp()
+        if os.path.exists(part_path):
+            last_activity = max(last_activity, os.path.getmtime(part_path))
+        if last_activity < cutoff:
+            removed += os.path.exists(part_path)
+            discard_lesson_upload(upload)
+        else:
+            live.add(f"{upload.id}.part")
+    db.session.commit()
+
+    folder = os.path.join(app.config['MEDIA_BLOB_FOLDER'], LESSON_UPLOAD_FOLDER)
+    grace_cutoff = time.time() - MEDIA_BLOB_GRACE_SECONDS
+    for name in os.listdir(folder) if os.path.isdir(folder) else []:
+        full_path = os.path.join(folder, name)
+        if name not in live and os.path.getmtime(full_path) < grace_cutoff:
+            os.remove(full_path)
+            removed += 1
+    return removed
+
+
+def _student_hub_media_path(file_record: StudentHubFile) -> str:
+    """Media storage key of a stored student hub file."""
+    if file_record.file_path and not os.path.isabs(file_record.file_path):
+        return file_record.file_path
+    # Uploads from before the blob store, stored per user under their own name;
+    # only rows whose file was already missing when the store was created remain
+    legacy_path = os.path.join(
         app.config['STUDENT_HUB_UPLOAD_FOLDER'],
         str(file_record.user_id),
         file_record.stored_name
     )
+    return os.path.relpath(legacy_path, app.static_folder).replace(os.sep, '/')
+
 
+STUDENT_HUB_UPLOAD_CHUNK_SIZE = 256 * 1024
+# Room for multipart boundaries and part headers on top of the file itself
+STUDENT_HUB_MULTIPART_OVERHEAD = 64 * 1024
+
+
+def _allowed_student_hub_filename(filename: str) -> bool:
+    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_STUDENT_HUB_EXTENSIONS
+
+
+def stream_student_hub_upload(field_name: str) -> dict:
+    """
+    Copy one file field of the multipart request body straight into the media
+    blob store, bypassing Werkzeug's temp-file buffering. The extension is
+    checked from the part headers before any bytes are written, the size cap
+    is enforced while copying, and the SHA-256 is computed on the way through.
+
+    Returns {'filename', 'path' (blob path), 'size', 'sha256'}; raises
+    ValueError with a message for the student when the upload is rejected.
+    """
+    max_size = app.config['STUDENT_HUB_MAX_FILE_SIZE']
+    too_large = f"⚠️ Files can be at most {max_size // (1024 * 1024)} MB."
+    if request.content_length and request.content_length > max_size + STUDENT_HUB_MULTIPART_OVERHEAD:
+        raise ValueError(too_large)
+
+    boundary = request.mimetype_params.get('boundary')
+    if request.mimetype != 'multipart/form-data' or not boundary:
+        raise ValueError('⚠️ No file selected')
+
+    decoder = multipart.MultipartDecoder(boundary.encode(), max_form_memory_size=500 * 1024)
+    digest = hashlib.sha256()
+    size = 0
+    filename = partial_path = handle = None
+    writing = finished = False
 
-def _remove_student_hub_file_from_disk(file_record: StudentHubFile) -> None:
-    """Best-effort removal of the stored file asset from disk."""
     try:
-        os.remove(_student_hub_file_path(file_record))
-    except FileNotFoundError:
-        pass
-    except OSError:
-        pass
+        while not finished:
+            chunk = request.stream.read(STUDENT_HUB_UPLOAD_CHUNK_SIZE)
+            decoder.receive_data(chunk or None)
+            event = decoder.next_event()
+            while not isinstance(event, multipart.NeedData):
+                if isinstance(event, multipart.File) and event.name == field_name and filename is None:
+                    filename = secure_filename(event.filename or '')
+                    if not filename:
+                        raise ValueError('⚠️ No file selected')
+                    if not _allowed_student_hub_filename(filename):
+                        allowed = ', '.join(sorted(ALLOWED_STUDENT_HUB_EXTENSIONS))
+                        raise ValueError(f"⚠️ Only these file types can be uploaded: {allowed}.")
+                    partial_path = media_blob_partial_path()
+                    handle = open(partial_path, 'wb')
+                    writing = True
+                elif isinstance(event, multipart.Data) and writing:
+                    size += len(event.data)
+                    if size > max_size:
+                        raise ValueError(too_large)
+                    digest.update(event.data)
+                    handle.write(event.data)
+                    if not event.more_data:
+                        handle.close()
+                        writing = False
+                elif isinstance(event, multipart.Epilogue):
+                    finished = True
+                    break
+                event = decoder.next_event()
+            if not chunk and not finished:
+                raise ValueError('⚠️ The upload was interrupted. Please try again.')
+
+        if filename is None:
+            raise ValueError('⚠️ No file selected')
+
+        sha256 = digest.hexdigest()
+        blob_path = adopt_media_blob(partial_path, sha256, size, filename)
+        partial_path = None
+        return {'filename': filename, 'path': blob_path, 'size': size, 'sha256': sha256}
+    finally:
+        if handle is not None and not handle.closed:
+            handle.close()
+        if partial_path and os.path.exists(partial_path):
+            os.remove(partial_path)
+
+
+def _remove_student_hub_file_from_storage(file_record: StudentHubFile) -> None:
+    """Best-effort removal of the stored file asset from media storage."""
+    if file_record.file_path and file_record.file_path.startswith(MEDIA_BLOB_PREFIX):
+        # Shared blob: released by reference counting once the row is deleted
+        return
+    try:
+        media_store.delete(_student_hub_media_path(file_record))
+    except Exception:
+        app.logger.warning("Could not remove Student Hub file %s", file_record.id, exc_info=True)
 
 
 def _normalize_feedback_grade(raw_grade: str | None) -> str | None:
@@ -645,6 +1687,13 @@ def _normalize_feedback_grade(raw_grade: str | None) -> str | None:
     raise ValueError("Grade must be numeric (0-100) or one of A-F.")
 
 
+def _enrolled_user_ids(course_name: str):
+    """Subquery of user ids enrolled (by name) in a course, matched case-insensitively."""
+    return db.select(CourseEnrollment.user_id).where(
+        CourseEnrollment.name_key == course_name_key(course_name)
+    )
+
+
 def _fetch_course(course_id: int | None):
     return db.session.get(Course, course_id) if course_id else None
 
@@ -835,6 +1884,7 @@ def _finish_attempt(attempt: 'ExamAttempt', submitted_at: datetime | None = None
     if attempt.duration_seconds < 0:
         attempt.duration_seconds = 0
     _compute_attempt_score(attempt)
+    invalidate_exam_analytics(attempt.exam_id)
 
 
 def _time_remaining_seconds(attempt: 'ExamAttempt') -> int:
@@ -932,68 +1982,6 @@ def _summarize_exam_attempt(attempt: 'ExamAttempt') -> dict:
     return summary
 
 
-def _exam_statistics(exam_id: int) -> dict:
-    aggregates = db.session.query(
-        func.count(ExamAttempt.id),
-        func.avg(ExamAttempt.score),
-        func.max(ExamAttempt.score),
-        func.min(ExamAttempt.score),
-        func.avg(ExamAttempt.duration_seconds),
-        func.sum(case((ExamAttempt.passed == True, 1), else_=0))  # noqa: E712
-    ).filter(
-        ExamAttempt.exam_id == exam_id,
-        ExamAttempt.status != 'in-progress'
-    ).one()
-
-    attempt_count = aggregates[0] or 0
-    avg_score = float(aggregates[1]) if aggregates[1] is not None else None
-    max_score = float(aggregates[2]) if aggregates[2] is not None else None
-    min_score = float(aggregates[3]) if aggregates[3] is not None else None
-    avg_duration = float(aggregates[4]) if aggregates[4] is not None else None
-    passed_total = int(aggregates[5] or 0)
-
-    pass_rate = None
-    if attempt_count:
-        pass_rate = round((passed_total / attempt_count) * 100, 2)
-
-    question_rows = db.session.query(
-        ExamAnswer.question_id,
-        func.count(ExamAnswer.id).label('total'),
-        func.sum(case((ExamAnswer.is_correct == True, 1), else_=0)).label('correct')  # noqa: E712
-    ).join(ExamQuestion).filter(
-        ExamQuestion.exam_id == exam_id
-    ).group_by(ExamAnswer.question_id).all()
-
-    most_missed = None
-    for question_id, total, correct in question_rows:
-        total = total or 0
-        correct = correct or 0
-        missed = total - correct
-        if total == 0:
-            continue
-        ratio = missed / total
-        if not most_missed or ratio > most_missed['ratio']:
-            question = db.session.get(ExamQuestion, question_id)
-            most_missed = {
-                'question_id': question_id,
-                'question_text': question.text if question else None,
-                'missed': missed,
-                'total': total,
-                'ratio': ratio
-            }
-
-    return {
-        'attempt_count': attempt_count,
-        'average_score': round(avg_score, 2) if avg_score is not None else None,
-        'highest_score': max_score,
-        'lowest_score': min_score,
-        'average_duration': round(avg_duration, 2) if avg_duration is not None else None,
-        'pass_rate': pass_rate,
-        'passed_total': passed_total,
-        'most_missed': most_missed
-    }
-
-
 def _admin_attempt_payload(attempt: 'ExamAttempt') -> dict:
     exam = attempt.exam
     user = attempt.user
@@ -1018,50 +2006,152 @@ def _admin_attempt_payload(attempt: 'ExamAttempt') -> dict:
     payload['answers'].sort(key=lambda item: item.get('question_order') or 0)
     return payload
 
-def _extract_text_from_upload(upload):
-    """Return textual content parsed from a lesson upload, if possible."""
-    if not upload or not getattr(upload, 'filename', None):
-        return ""
+# -------------------- Slide Text Extraction -------------------- #
+# Deck text for quiz drafting is parsed in a process pool (slide_text.py) and
+# kept in ExtractedText per content hash, so each file is parsed once: lesson
+# slides as soon as a commit sets Lesson.ppt_file, decks sent to the quiz
+# generator when they first arrive. The row doubles as the job record, so any
+# gunicorn worker can answer a poll for it.
+# A pending row this old lost its worker (restart or crash) and may be retried
+TEXT_EXTRACTION_STALE_AFTER = timedelta(minutes=10)
+_text_extraction_pools = {}  # pid -> ProcessPoolExecutor, started on first use in each worker
+
+
+def _text_extraction_pool() -> ProcessPoolExecutor:
+    pool = _text_extraction_pools.get(os.getpid())
+    if pool is None:
+        # spawn: the children must not inherit this worker's database connections and threads
+        pool = ProcessPoolExecutor(
+            max_workers=app.config['TEXT_EXTRACTION_WORKERS'],
+            mp_context=multiprocessing.get_context('spawn'),
+        )
+        _text_extraction_pools[os.getpid()] = pool
+    return pool
+
+
+def shutdown_text_extraction_pool() -> None:
+    """Wait for queued extractions and record their results (CLI commands, before exiting)."""
+    pool = _text_extraction_pools.pop(os.getpid(), None)
+    if pool is not None:
+        pool.shutdown(wait=True)
+
 
-    filename = upload.filename or ""
-    extension = os.path.splitext(filename)[1].lower()
+def _media_storage_settings() -> dict:
+    return {key: value for key, value in app.config.items() if key == 'MEDIA_STORAGE' or key.startswith('MEDIA_S3_')}
 
+
+def _record_text_extraction(sha256: str, scratch_path: str | None, future) -> None:
+    """Done callback, run on the pool's management thread: store the text or the failure."""
     try:
-        binary_data = upload.read()
+        values = {'status': 'done', 'text': future.result(), 'error': None}
+    except Exception as exc:
+        if isinstance(exc, BrokenProcessPool):
+            # A child died (e.g. on a malformed file); the next job starts a fresh pool
+            _text_extraction_pools.pop(os.getpid(), None)
+        values = {'status': 'failed', 'error': (str(exc) or type(exc).__name__)[:300]}
     finally:
+        if scratch_path and os.path.exists(scratch_path):
+            os.remove(scratch_path)
+
+    table = ExtractedText.__table__
+    try:
+        with app.app_context(), db.engine.begin() as connection:
+            connection.execute(table.update().where(table.c.sha256 == sha256).values(updated_at=utcnow(), **values))
+    except Exception:
+        app.logger.exception("Failed to record text extraction for %s", sha256)
+
+
+def queue_text_extraction(sha256: str, scratch_path: str | None = None, media_path: str | None = None,
+                          extension: str = '') -> str:
+    """
+    Make sure the text of content sha256 is extracted, either from a local
+    scratch_path (removed afterwards) or from media_path in media storage.
+    Returns 'done' when the text is already cached, otherwise 'pending'.
+    Uses its own connections, so it is safe to call from after_commit.
+    """
+    table = ExtractedText.__table__
+    now = utcnow()
+    claimed = False
+    with db.engine.begin() as connection:
+        row = connection.execute(
+            db.select(table.c.status, table.c.updated_at).where(table.c.sha256 == sha256)
+        ).first()
+        if row is not None and (row.status == 'failed' or (
+            row.status == 'pending' and _ensure_utc(row.updated_at) < now - TEXT_EXTRACTION_STALE_AFTER
+        )):
+            claimed = connection.execute(
+                table.update()
+                .where(table.c.sha256 == sha256, table.c.updated_at == row.updated_at)
+                .values(status='pending', error=None, updated_at=now)
+            ).rowcount == 1
+    if row is None:
+        try:
+            with db.engine.begin() as connection:
+                connection.execute(table.insert().values(sha256=sha256, status='pending', created_at=now, updated_at=now))
+            claimed = True
+        except IntegrityError:
+            # Another worker queued the same content a moment ago
+            pass
+
+    if not claimed:
+        if scratch_path and os.path.exists(scratch_path):
+            os.remove(scratch_path)
+        return 'done' if row is not None and row.status == 'done' else 'pending'
+
+    try:
+        if scratch_path:
+            future = _text_extraction_pool().submit(slide_text.extract_text, scratch_path, extension)
+        else:
+            future = _text_extraction_pool().submit(
+                slide_text.extract_stored_text, _media_storage_settings(), app.config['MEDIA_ROOT'], media_path
+            )
+    except Exception as exc:
+        future = Future()
+        future.set_exception(exc)
+    future.add_done_callback(partial(_record_text_extraction, sha256, scratch_path))
+    return 'pending'
+
+
+def _lesson_slides_changed(mapper, connection, target):
+    path = target.ppt_file
+    if path and path.startswith(MEDIA_BLOB_PREFIX) and db.inspect(target).attrs.ppt_file.history.has_changes():
+        session = db.session.object_session(target)
+        if session is not None:
+            session.info.setdefault('_slides_to_extract', set()).add(path)
+
+
+db.event.listen(Lesson, 'after_insert', _lesson_slides_changed)
+db.event.listen(Lesson, 'after_update', _lesson_slides_changed)
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _extract_committed_slides(session):
+    for path in session.info.pop('_slides_to_extract', None) or ():
         try:
-            upload.stream.seek(0)
+            # Blob file names are the content hash
+            queue_text_extraction(os.path.splitext(os.path.basename(path))[0], media_path=path)
         except Exception:
-            try:
-                upload.seek(0)
-            except Exception:
-                pass
+            app.logger.exception("Failed to queue text extraction for %s", path)
 
-    if not binary_data:
-        return ""
 
-    try:
-        if extension in {'.ppt', '.pptx'}:
-            prs = Presentation(io.BytesIO(binary_data))
-            slide_text = []
-            for slide in prs.slides:
-                for shape in slide.shapes:
-                    if hasattr(shape, 'text') and shape.text:
-                        slide_text.append(shape.text)
-            return "\n".join(slide_text)
-
-        if extension == '.pdf':
-            with fitz.open(stream=binary_data, filetype='pdf') as doc:
-                page_text = [page.get_text('text') for page in doc]
-            return "\n".join(page_text)
-
-        if extension in {'.txt', '.md'}:
-            return binary_data.decode('utf-8', errors='ignore')
-
-        # Fallback: attempt to decode as UTF-8 text
-        return binary_data.decode('utf-8', errors='ignore')
-    except Exception:
-        return ""
+@db.event.listens_for(db.session, 'after_rollback')
+def _forget_committed_slides(session):
+    session.info.pop('_slides_to_extract', None)
+
+
+@app.cli.command('extract-lesson-slides')
+def extract_lesson_slides_command():
+    """Extract and cache the text of every stored lesson deck that has none yet."""
+    paths = db.session.scalars(
+        db.select(Lesson.ppt_file).where(Lesson.ppt_file.like(f"{MEDIA_BLOB_PREFIX}%")).distinct()
+    ).all()
+    queued = 0
+    for path in paths:
+        if queue_text_extraction(os.path.splitext(os.path.basename(path))[0], media_path=path) == 'pending':
+            queued += 1
+    shutdown_text_extraction_pool()
+    failed = ExtractedText.query.filter_by(status='failed').count()
+    print(f"✅ {len(paths) - queued} decks already cached, extracted {queued} ({failed} failed overall).")
 
 
 def _build_quiz_from_text(raw_text: str, requested: int = 3):
@@ -1169,15 +2259,122 @@ class Message(db.Model):
     created_at = db.Column(db.DateTime, default=db.func.current_timestamp())
 
 
+# -------------------- Course Access Resolution -------------------- #
+class CourseEntitlements:
+    """
+    Effective course access for one user, loaded once and answered in memory.
+    Combines:
+    - Unlocked CourseAccess grants (direct purchase, admin grant, subscription)
+    - Parent unlocks (a grant on any ancestor course covers its descendants)
+    - Legacy course names from CourseEnrollment
+    """
+
+    def __init__(self, user_id, granted_ids=(), locked_ids=(), legacy_names=()):
+        self.user_id = user_id
+        self.granted_ids = set(granted_ids)
+        self.locked_ids = set(locked_ids)
+        self.legacy_names = set(legacy_names)
+
+    def has_grant(self, course):
+        """True if an unlocked grant covers the course directly or via any ancestor."""
+        if course.id in self.granted_ids:
+            return True
+        return any(ancestor_id in self.granted_ids for ancestor_id in course.ancestor_ids())
+
+    def has_legacy_name(self, course_name):
+        return course_name in self.legacy_names
+
+    def can_access(self, course):
+        """Grant-based or legacy name-based access, as checked by the course routes."""
+        return self.has_grant(course) or self.has_legacy_name(course.name)
+
+    def is_locked(self, course):
+        return course.id in self.locked_ids
+
+
+def _entitlements_cache() -> dict:
+    """Per-request cache of CourseEntitlements keyed by user id."""
+    if not has_app_context():
+        return {}
+    return g.setdefault('_course_entitlements', {})
+
+
+def preload_course_entitlements(user_ids) -> dict:
+    """Load entitlements for many users with one CourseAccess and one CourseEnrollment query."""
+    cache = _entitlements_cache()
+    missing = {user_id for user_id in user_ids if user_id is not None and user_id not in cache}
+    if not missing:
+        return cache
+
+    granted = {user_id: set() for user_id in missing}
+    locked = {user_id: set() for user_id in missing}
+    rows = db.session.query(
+        CourseAccess.user_id,
+        CourseAccess.course_id,
+        CourseAccess.is_locked
+    ).filter(CourseAccess.user_id.in_(missing)).all()
+    for user_id, course_id, is_locked in rows:
+        (locked if is_locked else granted)[user_id].add(course_id)
+
+    legacy = {user_id: set() for user_id in missing}
+    enrollment_rows = db.session.query(
+        CourseEnrollment.user_id,
+        CourseEnrollment.course_name
+    ).filter(CourseEnrollment.user_id.in_(missing)).all()
+    for user_id, course_name in enrollment_rows:
+        legacy[user_id].add(course_name)
+
+    for user_id in missing:
+        cache[user_id] = CourseEntitlements(
+            user_id,
+            granted_ids=granted[user_id],
+            locked_ids=locked[user_id],
+            legacy_names=legacy[user_id]
+        )
+    return cache
+
+
+def get_course_entitlements(user_id) -> CourseEntitlements:
+    """Return the (request-cached) entitlements for a single user."""
+    return preload_course_entitlements([user_id]).get(user_id) or CourseEntitlements(user_id)
+
+
+def invalidate_course_entitlements(user_id=None) -> None:
+    """Drop cached entitlements after access rows change mid-request."""
+    cache = _entitlements_cache()
+    if user_id is None:
+        cache.clear()
+    else:
+        cache.pop(user_id, None)
+
+
 # -------------------- Subscription Helper Functions -------------------- #
 def grant_course_access(user_id, course, *, access_type='purchased', amount_paid=None, payment_intent_id=None):
     """Grant access to a course and all published children."""
+    # Walk the subtree in memory; unpublished courses stop the unlock from cascading further
+    descendants_by_parent = {}
+    for descendant in course.get_all_children():
+        descendants_by_parent.setdefault(descendant.parent_id, []).append(descendant)
+
+    targets = [(course, access_type, amount_paid, payment_intent_id)]
+    pending = [course]
+    while pending:
+        parent = pending.pop()
+        for child in descendants_by_parent.get(parent.id, []):
+            if child.is_published:
+                targets.append((child, 'parent_unlock', None, None))
+                pending.append(child)
+
+    existing_by_course = {
+        access.course_id: access
+        for access in CourseAccess.query.filter(
+            CourseAccess.user_id == user_id,
+            CourseAccess.course_id.in_([target.id for target, *_ in targets])
+        ).all()
+    }
 
-    def _grant(target, record_type, record_amount, record_payment):
-        existing_access = CourseAccess.query.filter_by(
-            user_id=user_id,
-            course_id=target.id
-        ).first()
+    for target, record_type, record_amount, record_payment in targets:
+        existing_access = existing_by_course.get(target.id)
 
         if existing_access:
             existing_access.is_locked = False
@@ -1197,11 +2394,7 @@ def grant_course_access(user_id, course, *, access_type='purchased', amount_paid
                 stripe_payment_intent_id=record_payment
             ))
 
-        for child in target.children:
-            if child.is_published:
-                _grant(child, 'parent_unlock', None, None)
-
-    _grant(course, access_type, amount_paid, payment_intent_id)
+    invalidate_course_entitlements(user_id)
 
 
 def grant_subscription_access(user_id, course_ids):
@@ -1234,6 +2427,8 @@ def revoke_subscription_access(user_id, course_ids, keep_progress=True):
             else:
                 db.session.delete(access)
 
+    invalidate_course_entitlements(user_id)
+
 
 def unlock_subscription_courses(user_id, course_ids):
     """
@@ -1248,6 +2443,8 @@ def unlock_subscription_courses(user_id, course_ids):
         if access:
             access.is_locked = False
 
+    invalidate_course_entitlements(user_id)
+
 
 def user_has_active_subscription(user_id):
     """
@@ -1274,11 +2471,39 @@ def get_user_active_subscription(user_id):
     ).first()
 
 
+# -------------------- Current User -------------------- #
+@app.before_request
+def load_current_user():
+    """Resolve the logged-in user once per request into ``g.user``."""
+    g.user = None
+    # Signed media must not touch the session: that would add Vary: Cookie and defeat edge caching
+    if request.endpoint in ('static', 'signed_media') or 'user' not in session:
+        return
+
+    user_id = session.get('user_id')
+    if user_id is not None:
+        g.user = db.session.get(User, user_id)
+    else:
+        # Sessions issued before user_id was stored only carry the username
+        g.user = User.query.filter_by(username=session['user']).first()
+        if g.user:
+            session['user_id'] = g.user.id
+
+    if g.user is None:
+        # Account was deleted while the session was still alive
+        session.clear()
+
+
+@app.context_processor
+def inject_current_user():
+    return {'current_user': g.get('user')}
+
+
 # -------------------- Session Decorators -------------------- #
 def login_required(f):
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'user' not in session:
+        if g.get('user') is None:
             flash("You must log in first!")
             return redirect(url_for('login'))
         return f(*args, **kwargs)
@@ -1302,26 +2527,267 @@ def admin_only(f):
         return f(*args, **kwargs)
     return decorated_function
 
-# -------------------- Routes -------------------- #
-@app.route('/')
-def index():
-    public_qs = Question.query.filter_by(is_public=True).all()
+# -------------------- Homepage Fragment Cache -------------------- #
+# Rendered homepage blocks are kept per worker, keyed by a version stored in
+# FRAGMENT_CACHE_DIR so a bump from any worker invalidates all of them
+# without a database read on the anonymous path.
+_fragment_cache = {}
+
+# Models whose committed changes invalidate each homepage block
+HOMEPAGE_FRAGMENTS_BY_MODEL = {
+    Course: ('home_courses', 'home_testimonials'),  # testimonials show the course name
+    Testimonial: ('home_testimonials',),
+    Question: ('home_public_qa',),
+    Message: ('home_public_qa',),
+}
+
+
+def _fragment_version_path(name: str) -> str:
+    return os.path.join(app.config['FRAGMENT_CACHE_DIR'], f"{name}.version")
 
+
+def fragment_cache_version(name: str) -> str:
+    try:
+        with open(_fragment_version_path(name)) as handle:
+            return handle.read().strip() or '0'
+    except FileNotFoundError:
+        return '0'
+
+
+def bump_fragment_cache(*names: str) -> None:
+    """Give each named fragment a new version so every worker re-renders it."""
+    for name in names:
+        path = _fragment_version_path(name)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, 'w') as handle:
+            handle.write(str(time.time_ns()))
+        os.replace(temp_path, path)
+
+
+def cached_fragment(name: str, render) -> Markup:
+    """Return the cached HTML for a fragment, calling render() on a miss."""
+    version = fragment_cache_version(name)
+    html = _fragment_cache.get((name, version))
+    if html is None:
+        html = Markup(render())
+        for key in [key for key in _fragment_cache if key[0] == name]:
+            del _fragment_cache[key]
+        _fragment_cache[(name, version)] = html
+    return html
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_homepage_changes(session, flush_context):
+    touched = session.info.setdefault('_homepage_fragments', set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        touched.update(HOMEPAGE_FRAGMENTS_BY_MODEL.get(type(instance), ()))
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _bump_homepage_fragments(session):
+    touched = session.info.pop('_homepage_fragments', None)
+    if touched:
+        bump_fragment_cache(*touched)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_homepage_changes(session):
+    session.info.pop('_homepage_fragments', None)
+
+
+def _render_home_courses() -> str:
     # ✅ NEW: Only show courses marked to display on homepage
     courses = Course.query.filter_by(
         show_on_homepage=True,
         is_published=True
     ).order_by(Course.order_index, Course.name).all()
+    return render_template('home/courses.html', courses=courses)
+
+
+def _render_home_public_qa() -> str:
+    public_qs = Question.query.filter_by(is_public=True).options(db.selectinload(Question.messages)).all()
+    return render_template('home/public_qa.html', public_qs=public_qs)
 
+
+def _render_home_testimonials() -> str:
     # fetch approved testimonials for homepage
-    testimonials = Testimonial.query.filter_by(status='approved').order_by(Testimonial.created_at.desc()).all()
+    testimonials = Testimonial.query.filter_by(status='approved').options(
+        db.joinedload(Testimonial.course)
+    ).order_by(Testimonial.created_at.desc()).all()
+    return render_template('home/testimonials.html', testimonials=testimonials)
+
+
+# -------------------- Static Pre-rendering -------------------- #
+# Anonymous copies of the public pages, written to PRERENDER_DIR for nginx to
+# serve to visitors without a session cookie (see DEPLOYMENT_CHECKLIST.md).
+PRERENDERED_PAGES = {
+    '/': 'index.html',
+    '/terms': 'terms.html',
+    '/qa/public': 'qa/public.html',
+}
+
+PRERENDERED_PAGES_BY_MODEL = {
+    Course: ('/',),
+    Testimonial: ('/',),
+    Question: ('/', '/qa/public'),
+    Message: ('/', '/qa/public'),
+    SiteSetting: ('/terms',),
+}
+
+
+def _write_atomic(path: str, data: bytes) -> None:
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as handle:
+        handle.write(data)
+    os.replace(temp_path, path)
+
+
+def prerender_public_pages(paths=None) -> list[str]:
+    """Render public pages as an anonymous visitor into PRERENDER_DIR, with .gz (and .br) copies."""
+    target_dir = app.config.get('PRERENDER_DIR')
+    if not target_dir:
+        return []
+    try:
+        import brotli
+    except ImportError:
+        brotli = None
+
+    written = []
+    client = app.test_client()
+    for path in paths or PRERENDERED_PAGES:
+        try:
+            response = client.get(path)
+        except Exception:
+            app.logger.exception(f"Not pre-rendering {path}")
+            continue
+        if response.status_code != 200 or 'Set-Cookie' in response.headers:
+            # Never publish an error page or anything tied to a session
+            app.logger.warning(f"Not pre-rendering {path}: status {response.status_code}")
+            continue
+
+        body = response.get_data()
+        file_path = os.path.join(target_dir, PRERENDERED_PAGES[path])
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        _write_atomic(file_path, body)
+        _write_atomic(f"{file_path}.gz", gzip.compress(body, compresslevel=9, mtime=0))
+        if brotli is not None:
+            _write_atomic(f"{file_path}.br", brotli.compress(body))
+        written.append(path)
+    return written
+
+
+@app.cli.command('prerender-public-pages')
+def prerender_public_pages_command():
+    """Regenerate the static public pages (after deploys, template changes or data edits made outside the app)."""
+    if not app.config.get('PRERENDER_DIR'):
+        print("PRERENDER_DIR is not set; nothing to do.")
+        return
+    written = prerender_public_pages()
+    print(f"✅ Pre-rendered {len(written)} pages into {app.config['PRERENDER_DIR']}.")
+
+
+def _prerender_after_response(paths) -> None:
+    try:
+        with app.app_context():
+            prerender_public_pages(paths)
+    except Exception:
+        app.logger.exception("Pre-rendering public pages failed")
+
+
+@db.event.listens_for(db.session, 'after_flush')
+def _collect_prerender_changes(session, flush_context):
+    if not app.config.get('PRERENDER_DIR'):
+        return
+    stale = session.info.setdefault('_stale_prerendered_pages', set())
+    for instance in (*session.new, *session.dirty, *session.deleted):
+        stale.update(PRERENDERED_PAGES_BY_MODEL.get(type(instance), ()))
+
+
+@db.event.listens_for(db.session, 'after_commit')
+def _queue_prerender(session):
+    stale = session.info.pop('_stale_prerendered_pages', None)
+    if not stale:
+        return
+    if has_request_context():
+        # Re-render once the response has gone out, so the admin isn't kept waiting
+        g.setdefault('_stale_prerendered_pages', set()).update(stale)
+    else:
+        _prerender_after_response(stale)
+
+
+@db.event.listens_for(db.session, 'after_rollback')
+def _discard_prerender_changes(session):
+    session.info.pop('_stale_prerendered_pages', None)
+
+
+@app.after_request
+def _schedule_prerender(response):
+    stale = g.pop('_stale_prerendered_pages', None)
+    if stale:
+        response.call_on_close(lambda: _prerender_after_response(stale))
+    return response
+
+
+# -------------------- Conditional Responses -------------------- #
+def _render_fingerprint() -> str:
+    """Hash of website.py and the templates, so a deploy retires every ETag."""
+    root = os.path.dirname(os.path.abspath(__file__))
+    paths = [os.path.join(root, 'website.py')]
+    for folder, _, files in sorted(os.walk(os.path.join(root, 'templates'))):
+        paths.extend(os.path.join(folder, name) for name in sorted(files))
+    digest = hashlib.sha1()
+    for path in paths:
+        with open(path, 'rb') as handle:
+            digest.update(handle.read())
+    return digest.hexdigest()
+
+
+RENDER_FINGERPRINT = _render_fingerprint()
+
 
-    # Get current user if logged in
-    current_user = None
-    if 'user' in session:
-        current_user = User.query.filter_by(username=session['user']).first()
+def _etag_for(*parts) -> str:
+    """ETag over the given validator parts and the deployed code."""
+    digest = hashlib.sha1(RENDER_FINGERPRINT.encode())
+    digest.update(json.dumps(parts, default=str).encode())
+    return digest.hexdigest()
 
-    return render_template('index.html', public_qs=public_qs, courses=courses, testimonials=testimonials, current_user=current_user)
+
+def _with_etag(response, etag: str):
+    # Per-user pages: the browser may keep a copy but must revalidate it every time
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response
+
+
+def _not_modified(etag: str):
+    """A 304 response when the request's If-None-Match already holds etag, else None."""
+    if request.if_none_match.contains_weak(etag):
+        return _with_etag(app.response_class(status=304), etag)
+    return None
+
+
+def _conditional_json(payload):
+    """jsonify(payload) with an ETag over the body; saves the transfer, not the work."""
+    response = jsonify(payload)
+    etag = hashlib.sha1(response.get_data()).hexdigest()
+    return _not_modified(etag) or _with_etag(response, etag)
+
+
+# -------------------- Routes -------------------- #
+@app.route('/')
+def index():
+    # Course cards show purchase/open buttons per user, so only the anonymous version is shared
+    if g.user is None:
+        courses_html = cached_fragment('home_courses', _render_home_courses)
+    else:
+        courses_html = Markup(_render_home_courses())
+
+    return render_template(
+        'index.html',
+        courses_html=courses_html,
+        public_qs_html=cached_fragment('home_public_qa', _render_home_public_qa),
+        testimonials_html=cached_fragment('home_testimonials', _render_home_testimonials)
+    )
 
 
 # -------------------- Terms of Service -------------------- #
@@ -1385,8 +2851,10 @@ def register():
         try:
             from email_utils import send_welcome_email
             send_welcome_email(new_user)
+            metrics.record_email('welcome', sent=1)
         except Exception as e:
             # Log error but don't block registration
+            metrics.record_email('welcome', failed=1)
             print(f"Failed to send welcome email: {e}")
 
         flash("Registration successful! You can now log in.")
@@ -1414,6 +2882,7 @@ def login():
         user.last_login = datetime.now(timezone.utc)
         db.session.commit()
         session['user'] = user.username
+        session['user_id'] = user.id
         session['role'] = user.role
 
         if user.role == "admin":
@@ -1462,9 +2931,11 @@ def forgot_password():
         try:
             from email_utils import send_password_reset_email
             send_password_reset_email(user, token)
+            metrics.record_email('password_reset', sent=1)
             flash('Password reset instructions have been sent to your email address. Please check your inbox.', 'success')
 
         except Exception as e:
+            metrics.record_email('password_reset', failed=1)
             print(f"Error sending email: {e}")
             flash('An error occurred while sending the reset email. Please try again later.', 'error')
             return redirect(url_for('forgot_password'))
@@ -1578,17 +3049,9 @@ def edit_lesson(lesson_id):
         video_file = request.files.get("video_file")
         ppt_file = request.files.get("ppt_file")
         if video_file:
-            folder = os.path.join("static", "courses", lesson.course.name, f"year{lesson.course.year}")
-            os.makedirs(folder, exist_ok=True)
-            path = os.path.join(folder, video_file.filename)
-            video_file.save(path)
-            lesson.video_file = os.path.join("courses", lesson.course.name, f"year{lesson.course.year}", video_file.filename)
+            lesson.video_file = store_media_blob(video_file)
         if ppt_file:
-            folder = os.path.join("static", "courses", lesson.course.name, f"year{lesson.course.year}")
-            os.makedirs(folder, exist_ok=True)
-            path = os.path.join(folder, ppt_file.filename)
-            ppt_file.save(path)
-            lesson.ppt_file = os.path.join("courses", lesson.course.name, f"year{lesson.course.year}", ppt_file.filename)
+            lesson.ppt_file = store_media_blob(ppt_file)
 
         db.session.commit()
         flash("✅ Lesson updated successfully")
@@ -1662,19 +3125,12 @@ def upload_course_file():
         lesson.title = title or lesson.title
         lesson.description = description if description is not None else lesson.description
 
-    # ✅ Save uploaded files
-    folder = os.path.join("static", "courses", course_name, f"year{year}")
-    os.makedirs(folder, exist_ok=True)
-
+    # ✅ Save uploaded files (stored once per content, shared across lessons and years)
     if video_file:
-        video_path = os.path.join(folder, video_file.filename)
-        video_file.save(video_path)
-        lesson.video_file = os.path.join("courses", course_name, f"year{year}", video_file.filename)
+        lesson.video_file = store_media_blob(video_file)
 
     if ppt_file:
-        ppt_path = os.path.join(folder, ppt_file.filename)
-        ppt_file.save(ppt_path)
-        lesson.ppt_file = os.path.join("courses", course_name, f"year{year}", ppt_file.filename)
+        lesson.ppt_file = store_media_blob(ppt_file)
 
     db.session.add(lesson)
     db.session.commit()
@@ -1702,10 +3158,139 @@ def upload_course_file():
     return redirect(url_for("manage_courses"))
 
 
+def _lesson_upload_json(upload: LessonUpload, received: int | None = None) -> dict:
+    if upload.status == 'done':
+        # The .part file has moved into media storage
+        received = upload.total_size
+    payload = {
+        'upload_id': upload.id,
+        'lesson_id': upload.lesson_id,
+        'field': upload.field,
+        'filename': upload.filename,
+        'total_size': upload.total_size,
+        'offset': lesson_upload_received(upload) if received is None else received,
+        'max_chunk_size': app.config['LESSON_UPLOAD_MAX_CHUNK_SIZE'],
+        'status': upload.status,
+        'error': upload.error,
+    }
+    if upload.status == 'done':
+        lesson = db.session.get(Lesson, upload.lesson_id)
+        payload['path'] = getattr(lesson, upload.field) if lesson else None
+    return payload
+
+
+@app.route('/admin/uploads', methods=['POST'])
+@login_required
+@admin_only
+def lesson_upload_init():
+    """Start (or pick up again) a resumable upload: {lesson_id, kind: video|slides, filename, size[, sha256]}."""
+    payload = request.get_json(silent=True) or {}
+    try:
+        lesson_id = int(payload.get('lesson_id'))
+        total_size = int(payload.get('size'))
+    except (TypeError, ValueError):
+        return jsonify({'error': 'lesson_id and size are required.'}), 400
+    field = LESSON_MEDIA_FIELDS.get(payload.get('kind'))
+    filename = secure_filename(payload.get('filename') or '')
+    sha256 = (payload.get('sha256') or '').lower() or None
+
+    lesson = db.session.get(Lesson, lesson_id)
+    if lesson is None:
+        return jsonify({'error': 'Lesson not found.'}), 404
+    if field is None or not filename:
+        return jsonify({'error': 'kind (video or slides) and filename are required.'}), 400
+    if not 0 < total_size <= app.config['LESSON_UPLOAD_MAX_SIZE']:
+        return jsonify({'error': f"Files can be at most {app.config['LESSON_UPLOAD_MAX_SIZE']} bytes."}), 400
+    if sha256 and not re.fullmatch(r'[0-9a-f]{64}', sha256):
+        return jsonify({'error': 'sha256 must be 64 hex digits.'}), 400
+
+    # A reloaded page offering the same file continues where it stopped
+    upload = LessonUpload.query.filter_by(
+        lesson_id=lesson.id, field=field, filename=filename, total_size=total_size,
+        sha256=sha256, created_by=g.user.id
+    ).filter(LessonUpload.status != 'done').first()
+    if upload:
+        return jsonify(_lesson_upload_json(upload))
+
+    upload = LessonUpload(
+        id=secrets.token_hex(16), lesson_id=lesson.id, field=field, filename=filename,
+        total_size=total_size, sha256=sha256, created_by=g.user.id
+    )
+    db.session.add(upload)
+    db.session.commit()
+    open(lesson_upload_part_path(upload.id), 'ab').close()
+    return jsonify(_lesson_upload_json(upload, received=0)), 201
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['GET'])
+@login_required
+@admin_only
+def lesson_upload_status(upload_id):
+    """Bytes received so far, and after finalize the status (storing, done or failed) to poll for."""
+    upload = LessonUpload.query.get_or_404(upload_id)
+    return jsonify(_lesson_upload_json(upload))
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['PUT'])
+@login_required
+@admin_only
+def lesson_upload_chunk(upload_id):
+    """Append the raw request body at ?offset=N; an optional X-Chunk-Sha256 header is checked."""
+    upload = LessonUpload.query.get_or_404(upload_id)
+    offset = request.args.get('offset', type=int)
+    if offset is None or offset < 0:
+        return jsonify({'error': 'offset is required.'}), 400
+    if request.content_length is None:
+        return jsonify({'error': 'Content-Length is required.'}), 411
+    if upload.status != 'receiving':
+        return jsonify({'error': 'Upload is already finalized.', 'offset': lesson_upload_received(upload)}), 409
+
+    try:
+        appended, received = append_lesson_upload_chunk(
+            upload, offset, request.stream, request.content_length, request.headers.get('X-Chunk-Sha256')
+        )
+    except ValueError as exc:
+        return jsonify({'error': str(exc), 'offset': lesson_upload_received(upload)}), 400
+    if not appended:
+        return jsonify({'error': 'Offset does not match the bytes received.', 'offset': received}), 409
+    return jsonify(_lesson_upload_json(upload, received=received))
+
+
+@app.route('/admin/uploads/<upload_id>/finalize', methods=['POST'])
+@login_required
+@admin_only
+def lesson_upload_finalize(upload_id):
+    """Queue the finished upload for storage; poll GET /admin/uploads/<id> until status is done or failed."""
+    upload = LessonUpload.query.get_or_404(upload_id)
+    try:
+        queued = finalize_lesson_upload(upload)
+    except ValueError as exc:
+        return jsonify({'error': str(exc), 'offset': lesson_upload_received(upload)}), 400
+    if not queued:
+        return jsonify({'error': 'Upload is busy or already finalized.', 'offset': lesson_upload_received(upload)}), 409
+    return jsonify(_lesson_upload_json(upload)), 202
+
+
+@app.route('/admin/uploads/<upload_id>', methods=['DELETE'])
+@login_required
+@admin_only
+def lesson_upload_abort(upload_id):
+    upload = LessonUpload.query.get_or_404(upload_id)
+    if upload.status == 'storing':
+        return jsonify({'error': 'Upload is being stored; wait until it is done or failed.'}), 409
+    discard_lesson_upload(upload)
+    db.session.commit()
+    return jsonify({'deleted': upload_id})
+
+
 @app.route('/admin/courses/generate', methods=['POST'])
 @login_required
 @admin_only
 def generate_quiz_ajax():
+    """
+    Queue text extraction for the attached slides (or a lesson's stored deck via
+    lesson_id) and return the job to poll; the questions come from the poll.
+    """
     ppt_file = request.files.get('ppt_file') or request.files.get('slides')
     num_questions_raw = request.form.get('num_questions', '3')
 
@@ -1714,24 +3299,76 @@ def generate_quiz_ajax():
     except (TypeError, ValueError):
         num_questions = 3
 
-    if not ppt_file:
+    lesson_id = request.form.get('lesson_id', type=int)
+    lesson = db.session.get(Lesson, lesson_id) if lesson_id and not ppt_file else None
+    if ppt_file:
+        # Copy to a scratch file for the worker process, hashing on the way
+        partial_path = media_blob_partial_path()
+        digest = hashlib.sha256()
+        with open(partial_path, 'wb') as handle:
+            for chunk in iter(lambda: ppt_file.stream.read(MEDIA_BLOB_CHUNK_SIZE), b''):
+                digest.update(chunk)
+                handle.write(chunk)
+        job_id = digest.hexdigest()
+        status = queue_text_extraction(job_id, scratch_path=partial_path,
+                                       extension=os.path.splitext(ppt_file.filename or '')[1])
+    elif lesson and lesson.ppt_file and lesson.ppt_file.startswith(MEDIA_BLOB_PREFIX):
+        job_id = os.path.splitext(os.path.basename(lesson.ppt_file))[0]
+        status = queue_text_extraction(job_id, media_path=lesson.ppt_file)
+    else:
         return jsonify({
             "error": "Please attach slides (PPTX/PDF/TXT) before generating quiz questions."
         }), 400
 
-    raw_text = _extract_text_from_upload(ppt_file)
-    if not raw_text:
+    if status == 'done':
+        # Text cached from an earlier upload of the same file
+        return _quiz_job_response(db.session.get(ExtractedText, job_id), num_questions)
+    return jsonify({
+        "job_id": job_id,
+        "status": status,
+        "poll_url": url_for('generate_quiz_status', job_id=job_id, num_questions=num_questions)
+    }), 202
+
+
+@app.route('/admin/courses/generate/<job_id>')
+@login_required
+@admin_only
+def generate_quiz_status(job_id):
+    """Poll a generate job: 202 while the slides are being read, then the drafted questions."""
+    num_questions = max(1, min(20, request.args.get('num_questions', 3, type=int)))
+    return _quiz_job_response(ExtractedText.query.get_or_404(job_id), num_questions)
+
+
+def _quiz_job_response(extracted: ExtractedText, num_questions: int):
+    job_id = extracted.sha256
+    if extracted.status == 'pending':
+        if _ensure_utc(extracted.updated_at) >= utcnow() - TEXT_EXTRACTION_STALE_AFTER:
+            return jsonify({
+                "job_id": job_id,
+                "status": "pending",
+                "poll_url": url_for('generate_quiz_status', job_id=job_id, num_questions=num_questions)
+            }), 202
+        return jsonify({
+            "status": "failed",
+            "error": "Reading the slides did not finish. Please try generating again."
+        }), 400
+
+    if extracted.status == 'failed' or not extracted.text:
         return jsonify({
+            "status": "failed",
             "error": "We couldn't read any text content from the uploaded file. Please ensure it is a PPTX or PDF with selectable text."
         }), 400
 
-    questions = _build_quiz_from_text(raw_text, requested=num_questions)
+    questions = _build_quiz_from_text(extracted.text, requested=num_questions)
     if not questions:
         return jsonify({
+            "status": "done",
             "error": "Not enough readable content to draft quiz questions. Try adding more detailed slides or enter questions manually."}
         ), 400
 
     return jsonify({
+        "job_id": job_id,
+        "status": "done",
         "questions": questions
     })
 
@@ -1746,6 +3383,29 @@ def admin_dashboard():
     return render_template("admin_dashboard.html")
 
 
+def _collect_exam_metrics():
+    yield GaugeMetricFamily(
+        'albaqi_exam_attempts_in_progress',
+        'Exam attempts currently in progress.',
+        value=ExamAttempt.query.filter_by(status='in-progress').count()
+    )
+
+
+@app.route('/admin/metrics')
+def admin_metrics():
+    """Prometheus scrape endpoint: an admin session or ``Authorization: Bearer <METRICS_TOKEN>``."""
+    token = app.config.get('METRICS_TOKEN')
+    supplied = request.headers.get('Authorization', '')
+    authorized = session.get('role') == 'admin' or (
+        token and hmac.compare_digest(supplied.encode(), f'Bearer {token}'.encode())
+    )
+    if not authorized:
+        abort(403)
+
+    body, content_type = metrics.render_metrics(_collect_exam_metrics)
+    return body, 200, {'Content-Type': content_type, 'Cache-Control': 'no-store'}
+
+
 @app.route('/admin/student-files')
 @login_required
 @admin_only
@@ -1762,9 +3422,8 @@ def admin_student_files():
         files_query = files_query.filter(StudentHubFile.user_id == student_filter)
 
     if course_filter:
-        like_filter = f"%{course_filter.lower()}%"
         files_query = files_query.filter(
-            func.lower(func.coalesce(User.courses, '')).like(like_filter)
+            StudentHubFile.user_id.in_(_enrolled_user_ids(course_filter))
         )
 
     if search_query:
@@ -1777,7 +3436,9 @@ def admin_student_files():
             )
         )
 
-    student_hub_files = files_query.all()
+    student_hub_files = files_query.options(
+        db.selectinload(StudentHubFile.user).selectinload(User.enrollments)
+    ).all()
     students_with_files = sorted(
         User.query.join(StudentHubFile).distinct().all(),
         key=lambda u: (u.full_name or u.username).lower()
@@ -1933,6 +3594,8 @@ def _apply_exam_updates(exam: Exam, exam_data: dict, questions_data: list[dict])
             if question.id not in keep_ids:
                 db.session.delete(question)
 
+        invalidate_exam_analytics(exam.id)
+
 
 def _save_exam_payload(exam: Exam | None, exam_data: dict, questions_data: list[dict] | None) -> Exam:
     if exam is None:
@@ -2015,6 +3678,7 @@ def admin_exam_question_create(exam_id):
         config=data['config']
     )
     db.session.add(question)
+    invalidate_exam_analytics(exam.id)
     db.session.commit()
 
     return jsonify({'success': True, 'question': _serialize_exam_question(question)})
@@ -2038,6 +3702,7 @@ def admin_exam_question_update(exam_id, question_id):
         question.order_index = int(data['order_index'])
     question.config = data['config']
 
+    invalidate_exam_analytics(exam.id)
     db.session.commit()
 
     return jsonify({'success': True, 'question': _serialize_exam_question(question)})
@@ -2050,6 +3715,7 @@ def admin_exam_question_delete(exam_id, question_id):
     exam = Exam.query.get_or_404(exam_id)
     question = ExamQuestion.query.filter_by(exam_id=exam.id, id=question_id).first_or_404()
     db.session.delete(question)
+    invalidate_exam_analytics(exam.id)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -2074,6 +3740,7 @@ def admin_exam_question_reorder(exam_id):
             continue
         question.order_index = index
 
+    invalidate_exam_analytics(exam.id)
     db.session.commit()
     return jsonify({'success': True})
 
@@ -2089,62 +3756,175 @@ def admin_exam_update(exam_id):
     return jsonify({'success': True, 'exam_id': exam.id})
 
 
+# -------------------- Admin Exam Results -------------------- #
+EXAM_RESULTS_PAGE_SIZE = 50
+EXAM_RESULTS_MAX_PAGE_SIZE = 200
+
+def invalidate_exam_analytics(exam_id: int) -> None:
+    """Bump an exam's analytics_version in SQL; the next read recomputes its cached analytics."""
+    exam_table = Exam.__table__
+    db.session.execute(
+        exam_table.update()
+        .where(exam_table.c.id == exam_id)
+        .values(analytics_version=func.coalesce(exam_table.c.analytics_version, 0) + 1)
+    )
+    exam = db.session.identity_map.get(db.inspect(Exam).identity_key_from_primary_key((exam_id,)))
+    if exam is not None:
+        db.session.expire(exam, ['analytics_version'])
+
+
+def _compute_exam_results_analytics(exam: 'Exam') -> dict:
+    attempt_rows = db.session.query(
+        ExamAttempt.id,
+        ExamAttempt.status,
+        ExamAttempt.score,
+        ExamAttempt.max_score,
+        ExamAttempt.duration_seconds,
+        ExamAttempt.passed
+    ).filter(ExamAttempt.exam_id == exam.id).all()
+
+    answer_rows = db.session.query(
+        ExamAnswer.attempt_id,
+        ExamAnswer.question_id,
+        ExamAnswer.is_correct,
+        ExamAnswer.response_data
+    ).join(ExamQuestion).filter(ExamQuestion.exam_id == exam.id).all()
+
+    questions = [
+        {
+            'id': question.id,
+            'text': question.text,
+            'question_type': question.question_type,
+            'options': question.options,
+            'correct_answers': question.correct_answers
+        }
+        for question in exam.questions
+    ]
+    return compute_exam_analytics(attempt_rows, answer_rows, questions)
+
+
+def exam_results_analytics(exam: 'Exam') -> dict:
+    """Summary, item analysis and score distribution for an exam, from ExamStatisticsCache when fresh."""
+    # Read the version before computing: an invalidation that lands mid-compute
+    # leaves the stored row behind the exam, so the next read recomputes it
+    version = exam.analytics_version or 0
+    cached = db.session.get(ExamStatisticsCache, exam.id)
+    if cached and cached.version == version:
+        return cached.payload
+
+    payload = _compute_exam_results_analytics(exam)
+    if cached:
+        cached.payload = payload
+        cached.version = version
+        cached.computed_at = utcnow()
+    else:
+        db.session.add(ExamStatisticsCache(exam_id=exam.id, payload=payload, version=version))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another request stored the same computation first
+        db.session.rollback()
+    return payload
+
+
+def _filtered_exam_attempts(exam_id: int, args):
+    """Apply the results page filters (status, passed, needs_grading) to an exam's attempts."""
+    query = ExamAttempt.query.filter(ExamAttempt.exam_id == exam_id)
+
+    status = (args.get('status') or '').strip()
+    if status:
+        query = query.filter(ExamAttempt.status == status)
+
+    passed = (args.get('passed') or '').strip().lower()
+    if passed in {'true', '1', 'yes'}:
+        query = query.filter(ExamAttempt.passed == True)  # noqa: E712
+    elif passed in {'false', '0', 'no'}:
+        query = query.filter(ExamAttempt.passed == False)  # noqa: E712
+    elif passed == 'pending':
+        query = query.filter(ExamAttempt.passed.is_(None))
+
+    if (args.get('needs_grading') or '').strip().lower() in {'true', '1', 'yes'}:
+        query = query.filter(ExamAttempt.answers.any(ExamAnswer.is_correct.is_(None)))
+
+    return query
+
+
 @app.route('/admin/exams/results/<int:exam_id>')
 @login_required
 @admin_only
 def admin_exam_results(exam_id):
     exam = Exam.query.get_or_404(exam_id)
-    attempts = ExamAttempt.query.filter_by(exam_id=exam.id).order_by(ExamAttempt.start_time.desc()).all()
-    analytics = _exam_statistics(exam.id)
-
-    question_map = {
-        question.id: question
-        for question in exam.questions
-    }
-
-    if question_map:
-        question_stats = db.session.query(
-            ExamAnswer.question_id,
-            func.count(ExamAnswer.id).label('total'),
-            func.sum(case((ExamAnswer.is_correct == True, 1), else_=0)).label('correct')  # noqa: E712
-        ).filter(
-            ExamAnswer.question_id.in_(question_map.keys())
-        ).group_by(ExamAnswer.question_id).all()
-    else:
-        question_stats = []
-
-    question_analytics = []
-    for row in question_stats:
-        question = question_map.get(row.question_id)
-        total = int(row.total or 0)
-        correct = int(row.correct or 0)
-        question_analytics.append({
-            'question': question,
-            'total': total,
-            'correct': correct,
-            'incorrect': total - correct
-        })
-
-    attempts_payload = [_admin_attempt_payload(attempt) for attempt in attempts]
+    results_analytics = exam_results_analytics(exam)
+    status_options = [
+        row[0] for row in db.session.query(ExamAttempt.status).filter(
+            ExamAttempt.exam_id == exam.id,
+            ExamAttempt.status != None  # noqa: E711
+        ).distinct().order_by(ExamAttempt.status).all()
+    ]
 
     return render_template(
         'admin_exam_results.html',
         exam=exam,
         course=exam.course,
-        analytics=analytics,
-        attempts=attempts,
-        attempts_payload=attempts_payload,
-        question_analytics=question_analytics
+        analytics=results_analytics['analytics'],
+        question_analytics=results_analytics['question_analytics'],
+        score_distribution=results_analytics['score_distribution'],
+        status_options=status_options,
+        page_size=EXAM_RESULTS_PAGE_SIZE
     )
 
 
+@app.route('/admin/exams/results/<int:exam_id>/attempts')
+@login_required
+@admin_only
+def admin_exam_results_attempts(exam_id):
+    """
+    One page of an exam's attempts, newest first.
+    Pass the returned next_cursor as ?after= to fetch the following page.
+    """
+    exam = Exam.query.get_or_404(exam_id)
+    limit = request.args.get('limit', EXAM_RESULTS_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, EXAM_RESULTS_MAX_PAGE_SIZE))
+    after = request.args.get('after', type=int)
+
+    query = _filtered_exam_attempts(exam.id, request.args)
+    if after:
+        query = query.filter(ExamAttempt.id < after)
+
+    attempts = query.options(
+        db.joinedload(ExamAttempt.user),
+        db.selectinload(ExamAttempt.answers)
+    ).order_by(ExamAttempt.id.desc()).limit(limit + 1).all()
+
+    has_more = len(attempts) > limit
+    attempts = attempts[:limit]
+    # exam.questions is loaded once and shared by every payload on the page
+    return jsonify({
+        'attempts': [_admin_attempt_payload(attempt) for attempt in attempts],
+        'next_cursor': attempts[-1].id if has_more else None
+    })
+
+
+@app.route('/admin/exams/results/<int:exam_id>/analytics')
+@login_required
+@admin_only
+def admin_exam_results_analytics(exam_id):
+    exam = Exam.query.get_or_404(exam_id)
+    # Every change to attempts or questions bumps the version, so it validates the payload
+    etag = _etag_for('exam_analytics', exam.id, exam.analytics_version)
+    not_modified = _not_modified(etag)
+    if not_modified:
+        return not_modified
+    return _with_etag(jsonify(exam_results_analytics(exam)), etag)
+
+
 @app.route('/admin/exams/attempts/<int:attempt_id>')
 @login_required
 @admin_only
 def admin_exam_attempt_detail(attempt_id):
     attempt = ExamAttempt.query.get_or_404(attempt_id)
     payload = _admin_attempt_payload(attempt)
-    return jsonify({'attempt': payload})
+    return _conditional_json({'attempt': payload})
 
 
 @app.route('/admin/exams/attempts/<int:attempt_id>/grade', methods=['POST'])
@@ -2184,6 +3964,7 @@ def admin_exam_attempt_grade(attempt_id):
 
     _compute_attempt_score(attempt)
     attempt.status = target_status
+    invalidate_exam_analytics(attempt.exam_id)
 
     db.session.commit()
 
@@ -2192,8 +3973,10 @@ def admin_exam_attempt_grade(attempt_id):
 @login_required
 @admin_only
 def admin_users():
-    users = User.query.order_by(User.id).all()
+    users = User.query.options(db.selectinload(User.enrollments)).order_by(User.id).all()
     courses = Course.query.order_by(Course.year, Course.name).all()
+    # The access matrix calls course.user_has_access per cell; load it up front
+    preload_course_entitlements([user.id for user in users])
     return render_template("admin_users.html", users=users, courses=courses)
 
 
@@ -2225,7 +4008,7 @@ def admin_email():
         course_name = request.form.get('course_filter', '').strip().lower()
         if course_name:
             recipients = User.query.filter(
-                func.lower(User.courses).like(f'%{course_name}%')
+                User.id.in_(_enrolled_user_ids(course_name))
             ).all()
     elif recipient_type == 'selected':
         user_ids = request.form.getlist('user_ids[]')
@@ -2252,6 +4035,7 @@ def admin_email():
         html_body=message_html,
         text_body=None
     )
+    metrics.record_email('bulk', sent=success_count, failed=len(recipient_emails) - success_count)
 
     flash(f'Successfully queued {success_count} emails out of {len(recipient_emails)} recipients', 'success')
     return redirect(url_for('admin_email'))
@@ -2263,8 +4047,7 @@ def admin_email():
 def admin_test_email():
     """Send test email to admin"""
     if request.method == 'GET':
-        admin_user = User.query.filter_by(username=session['user']).first()
-        return render_template('admin_test_email.html', admin_email=admin_user.email if admin_user else '')
+        return render_template('admin_test_email.html', admin_email=g.user.email if g.user else '')
 
     # POST: Send test email
     test_email = request.form.get('email', '').strip()
@@ -2286,6 +4069,7 @@ def admin_test_email():
         html_body=html_body,
         async_send=False
     )
+    metrics.record_email('test', sent=int(bool(success)), failed=int(not success))
 
     if success:
         flash(f'Test email sent to {test_email}', 'success')
@@ -2325,26 +4109,97 @@ def admin_terms():
     return redirect(url_for('admin_terms'))
 
 
+# -------------------- User Tracking Loader -------------------- #
+def _load_json_list(raw: str | None) -> list:
+    try:
+        return json.loads(raw) if raw else []
+    except (TypeError, json.JSONDecodeError):
+        return []
+
+
+def _course_label(course: 'Course') -> str:
+    return f"{course.name.title()} (Year {course.year})"
+
+
+class UserTrackingLoader:
+    """
+    Bulk-loads the rows behind admin_user_tracking: every referenced lesson
+    and course is fetched with one query each, and retake attempts once.
+    Answer blobs are left unparsed; they are served per row on demand.
+    """
+
+    def __init__(self, user: User):
+        self.user = user
+        self.assigned_names = {enrollment.name_key for enrollment in user.enrollments}
+        self.progress_records = {record.course_id: record for record in user.course_progress}
+        self.quiz_attempts = QuizAttempt.query.filter_by(user_id=user.id).all()
+        self.retake_attempts = QuizRetakeAttempt.query.filter_by(
+            user_id=user.id
+        ).order_by(QuizRetakeAttempt.created_at.desc()).all()
+        self.agreements = CourseAgreement.query.filter_by(
+            user_id=user.id
+        ).order_by(CourseAgreement.accepted_at.desc()).all()
+
+        lesson_ids = {attempt.lesson_id for attempt in self.quiz_attempts}
+        lesson_ids.update(attempt.lesson_id for attempt in self.retake_attempts if attempt.lesson_id)
+        self.lessons = {}
+        if lesson_ids:
+            self.lessons = {
+                lesson.id: lesson
+                for lesson in Lesson.query.filter(Lesson.id.in_(lesson_ids)).all()
+            }
+
+        course_ids = set(self.progress_records)
+        course_ids.update(attempt.course_id for attempt in self.retake_attempts)
+        course_ids.update(agreement.course_id for agreement in self.agreements)
+        course_ids.update(lesson.course_id for lesson in self.lessons.values())
+        course_ids.discard(None)
+        course_filters = []
+        if course_ids:
+            course_filters.append(Course.id.in_(course_ids))
+        if self.assigned_names:
+            course_filters.append(func.lower(Course.name).in_(self.assigned_names))
+        self.courses = {}
+        if course_filters:
+            self.courses = {course.id: course for course in Course.query.filter(or_(*course_filters)).all()}
+
+        # Assigned by name: matched once, reused for the progress and agreement tables
+        self.assigned_courses = [
+            course for course in self.courses.values()
+            if course.name.lower() in self.assigned_names
+        ]
+
+        # Only needed for attempts saved before total_questions was recorded
+        missing_totals = {
+            attempt.lesson_id for attempt in self.quiz_attempts
+            if not attempt.total_questions and attempt.lesson_id in self.lessons
+        }
+        self.quiz_counts = {}
+        if missing_totals:
+            self.quiz_counts = dict(db.session.query(
+                Quiz.lesson_id, func.count(Quiz.id)
+            ).filter(Quiz.lesson_id.in_(missing_totals)).group_by(Quiz.lesson_id).all())
+
+    def course(self, course_id: int | None):
+        return self.courses.get(course_id) if course_id else None
+
+    def lesson(self, lesson_id: int | None):
+        return self.lessons.get(lesson_id) if lesson_id else None
+
+
 @app.route('/admin/users/<int:user_id>/tracking')
 @login_required
 @admin_only
 def admin_user_tracking(user_id):
     user = User.query.get_or_404(user_id)
-
-    assigned_courses = set(filter(None, (course_name.strip().lower() for course_name in user.get_courses())))
-    progress_records = {record.course_id: record for record in user.course_progress}
+    loader = UserTrackingLoader(user)
 
     tracked_courses = []
-    if assigned_courses:
-        course_candidates = Course.query.filter(func.lower(Course.name).in_(assigned_courses)).order_by(Course.year, Course.name).all()
-    else:
-        course_candidates = []
-
     seen_course_ids = set()
-    for course in course_candidates:
-        progress_record = progress_records.get(course.id)
+    for course in sorted(loader.assigned_courses, key=lambda c: (c.year, c.name)):
+        progress_record = loader.progress_records.get(course.id)
         completed_weeks = max(((progress_record.progress if progress_record else 1) - 1), 0)
-        total_lessons = len(course.lessons)
+        total_lessons = course.lesson_count or 0
         tracked_courses.append({
             "course": course,
             "progress": progress_record,
@@ -2354,12 +4209,12 @@ def admin_user_tracking(user_id):
         })
         seen_course_ids.add(course.id)
 
-    for record in progress_records.values():
+    for record in loader.progress_records.values():
         if record.course_id in seen_course_ids:
             continue
-        course = record.course
+        course = loader.course(record.course_id)
         completed_weeks = max((record.progress - 1), 0)
-        total_lessons = len(course.lessons) if course else 0
+        total_lessons = (course.lesson_count or 0) if course else 0
         tracked_courses.append({
             "course": course,
             "progress": record,
@@ -2373,32 +4228,24 @@ def admin_user_tracking(user_id):
         row["course"].name if row["course"] else ""
     ))
 
-    quiz_attempts = QuizAttempt.query.filter_by(user_id=user.id).all()
     quiz_rows = []
-    for attempt in quiz_attempts:
-        lesson = attempt.lesson or _fetch_lesson(attempt.lesson_id)
-        course = lesson.course if lesson else _fetch_course(attempt.course_id)
-        try:
-            detail_data = json.loads(attempt.detail_json) if attempt.detail_json else []
-        except (TypeError, json.JSONDecodeError):
-            detail_data = []
-        wrong_details = [item for item in detail_data if not item.get('is_correct')]
-        total_questions = attempt.total_questions or (len(lesson.quizzes) if lesson else 0)
+    for attempt in loader.quiz_attempts:
+        lesson = loader.lesson(attempt.lesson_id)
+        course = loader.course(lesson.course_id) if lesson else None
+        total_questions = attempt.total_questions or (loader.quiz_counts.get(lesson.id, 0) if lesson else 0)
         score_percent = 0
         if total_questions:
             score_percent = round((attempt.last_score / total_questions) * 100)
         course_label = "Unknown course"
         quiz_label = lesson.title if lesson else f"Quiz #{attempt.id}"
         if course:
-            course_label = f"{course.name.title()} (Year {course.year})"
+            course_label = _course_label(course)
             quiz_label = f"Week {lesson.week}: {lesson.title}" if lesson else quiz_label
         quiz_rows.append({
             "attempt": attempt,
             "lesson": lesson,
             "course": course,
             "score_percent": score_percent,
-            "wrong_details": wrong_details,
-            "detail_data": detail_data,
             "course_label": course_label,
             "quiz_label": quiz_label,
             "total_questions": total_questions
@@ -2414,13 +4261,11 @@ def admin_user_tracking(user_id):
     revision_lesson_filter = request.args.get('revision_lesson_id', type=int)
     revision_sort = request.args.get('revision_sort', 'recent')
 
-    all_retake_attempts = QuizRetakeAttempt.query.filter_by(user_id=user.id).all()
-
     course_revision_summary = {}
     lesson_options_map = {}
-    for attempt in all_retake_attempts:
-        course_ref = attempt.course or _fetch_course(attempt.course_id)
-        lesson_ref = attempt.lesson or _fetch_lesson(attempt.lesson_id)
+    for attempt in loader.retake_attempts:
+        course_ref = loader.course(attempt.course_id)
+        lesson_ref = loader.lesson(attempt.lesson_id)
         summary_entry = course_revision_summary.setdefault(attempt.course_id, {
             "course": course_ref,
             "count": 0
@@ -2429,13 +4274,11 @@ def admin_user_tracking(user_id):
         if course_ref and lesson_ref:
             lesson_options_map.setdefault(course_ref.id, {})[lesson_ref.id] = lesson_ref
 
-    retake_query = QuizRetakeAttempt.query.filter_by(user_id=user.id)
-    if revision_course_filter:
-        retake_query = retake_query.filter_by(course_id=revision_course_filter)
-    if revision_lesson_filter:
-        retake_query = retake_query.filter_by(lesson_id=revision_lesson_filter)
-
-    retake_attempts = retake_query.order_by(QuizRetakeAttempt.created_at.desc()).all()
+    retake_attempts = [
+        attempt for attempt in loader.retake_attempts
+        if (not revision_course_filter or attempt.course_id == revision_course_filter)
+        and (not revision_lesson_filter or attempt.lesson_id == revision_lesson_filter)
+    ]
 
     if revision_sort == 'score_desc':
         retake_attempts.sort(key=lambda a: (a.score / (a.total_questions or 1), a.created_at or datetime.min), reverse=True)
@@ -2446,28 +4289,17 @@ def admin_user_tracking(user_id):
 
     retake_rows = []
     for attempt in retake_attempts:
-        course_ref = attempt.course or _fetch_course(attempt.course_id)
-        lesson_ref = attempt.lesson or _fetch_lesson(attempt.lesson_id)
-        answers_data = []
-        wrong_data = []
-        if attempt.is_complete:
-            try:
-                answers_data = json.loads(attempt.answers_json) if attempt.answers_json else []
-            except (TypeError, json.JSONDecodeError):
-                answers_data = []
-            try:
-                wrong_data = json.loads(attempt.wrong_questions_json) if attempt.wrong_questions_json else []
-            except (TypeError, json.JSONDecodeError):
-                wrong_data = []
         score_percent = 0
         if attempt.total_questions:
             score_percent = round((attempt.score / attempt.total_questions) * 100)
+        wrong_count = 0
+        if attempt.is_complete:
+            wrong_count = max((attempt.total_questions or 0) - (attempt.score or 0), 0)
         retake_rows.append({
             "attempt": attempt,
-            "course": course_ref,
-            "lesson": lesson_ref,
-            "answers": answers_data,
-            "wrongs": wrong_data,
+            "course": loader.course(attempt.course_id),
+            "lesson": loader.lesson(attempt.lesson_id),
+            "wrong_count": wrong_count,
             "score_percent": score_percent
         })
 
@@ -2501,9 +4333,9 @@ def admin_user_tracking(user_id):
             "label": f"Uploaded {upload.original_name}",
             "icon": "📁"
         })
-    for attempt in all_retake_attempts:
+    for attempt in loader.retake_attempts:
         if attempt.created_at:
-            lesson_ref = _fetch_lesson(attempt.lesson_id)
+            lesson_ref = loader.lesson(attempt.lesson_id)
             if lesson_ref:
                 lesson_label = f"Week {lesson_ref.week}: {lesson_ref.title}"
             else:
@@ -2514,39 +4346,26 @@ def admin_user_tracking(user_id):
                 "icon": "📝"
             })
 
-    agreements = CourseAgreement.query.filter_by(user_id=user.id).order_by(CourseAgreement.accepted_at.desc()).all()
     agreement_rows = []
-    agreements_by_course_id = {agreement.course_id: agreement for agreement in agreements}
-
-    allowed_course_names = {
-        name.strip().lower()
-        for name in user.get_courses()
-        if name and name.strip()
-    }
-
-    course_candidates = []
-    if allowed_course_names:
-        course_candidates = Course.query.filter(
-            func.lower(Course.name).in_(allowed_course_names)
-        ).order_by(Course.name.asc(), Course.year.asc()).all()
+    agreements_by_course_id = {agreement.course_id: agreement for agreement in loader.agreements}
 
     seen_course_ids: set[int] = set()
-    for course_ref in course_candidates:
+    for course_ref in loader.assigned_courses:
         agreement = agreements_by_course_id.get(course_ref.id)
         seen_course_ids.add(course_ref.id)
         agreement_rows.append({
             "course": course_ref,
-            "course_label": f"{course_ref.name.title()} (Year {course_ref.year})",
+            "course_label": _course_label(course_ref),
             "accepted_at": agreement.accepted_at if agreement else None,
             "accepted": agreement is not None
         })
 
-    for agreement in agreements:
+    for agreement in loader.agreements:
         if agreement.course_id not in seen_course_ids:
-            course_ref = agreement.course or _fetch_course(agreement.course_id)
+            course_ref = loader.course(agreement.course_id)
             label = None
             if course_ref:
-                label = f"{course_ref.name.title()} (Year {course_ref.year})"
+                label = _course_label(course_ref)
             else:
                 label = f"Course #{agreement.course_id}"
             agreement_rows.append({
@@ -2556,8 +4375,8 @@ def admin_user_tracking(user_id):
                 "accepted": True
             })
 
-    unmatched_names = allowed_course_names - {
-        course.name.strip().lower() for course in course_candidates
+    unmatched_names = loader.assigned_names - {
+        course.name.strip().lower() for course in loader.assigned_courses
     }
     for name_value in sorted(unmatched_names):
         agreement_rows.append({
@@ -2595,6 +4414,23 @@ def admin_user_tracking(user_id):
     )
 
 
+@app.route('/admin/users/<int:user_id>/tracking/answers/<string:kind>/<int:attempt_id>')
+@login_required
+@admin_only
+def admin_user_tracking_answers(user_id, kind, attempt_id):
+    """Wrong answers for one quiz or revision attempt, loaded when its row is expanded."""
+    if kind == 'quiz':
+        attempt = QuizAttempt.query.filter_by(id=attempt_id, user_id=user_id).first_or_404()
+        wrong_items = [item for item in _load_json_list(attempt.detail_json) if not item.get('is_correct')]
+    elif kind == 'revision':
+        attempt = QuizRetakeAttempt.query.filter_by(id=attempt_id, user_id=user_id).first_or_404()
+        wrong_items = _load_json_list(attempt.wrong_questions_json) if attempt.is_complete else []
+    else:
+        abort(404)
+
+    return render_template("admin_tracking_answers.html", kind=kind, wrong_items=wrong_items)
+
+
 @app.route('/admin/users/<int:user_id>/tracking/reset/<int:lesson_id>', methods=['POST'])
 @login_required
 @admin_only
@@ -2683,7 +4519,7 @@ def admin_force_pass_quiz(user_id, lesson_id):
 @admin_only
 def admin_student_hub_delete(file_id):
     file_record = StudentHubFile.query.get_or_404(file_id)
-    _remove_student_hub_file_from_disk(file_record)
+    _remove_student_hub_file_from_storage(file_record)
     db.session.delete(file_record)
     db.session.commit()
     flash("🗑 Student Hub file deleted.")
@@ -2805,6 +4641,8 @@ def admin_add_user():
 @admin_only
 def delete_lesson(lesson_id):
     lesson = Lesson.query.get_or_404(lesson_id)
+    for upload in LessonUpload.query.filter_by(lesson_id=lesson.id):
+        discard_lesson_upload(upload)
     db.session.delete(lesson)
     db.session.commit()
     flash("🗑 Lesson deleted")
@@ -2818,7 +4656,7 @@ def delete_user(user_id):
     user = User.query.get_or_404(user_id)
 
     # Prevent deleting yourself
-    if user.username == session.get("user"):
+    if user.id == g.user.id:
         flash("⚠️ You cannot delete your own account while logged in.")
         redirect_target = request.form.get('redirect')
         if redirect_target and redirect_target.startswith('/'):
@@ -3130,7 +4968,7 @@ def delete_subscription_plan(plan_id):
 @app.route('/profile', methods=['GET', 'POST'])
 @login_required
 def profile():
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if request.method == 'POST':
         action = request.form.get("action")
@@ -3185,47 +5023,43 @@ def profile():
     return render_template("profile.html", user=user)
 
 
-@app.route('/stats')
-@login_required
-def stats():
-    """User stats dashboard showing lessons and courses completed."""
-    user = User.query.filter_by(username=session['user']).first()
-
-    # Count total lessons the user has viewed (based on progress records)
-    lessons_completed = UserCourseProgress.query.filter_by(user_id=user.id).count()
-
-    # Get all courses and count how many the user has completed
-    # A course is considered "completed" if the user's progress >= total lessons in that course
-    all_courses = Course.query.all()
-    courses_completed = 0
-    total_courses = len(all_courses)
-
-    for course in all_courses:
-        total_lessons_in_course = Lesson.query.filter_by(course_id=course.id).count()
-        user_progress = UserCourseProgress.query.filter_by(
-            user_id=user.id,
-            course_id=course.id
-        ).first()
-
-        if user_progress and user_progress.progress > total_lessons_in_course:
-            courses_completed += 1
+# -------------------- User Stats -------------------- #
+def build_user_stats(user_id: int) -> dict:
+    """
+    Lesson, course, quiz and exam figures for the stats dashboard.
+    Uses a fixed number of aggregate queries regardless of catalogue size.
+    """
+    # A course is considered "completed" if the user's progress is past its last lesson
+    lessons_completed, courses_completed = db.session.query(
+        func.count(UserCourseProgress.id),
+        func.sum(case((
+            (Course.id != None) & (UserCourseProgress.progress > func.coalesce(Course.lesson_count, 0)),  # noqa: E711
+            1
+        ), else_=0))
+    ).outerjoin(Course, Course.id == UserCourseProgress.course_id).filter(
+        UserCourseProgress.user_id == user_id
+    ).one()
 
-    # Calculate total lessons across all courses
-    total_lessons = Lesson.query.count()
+    total_courses, total_lessons = db.session.query(
+        func.count(Course.id),
+        func.coalesce(func.sum(Course.lesson_count), 0)
+    ).one()
 
-    # Quiz statistics
-    total_quiz_attempts = QuizAttempt.query.filter_by(user_id=user.id).count()
-    passed_quizzes = QuizAttempt.query.filter_by(user_id=user.id, passed=True).count()
+    total_quiz_attempts, passed_quizzes = db.session.query(
+        func.count(QuizAttempt.id),
+        func.sum(case((QuizAttempt.passed == True, 1), else_=0))  # noqa: E712
+    ).filter(QuizAttempt.user_id == user_id).one()
 
-    # Exam statistics
     exam_attempts = (
         ExamAttempt.query
-        .filter_by(user_id=user.id)
+        .options(
+            db.joinedload(ExamAttempt.exam).joinedload(Exam.course),
+            db.joinedload(ExamAttempt.course)
+        )
+        .filter_by(user_id=user_id)
         .order_by(ExamAttempt.end_time.desc(), ExamAttempt.start_time.desc())
         .all()
     )
-    total_exam_attempts = len(exam_attempts)
-    passed_exams = sum(1 for attempt in exam_attempts if attempt.passed is True)
 
     exam_percentages = []
     exam_details = []
@@ -3245,20 +5079,26 @@ def stats():
 
     avg_exam_percentage = round(sum(exam_percentages) / len(exam_percentages), 1) if exam_percentages else None
 
-    return render_template(
-        "user/stats.html",
-        user=user,
-        lessons_completed=lessons_completed,
-        total_lessons=total_lessons,
-        courses_completed=courses_completed,
-        total_courses=total_courses,
-        total_quiz_attempts=total_quiz_attempts,
-        passed_quizzes=passed_quizzes,
-        total_exam_attempts=total_exam_attempts,
-        passed_exams=passed_exams,
-        avg_exam_percentage=avg_exam_percentage,
-        exam_details=exam_details
-    )
+    return {
+        'lessons_completed': lessons_completed or 0,
+        'total_lessons': int(total_lessons or 0),
+        'courses_completed': int(courses_completed or 0),
+        'total_courses': total_courses or 0,
+        'total_quiz_attempts': total_quiz_attempts or 0,
+        'passed_quizzes': int(passed_quizzes or 0),
+        'total_exam_attempts': len(exam_attempts),
+        'passed_exams': sum(1 for attempt in exam_attempts if attempt.passed is True),
+        'avg_exam_percentage': avg_exam_percentage,
+        'exam_details': exam_details
+    }
+
+
+@app.route('/stats')
+@login_required
+def stats():
+    """User stats dashboard showing lessons and courses completed."""
+    user = g.user
+    return render_template("user/stats.html", user=user, **build_user_stats(user.id))
 
 
 # -------------------- Testimonials / Reviews -------------------- #
@@ -3266,7 +5106,7 @@ def stats():
 @login_required
 def submit_review(course_id):
     """Student review submission form - only accessible if course is marked as finished."""
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.get_or_404(course_id)
 
     # Check if user has finished this course
@@ -3329,7 +5169,7 @@ def submit_review(course_id):
 @app.route("/qa")
 @login_required
 def qa_dashboard():
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     questions = Question.query.filter_by(user_id=user.id).all()
     return render_template("qa_user.html", questions=questions)
 
@@ -3338,7 +5178,7 @@ def qa_dashboard():
 def new_question():
     title = request.form.get("title")
     is_public = True if request.form.get("is_public") == "on" else False
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     q = Question(user_id=user.id, title=title, is_public=is_public)
     db.session.add(q)
     db.session.commit()
@@ -3349,7 +5189,7 @@ def new_question():
 @login_required
 def send_message(question_id):
     body = request.form.get("body")
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     q = Question.query.get_or_404(question_id)
     if q.user_id != user.id:
         flash("⚠️ Not your question.")
@@ -3363,7 +5203,7 @@ def send_message(question_id):
 @login_required
 def user_delete_message(message_id):
     msg = Message.query.get_or_404(message_id)
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     # only allow the owner of the question to delete their messages
     if msg.sender != "user" or msg.question.user_id != user.id:
@@ -3379,7 +5219,7 @@ def user_delete_message(message_id):
 @login_required
 def user_toggle_question(question_id):
     q = Question.query.get_or_404(question_id)
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if q.user_id != user.id:
         flash("⚠️ You can only change visibility for your own questions.")
@@ -3394,7 +5234,7 @@ def user_toggle_question(question_id):
 @login_required
 def user_delete_question(question_id):
     q = Question.query.get_or_404(question_id)
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if q.user_id != user.id:
         flash("⚠️ You can only delete your own questions.")
@@ -3549,7 +5389,12 @@ def edit_course(course_id):
 
     # Validate parent_id if sub_course
     if course.course_type == "sub_course" and parent_id:
-        course.parent_id = int(parent_id)
+        new_parent = db.session.get(Course, int(parent_id))
+        if new_parent is None or new_parent.id == course.id or new_parent.is_descendant_of(course):
+            db.session.rollback()
+            flash("⚠️ A course can't be placed under itself or one of its own sub-courses.")
+            return redirect(url_for('manage_courses'))
+        course.parent_id = new_parent.id
     else:
         course.parent_id = None
 
@@ -3589,14 +5434,15 @@ def course_required(course_name):
     def decorator(f):
         @wraps(f)
         def decorated_function(*args, **kwargs):
-            user = User.query.filter_by(username=session['user']).first()
+            user = g.user
+            entitlements = get_course_entitlements(user.id)
 
             # Check access via new hierarchy system or legacy system
             course = Course.query.filter_by(name=course_name).first()
             if course:
-                has_access = course.user_has_access(user.id) or course_name in user.get_courses()
+                has_access = entitlements.can_access(course)
             else:
-                has_access = course_name in user.get_courses()
+                has_access = entitlements.has_legacy_name(course_name)
 
             if not has_access and user.role != 'admin':
                 flash("⚠️ You don't have access to this course.")
@@ -3610,12 +5456,12 @@ def course_required(course_name):
 @app.route('/submit_quiz/<int:lesson_id>', methods=['POST'])
 @login_required
 def submit_quiz(lesson_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     lesson = Lesson.query.get_or_404(lesson_id)
     course = lesson.course  # get related course
 
     # 🔒 Ensure user has access to this course (check both new hierarchy system and legacy)
-    has_access = course.user_has_access(user.id) or course.name in user.get_courses()
+    has_access = get_course_entitlements(user.id).can_access(course)
     if not has_access and user.role != 'admin':
         flash("⚠️ You don't have access to this course.")
         return redirect(url_for('courses_dashboard'))
@@ -3723,7 +5569,7 @@ def submit_quiz(lesson_id):
 @app.route('/courses/<int:course_id>/quiz-retake/save', methods=['POST'])
 @login_required
 def course_quiz_retake_save(course_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.get_or_404(course_id)
 
     payload = request.get_json(silent=True) or {}
@@ -3777,11 +5623,11 @@ def course_quiz_retake_save(course_id):
 @app.route('/course/<string:course_name>/<int:year>/agreement', methods=['POST'])
 @login_required
 def accept_course_agreement(course_name, year):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.filter_by(name=course_name, year=year).first_or_404()
 
     # Check access via new hierarchy system or legacy system
-    has_access = course.user_has_access(user.id) or course.name in user.get_courses()
+    has_access = get_course_entitlements(user.id).can_access(course)
     if user.role != 'admin' and not has_access:
         return jsonify({"accepted": False, "message": "Access denied."}), 403
 
@@ -3800,11 +5646,11 @@ def accept_course_agreement(course_name, year):
 @app.route('/courses/<int:course_id>/quiz-retake', methods=['GET', 'POST'])
 @login_required
 def course_quiz_retake(course_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.get_or_404(course_id)
 
     # Check access via new hierarchy system or legacy system
-    has_access = course.user_has_access(user.id) or course.name in user.get_courses()
+    has_access = get_course_entitlements(user.id).can_access(course)
 
     if not has_access:
         # Fallback: check if user has progress record (legacy support)
@@ -4178,101 +6024,202 @@ def course_quiz_retake(course_id):
         resume_prompt_attempt=resume_prompt_attempt
     )
 
-@app.route('/courses')
-@login_required
-def courses_dashboard():
-    user = User.query.filter_by(username=session['user']).first()
-    allowed_courses = user.get_courses()
-
-    # ✅ Get published courses grouped by assignment
-    # Helper function to calculate course progress
-    def get_course_data(course):
-        has_access = course.user_has_access(user.id) or course.name in allowed_courses
-        is_free = course.is_free()
-        requires_approval = False  # Can be extended later for approval-required courses
-
-        # Calculate progress if user has access
-        progress_percent = 0
-        is_started = False
-        progress_record = None
-        if has_access or is_free:
-            progress_record = UserCourseProgress.query.filter_by(
-                user_id=user.id,
-                course_id=course.id
-            ).first()
+# -------------------- Course Unlock State -------------------- #
+def latest_exam_attempts(user_id: int, exam_ids) -> dict:
+    """Return {exam_id: latest ExamAttempt} for one user with a single windowed query."""
+    exam_ids = list(exam_ids)
+    if not exam_ids:
+        return {}
+
+    ranked = db.session.query(
+        ExamAttempt.id.label('attempt_id'),
+        func.row_number().over(
+            partition_by=ExamAttempt.exam_id,
+            order_by=(ExamAttempt.start_time.desc(), ExamAttempt.id.desc())
+        ).label('position')
+    ).filter(
+        ExamAttempt.user_id == user_id,
+        ExamAttempt.exam_id.in_(exam_ids)
+    ).subquery()
+
+    attempts = ExamAttempt.query.join(
+        ranked, ExamAttempt.id == ranked.c.attempt_id
+    ).filter(ranked.c.position == 1).all()
+    return {attempt.exam_id: attempt for attempt in attempts}
+
+
+def _exam_unlock_state(exam: 'Exam', latest_attempt: 'ExamAttempt | None') -> dict:
+    in_progress = latest_attempt and latest_attempt.status == 'in-progress'
+    settings = exam.settings or {}
+    unlock_on_submission = bool(settings.get('unlock_on_submission'))
+    passed = bool(latest_attempt and latest_attempt.passed)
+    latest_status = latest_attempt.status if latest_attempt else 'not_started'
+    submitted_unlock = unlock_on_submission and latest_attempt and latest_status in {'submitted', 'graded', 'passed'}
+    return {
+        'exam': exam,
+        'latest_attempt': latest_attempt,
+        'passed': passed,
+        'status': latest_status,
+        'resume_attempt_id': latest_attempt.id if in_progress else None,
+        'time_remaining': _time_remaining_seconds(latest_attempt) if in_progress else None,
+        'trigger_lesson_id': exam.trigger_lesson_id,
+        'unlock_on_submission': unlock_on_submission,
+        'progress_unlocked': bool(passed or submitted_unlock)
+    }
+
+
+def build_course_unlock_state(user_id: int, course: 'Course', lessons=None) -> dict:
+    """
+    Work out which exams a user has cleared in a course and which lesson weeks
+    are still locked behind a required exam.
+
+    Returns a dict with exam_states (ordered by trigger week), exams_by_trigger
+    (keyed by trigger lesson id, 0 for untriggered exams), locked_weeks and
+    locking_exam_by_week. Pass the course's lessons if they are already loaded.
+    """
+    if lessons is None:
+        lessons = Lesson.query.filter_by(course_id=course.id).order_by(Lesson.week).all()
+
+    # Always ask the Exam table: exam_count is a display counter, and a drifted
+    # zero must never drop a required exam from the lock check
+    exams = Exam.query.options(db.selectinload(Exam.trigger_lesson)).filter_by(course_id=course.id).all()
+    exams.sort(key=lambda ex: (ex.trigger_lesson.week if ex.trigger_lesson else 999, ex.id))
+
+    latest_by_exam = latest_exam_attempts(user_id, (exam.id for exam in exams))
+    last_week = max((lesson.week for lesson in lessons), default=0)
+
+    exam_states = []
+    exams_by_trigger = {}
+    # The required, still-locked exam with the earliest trigger week locks every later week
+    locking_state = None
+    locking_week = None
+
+    for exam in exams:
+        exam_state = _exam_unlock_state(exam, latest_by_exam.get(exam.id))
+        exam_states.append(exam_state)
+        exams_by_trigger.setdefault(exam.trigger_lesson_id or 0, []).append(exam_state)
+
+        if exam.is_required and not exam_state['progress_unlocked']:
+            trigger_week = exam.trigger_lesson.week if exam.trigger_lesson else last_week
+            if locking_week is None or trigger_week < locking_week:
+                locking_state = exam_state
+                locking_week = trigger_week
+
+    locked_weeks = set()
+    locking_exam_by_week = {}
+    if locking_state is not None:
+        for lesson in lessons:
+            if lesson.week > locking_week:
+                locked_weeks.add(lesson.week)
+                locking_exam_by_week[lesson.week] = locking_state
+
+    return {
+        'exam_states': exam_states,
+        'exams_by_trigger': exams_by_trigger,
+        'locked_weeks': locked_weeks,
+        'locking_exam_by_week': locking_exam_by_week
+    }
+
+
+# -------------------- Course Dashboard Data -------------------- #
+DASHBOARD_ASSIGNMENTS = ('standalone', 'year_1', 'year_2')
+
+
+def _progress_by_course(user_id: int) -> dict:
+    """Return {course_id: UserCourseProgress} for every course the user has started."""
+    return {
+        record.course_id: record
+        for record in UserCourseProgress.query.filter_by(user_id=user_id).all()
+    }
+
+
+def _course_card(course: Course, entitlements: CourseEntitlements, progress_by_course: dict) -> dict:
+    """Build the access/progress payload for one course card from pre-fetched data."""
+    has_access = entitlements.can_access(course)
+    is_free = course.is_free()
+
+    # Calculate progress if user has access
+    progress_percent = 0
+    is_started = False
+    if has_access or is_free:
+        progress_record = progress_by_course.get(course.id)
+        if progress_record:
+            is_started = progress_record.progress > 0
+            # Calculate percentage: (lessons completed / total lessons) × 100
+            total_lessons = course.lesson_count or 0
+            if total_lessons > 0:
+                progress_percent = int((progress_record.progress / total_lessons) * 100)
+
+    return {
+        'course': course,
+        'has_access': has_access,
+        'is_free': is_free,
+        'requires_approval': False,  # Can be extended later for approval-required courses
+        'is_started': is_started,
+        'progress_percent': progress_percent,
+        'is_child': course.parent_id is not None,
+        'children': []
+    }
 
-            if progress_record:
-                is_started = progress_record.progress > 0
-                # Calculate percentage: (lessons completed / total lessons) × 100
-                total_lessons = Lesson.query.filter_by(course_id=course.id).count()
-                if total_lessons > 0:
-                    progress_percent = int((progress_record.progress / total_lessons) * 100)
-
-        return {
-            'course': course,
-            'has_access': has_access,
-            'is_free': is_free,
-            'requires_approval': requires_approval,
-            'is_started': is_started,
-            'progress_percent': progress_percent,
-            'is_child': course.parent_id is not None,
-            'children': []
-        }
 
-    def build_course_payload(course):
-        payload = get_course_data(course)
-        if course.children:
-            child_payloads = []
+def build_course_dashboard(user: User) -> dict:
+    """
+    Group published courses into dashboard cards for a user.
+    Runs a fixed number of queries (courses, progress, access)
+    however large the catalogue is.
+    """
+    entitlements = get_course_entitlements(user.id)
+    courses = Course.query.filter_by(is_published=True).order_by(Course.order_index, Course.name).all()
+    progress_by_course = _progress_by_course(user.id)
+
+    children_by_parent = {}
+    for course in courses:
+        if course.parent_id is not None:
+            children_by_parent.setdefault(course.parent_id, []).append(course)
+
+    dashboard = {assignment: [] for assignment in DASHBOARD_ASSIGNMENTS}
+    for course in courses:
+        if course.parent_id is not None or course.course_assignment not in dashboard:
+            continue
+        payload = _course_card(course, entitlements, progress_by_course)
+        payload['children'] = [
+            _course_card(child, entitlements, progress_by_course)
             for child in sorted(
-                (c for c in course.children if c.is_published),
-                key=lambda c: (c.order_index, c.name.lower())
-            ):
-                child_payloads.append(get_course_data(child))
-            payload['children'] = child_payloads
-        return payload
-
-    standalone_courses = [
-        build_course_payload(course)
-        for course in Course.query.filter_by(
-            is_published=True,
-            parent_id=None,
-            course_assignment='standalone'
-        ).order_by(Course.order_index, Course.name).all()
-    ]
+                children_by_parent.get(course.id, []),
+                key=lambda c: (c.order_index or 0, c.name.lower())
+            )
+        ]
+        dashboard[course.course_assignment].append(payload)
 
-    year_1_courses = [
-        build_course_payload(course)
-        for course in Course.query.filter_by(
-            is_published=True,
-            parent_id=None,
-            course_assignment='year_1'
-        ).order_by(Course.order_index, Course.name).all()
-    ]
+    dashboard['progress_by_course'] = progress_by_course
+    return dashboard
 
-    year_2_courses = [
-        build_course_payload(course)
-        for course in Course.query.filter_by(
-            is_published=True,
-            parent_id=None,
-            course_assignment='year_2'
-        ).order_by(Course.order_index, Course.name).all()
-    ]
+
+@app.route('/courses')
+@login_required
+def courses_dashboard():
+    user = g.user
+    dashboard = build_course_dashboard(user)
 
     # Get finished courses for review button
-    finished_course_ids = set()
-    for progress in user.course_progress:
-        if progress.is_finished:
-            finished_course_ids.add(progress.course_id)
+    finished_course_ids = {
+        course_id
+        for course_id, progress in dashboard['progress_by_course'].items()
+        if progress.is_finished
+    }
 
     # Get courses user has already reviewed
-    reviewed_course_ids = set(t.course_id for t in user.testimonials)
+    reviewed_course_ids = {
+        course_id
+        for (course_id,) in db.session.query(Testimonial.course_id).filter_by(user_id=user.id)
+    }
 
     return render_template(
         "courses_dashboard.html",
         user=user,
-        standalone_courses=standalone_courses,
-        year_1_courses=year_1_courses,
-        year_2_courses=year_2_courses,
+        standalone_courses=dashboard['standalone'],
+        year_1_courses=dashboard['year_1'],
+        year_2_courses=dashboard['year_2'],
         finished_course_ids=finished_course_ids,
         reviewed_course_ids=reviewed_course_ids
     )
@@ -4280,7 +6227,7 @@ def courses_dashboard():
 @app.route('/student-hub')
 @login_required
 def student_hub():
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if user.role not in ('paid', 'admin'):
         flash("⚠️ Student Hub is available to paid students only.")
@@ -4294,29 +6241,26 @@ def student_hub():
 @app.route('/student-hub/upload', methods=['POST'])
 @login_required
 def student_hub_upload():
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if user.role not in ('paid', 'admin'):
         flash("⚠️ Student Hub is available to paid students only.")
         return redirect(url_for('courses_dashboard'))
 
-    uploaded_file = request.files.get('student_file')
-    if not uploaded_file or uploaded_file.filename == '':
-        flash('⚠️ No file selected')
+    # Parsed by hand: touching request.files would spool the whole body to a temp file first
+    try:
+        upload = stream_student_hub_upload('student_file')
+    except ValueError as exc:
+        flash(str(exc))
         return redirect(url_for('student_hub'))
 
-    filename = secure_filename(uploaded_file.filename)
-    user_folder = os.path.join(app.config['STUDENT_HUB_UPLOAD_FOLDER'], str(user.id))
-    os.makedirs(user_folder, exist_ok=True)
-    file_path = os.path.join(user_folder, filename)
-    uploaded_file.save(file_path)
-
     file_record = StudentHubFile(
         user_id=user.id,
-        stored_name=filename,
-        original_name=filename,
-        file_path=file_path,
-        file_size=os.path.getsize(file_path)
+        stored_name=upload['filename'],
+        original_name=upload['filename'],
+        file_path=upload['path'],
+        file_size=upload['size'],
+        content_hash=upload['sha256']
     )
     db.session.add(file_record)
     db.session.commit()
@@ -4328,7 +6272,7 @@ def student_hub_upload():
 @app.route('/student-hub/delete/<int:file_id>', methods=['POST'])
 @login_required
 def student_hub_delete(file_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     if user.role not in ('paid', 'admin'):
         flash("⚠️ Student Hub is available to paid students only.")
@@ -4340,7 +6284,7 @@ def student_hub_delete(file_id):
         flash("⚠️ You can only delete your own uploads.")
         return redirect(url_for('student_hub'))
 
-    _remove_student_hub_file_from_disk(file_record)
+    _remove_student_hub_file_from_storage(file_record)
     db.session.delete(file_record)
     db.session.commit()
     flash('🗑 File deleted successfully!')
@@ -4350,25 +6294,19 @@ def student_hub_delete(file_id):
 @app.route('/student-hub/download/<int:file_id>')
 @login_required
 def student_hub_download(file_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     file_record = StudentHubFile.query.get_or_404(file_id)
 
     if user.role != 'admin' and file_record.user_id != user.id:
         flash("⚠️ You can only access your own Student Hub files.")
         return redirect(url_for('student_hub'))
 
-    folder = os.path.join(app.config['STUDENT_HUB_UPLOAD_FOLDER'], str(file_record.user_id))
-    target_path = os.path.join(folder, file_record.stored_name)
-    if not os.path.exists(target_path):
+    media_path = _student_hub_media_path(file_record)
+    if not media_store.exists(media_path):
         flash("⚠️ File is missing from storage.")
         return redirect(url_for('student_hub'))
 
-    return send_from_directory(
-        folder,
-        file_record.stored_name,
-        as_attachment=True,
-        download_name=file_record.original_name
-    )
+    return send_media_file(media_path, download_name=file_record.original_name)
 
 
 def _resolve_exam_context(course_id: int, exam_id: int) -> tuple['Exam', Course | None]:
@@ -4395,7 +6333,7 @@ def _assert_exam_permissions(user: User, course: Course | None, exam: 'Exam') ->
         if not course:
             abort(404)
         # Check access via new hierarchy system or legacy system
-        has_access = course.user_has_access(user.id) or course.name in user.get_courses()
+        has_access = get_course_entitlements(user.id).can_access(course)
         if not has_access:
             abort(403)
     else:
@@ -4407,7 +6345,7 @@ def _assert_exam_permissions(user: User, course: Course | None, exam: 'Exam') ->
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>')
 @login_required
 def exam_page(course_id, exam_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4433,7 +6371,7 @@ def exam_page(course_id, exam_id):
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>/start', methods=['POST'])
 @login_required
 def start_exam(course_id, exam_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4472,7 +6410,7 @@ def start_exam(course_id, exam_id):
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>/autosave', methods=['POST'])
 @login_required
 def autosave_exam(course_id, exam_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4497,6 +6435,7 @@ def autosave_exam(course_id, exam_id):
 
     attempt.autosave_payload = responses or {}
     db.session.commit()
+    metrics.EXAM_AUTOSAVES.inc()
 
     return jsonify({'success': True, 'time_remaining_seconds': _time_remaining_seconds(attempt)})
 
@@ -4504,7 +6443,7 @@ def autosave_exam(course_id, exam_id):
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>/submit', methods=['POST'])
 @login_required
 def submit_exam(course_id, exam_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4597,7 +6536,7 @@ def submit_exam(course_id, exam_id):
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>/status')
 @login_required
 def exam_status(course_id, exam_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4620,13 +6559,16 @@ def exam_status(course_id, exam_id):
     summary = _summarize_exam_attempt(attempt)
     summary['time_remaining_seconds'] = _time_remaining_seconds(attempt)
 
-    return jsonify({'attempt': summary})
+    if attempt.status == 'in-progress':
+        return jsonify({'attempt': summary})
+    # Finished attempts only change when graded; let pollers revalidate cheaply
+    return _conditional_json({'attempt': summary})
 
 
 @app.route('/courses/<int:course_id>/exam/<int:exam_id>/results/<int:attempt_id>')
 @login_required
 def exam_results(course_id, exam_id, attempt_id):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     exam, course = _resolve_exam_context(course_id, exam_id)
     _assert_exam_permissions(user, course, exam)
 
@@ -4646,65 +6588,79 @@ def exam_results(course_id, exam_id, attempt_id):
     )
 
 
+def _course_page_etag(user, course, child_courses, entitlements, progress_by_course, agreement) -> str | None:
+    """
+    Validator for course_page built from what the page shows: course content
+    versions, the user's access, progress, agreement and exam attempts, and the
+    quiz history kept in the session. None when the page must be rendered
+    anyway (one-shot quiz feedback or flashes waiting, or an exam timer running).
+    """
+    if session.get('quiz_feedback') or session.get('_flashes'):
+        return None
+
+    attempts = db.session.query(
+        ExamAttempt.id, ExamAttempt.status, ExamAttempt.passed, ExamAttempt.end_time,
+        ExamAttempt.score, ExamAttempt.max_score
+    ).join(Exam, Exam.id == ExamAttempt.exam_id).filter(
+        Exam.course_id == course.id,
+        ExamAttempt.user_id == user.id
+    ).order_by(ExamAttempt.id).all()
+    if any(attempt.status == 'in-progress' for attempt in attempts):
+        return None
+
+    passed_history = {key: value for key, value in session.get('quiz_history', {}).items() if value.get('passed')}
+    return _etag_for(
+        'course_page', course.id, course.content_version,
+        [(child.id, child.content_version) for child in child_courses],
+        user.id, user.role, session.get('user'), session.get('role'),
+        sorted(entitlements.granted_ids), sorted(entitlements.locked_ids), sorted(entitlements.legacy_names),
+        sorted((record.course_id, record.progress, record.is_finished) for record in progress_by_course.values()),
+        agreement.accepted_at if agreement else None,
+        [tuple(attempt) for attempt in attempts],
+        sorted(passed_history.items()),
+        # Signed lesson media URLs on the page roll over with the window
+        media_urls.expiry_for(app.config['MEDIA_URL_WINDOW']),
+    )
+
+
 @app.route('/course/<string:course_name>', defaults={'year': 1})
 @app.route('/course/<string:course_name>/<int:year>')
 @login_required
 def course_page(course_name, year):
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
 
     # Find course & lessons
     course = Course.query.filter_by(name=course_name, year=year).first_or_404()
 
-    allowed_courses = set(user.get_courses())
+    entitlements = get_course_entitlements(user.id)
 
     # ✅ NEW: Check access via new hierarchy system or legacy system
-    has_access = course.user_has_access(user.id) or course_name in allowed_courses
+    has_access = entitlements.can_access(course)
 
     if not has_access and user.role != 'admin':
         flash("⚠️ You don't have access to this course.")
         return redirect(url_for('courses_dashboard'))
 
-    lessons = Lesson.query.filter_by(course_id=course.id).order_by(Lesson.week).all()
-
     # Fetch published sub-courses for this course
     child_courses = Course.query.filter_by(parent_id=course.id, is_published=True).order_by(Course.order_index, Course.name).all()
+    progress_by_course = _progress_by_course(user.id)
+    agreement = CourseAgreement.query.filter_by(user_id=user.id, course_id=course.id).first()
+
+    etag = _course_page_etag(user, course, child_courses, entitlements, progress_by_course, agreement)
+    if etag:
+        not_modified = _not_modified(etag)
+        if not_modified:
+            return not_modified
+
+    lessons = Lesson.query.filter_by(course_id=course.id).order_by(Lesson.week).all()
+
     sub_course_payload = []
     for child in child_courses:
-        child_access = child.user_has_access(user.id) or child.name in allowed_courses
-        child_free = child.is_free()
-
-        child_progress_record = None
-        child_progress_percent = 0
-        child_started = False
-        if child_access or child_free:
-            child_progress_record = UserCourseProgress.query.filter_by(
-                user_id=user.id,
-                course_id=child.id
-            ).first()
-            if child_progress_record:
-                child_started = child_progress_record.progress > 0
-                total_child_lessons = Lesson.query.filter_by(course_id=child.id).count()
-                if total_child_lessons:
-                    child_progress_percent = int((child_progress_record.progress / total_child_lessons) * 100)
-
-        sub_course_payload.append({
-            'course': child,
-            'has_access': child_access,
-            'is_free': child_free,
-            'requires_purchase': bool(child.price and child.price > 0),
-            'is_started': child_started,
-            'progress_percent': child_progress_percent
-        })
+        child_payload = _course_card(child, entitlements, progress_by_course)
+        child_payload['requires_purchase'] = bool(child.price and child.price > 0)
+        sub_course_payload.append(child_payload)
 
-    exams = sorted(course.exams, key=lambda ex: (
-        ex.trigger_lesson.week if ex.trigger_lesson else 999,
-        ex.id
-    ))
-
-    progress_record = UserCourseProgress.query.filter_by(
-        user_id=user.id,
-        course_id=course.id
-    ).first()
+    progress_record = progress_by_course.get(course.id)
     progress = progress_record.progress if progress_record else 1
 
     open_lesson_id = request.args.get('open', type=int)
@@ -4720,46 +6676,9 @@ def course_page(course_name, year):
     history_raw = session.get('quiz_history', {})
     history_map = {int(k): v for k, v in history_raw.items() if v.get('passed')}
 
-    agreement = CourseAgreement.query.filter_by(user_id=user.id, course_id=course.id).first()
-
-    exam_states = []
-    exams_by_trigger = {}
-    locked_weeks = set()
-    locking_exam_by_week = {}
-
-    for exam in exams:
-        latest_attempt = ExamAttempt.query.filter_by(user_id=user.id, exam_id=exam.id).order_by(ExamAttempt.start_time.desc()).first()
-        in_progress = latest_attempt and latest_attempt.status == 'in-progress'
-        settings = exam.settings or {}
-        unlock_on_submission = bool(settings.get('unlock_on_submission'))
-        passed = bool(latest_attempt and latest_attempt.passed)
-        latest_status = latest_attempt.status if latest_attempt else 'not_started'
-        submitted_unlock = unlock_on_submission and latest_attempt and latest_status in {'submitted', 'graded', 'passed'}
-        progress_unlocked = passed or submitted_unlock
-        exam_state = {
-            'exam': exam,
-            'latest_attempt': latest_attempt,
-            'passed': passed,
-            'status': latest_status,
-            'resume_attempt_id': latest_attempt.id if in_progress else None,
-            'time_remaining': _time_remaining_seconds(latest_attempt) if in_progress else None,
-            'trigger_lesson_id': exam.trigger_lesson_id,
-            'unlock_on_submission': unlock_on_submission,
-            'progress_unlocked': progress_unlocked
-        }
-        exam_states.append(exam_state)
-
-        trigger_key = exam.trigger_lesson_id or 0
-        exams_by_trigger.setdefault(trigger_key, []).append(exam_state)
+    unlock_state = build_course_unlock_state(user.id, course, lessons)
 
-        if exam.is_required and not progress_unlocked:
-            trigger_week = exam.trigger_lesson.week if exam.trigger_lesson else (lessons[-1].week if lessons else 0)
-            for lesson in lessons:
-                if lesson.week > trigger_week:
-                    locked_weeks.add(lesson.week)
-                    locking_exam_by_week.setdefault(lesson.week, exam_state)
-
-    return render_template(
+    response = make_response(render_template(
         "courses.html",
         current_user=user,
         course=course,
@@ -4769,12 +6688,13 @@ def course_page(course_name, year):
         quiz_feedback=quiz_feedback,
         quiz_history=history_map,
         course_agreement=agreement,
-        exams=exam_states,
-        exams_by_trigger=exams_by_trigger,
-        locked_weeks=locked_weeks,
-        locking_exam_by_week=locking_exam_by_week,
+        exams=unlock_state['exam_states'],
+        exams_by_trigger=unlock_state['exams_by_trigger'],
+        locked_weeks=unlock_state['locked_weeks'],
+        locking_exam_by_week=unlock_state['locking_exam_by_week'],
         sub_courses=sub_course_payload
-    )
+    ))
+    return _with_etag(response, etag) if etag else response
 
 
 @app.route('/course/<int:course_id>')
@@ -4783,11 +6703,11 @@ def course_detail(course_id):
     """
     View course by ID - supports new hierarchy system
     """
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.get_or_404(course_id)
 
     # ✅ Check access via new hierarchy system or legacy system
-    has_access = course.user_has_access(user.id) or course.name in user.get_courses()
+    has_access = get_course_entitlements(user.id).can_access(course)
 
     if not has_access and user.role != 'admin':
         flash("⚠️ You don't have access to this course.")
@@ -4797,6 +6717,135 @@ def course_detail(course_id):
     return redirect(url_for('course_page', course_name=course.name, year=course.year))
 
 
+# -------------------- Lesson Media Delivery -------------------- #
+LESSON_MEDIA_FIELDS = {'video': 'video_file', 'slides': 'ppt_file'}
+
+
+def _lesson_unlocked_for(user: User, lesson: Lesson) -> bool:
+    """Same rules as course_page: course access, progress week and required-exam locks."""
+    if user.role == 'admin':
+        return True
+
+    course = lesson.course
+    if not get_course_entitlements(user.id).can_access(course):
+        return False
+
+    progress_record = UserCourseProgress.query.filter_by(user_id=user.id, course_id=course.id).first()
+    if (progress_record.progress if progress_record else 1) < lesson.week:
+        return False
+
+    # Only this lesson's week is asked about, so its row can stand in for the full list
+    unlock_state = build_course_unlock_state(user.id, course, [lesson])
+    return lesson.week not in unlock_state['locked_weeks']
+
+
+def send_media_file(relative_path: str, download_name: str | None = None):
+    """
+    Send a file from media storage once the caller has checked access.
+    Remote storage answers with a redirect to a presigned URL valid for
+    MEDIA_MAX_AGE, so the bucket serves the bytes and the Range requests.
+    For local files with MEDIA_SENDFILE_MODE set the front web server does
+    the transfer (X-Accel-Redirect / X-Sendfile) and the worker is free
+    straight away; otherwise Flask streams it, answering Range requests with 206.
+    A download_name makes it an attachment under that name.
+    """
+    download_url = media_store.download_url(relative_path, app.config['MEDIA_MAX_AGE'], download_name)
+    if download_url:
+        response = redirect(download_url)
+        response.headers['Cache-Control'] = f"private, max-age={app.config['MEDIA_MAX_AGE']}"
+        return response
+
+    full_path = media_store.local_path(relative_path)
+    if full_path is None or not os.path.isfile(full_path):
+        abort(404)
+
+    mode = app.config.get('MEDIA_SENDFILE_MODE')
+    mimetype = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+    if mode == 'x-accel-redirect':
+        response = app.response_class(mimetype=mimetype)
+        location = app.config['MEDIA_ACCEL_PREFIX'].rstrip('/') + '/' + relative_path.replace(os.sep, '/')
+        response.headers['X-Accel-Redirect'] = quote(location)
+    elif mode == 'x-sendfile':
+        response = app.response_class(mimetype=mimetype)
+        response.headers['X-Sendfile'] = full_path
+    else:
+        # Range -> 206 and If-None-Match/If-Modified-Since -> 304 come from conditional=True
+        response = send_file(full_path, mimetype=mimetype, conditional=True,
+                             as_attachment=bool(download_name), download_name=download_name)
+        # Werkzeug only sends this on 206s; players look for it on the first 200 to enable seeking
+        response.headers.setdefault('Accept-Ranges', 'bytes')
+
+    if download_name and 'Content-Disposition' not in response.headers:
+        response.headers.set('Content-Disposition', 'attachment', filename=download_name)
+    response.headers['Cache-Control'] = f"private, max-age={app.config['MEDIA_MAX_AGE']}"
+    return response
+
+
+@app.route('/lessons/<int:lesson_id>/<any(video, slides):kind>')
+@login_required
+def lesson_media(lesson_id, kind):
+    """Lesson video or slides for users who can see the lesson on the course page."""
+    lesson = Lesson.query.get_or_404(lesson_id)
+    relative_path = getattr(lesson, LESSON_MEDIA_FIELDS[kind])
+    if not relative_path:
+        abort(404)
+    if not _lesson_unlocked_for(g.user, lesson):
+        abort(403)
+    return send_media_file(relative_path)
+
+
+# -------------------- Signed Media URLs -------------------- #
+# Lesson media and Student Hub files lived under these static/ folders before
+# the blob store moved to MEDIA_ROOT. Copies left there must never be reachable
+# without the access check or a signed URL, so the static route refuses them.
+PRIVATE_STATIC_PREFIXES = ('blobs/', 'courses/', 'uploads/')
+
+
+@app.before_request
+def refuse_private_static_files():
+    if request.endpoint != 'static':
+        return
+    # safe_join resolves 'css/../courses/...' too, so compare the normalized path
+    filename = posixpath.normpath((request.view_args or {}).get('filename', '')).lstrip('/').lower()
+    if filename.startswith(PRIVATE_STATIC_PREFIXES):
+        abort(404)
+
+
+def _media_url_secret():
+    return app.config.get('MEDIA_URL_SECRET') or app.config['SECRET_KEY']
+
+
+def signed_media_url(relative_path: str, download_name: str | None = None, user_id: int | None = None) -> str:
+    """
+    Expiring URL for a file in media storage, for the current user by
+    default. Only hand these out after the access check (e.g. for lessons the
+    course page shows unlocked): the URL itself is the permission.
+    """
+    media_path = relative_path.replace(os.sep, '/')
+    user_id = g.user.id if user_id is None else user_id
+    expires = media_urls.expiry_for(app.config['MEDIA_URL_WINDOW'])
+    signature = media_urls.sign(_media_url_secret(), user_id, expires, media_path, download_name or '')
+    return url_for('signed_media', user_id=user_id, expires=expires, signature=signature,
+                   media_path=media_path, name=download_name or None)
+
+
+app.jinja_env.globals.update(signed_media_url=signed_media_url, student_hub_media_path=_student_hub_media_path)
+
+
+@app.route('/media/<int:user_id>/<int:expires>/<signature>/<path:media_path>')
+def signed_media(user_id, expires, signature, media_path):
+    """Serve a signed media URL. No session or database: edge caches can keep the response."""
+    download_name = request.args.get('name', '')
+    if not media_urls.verify(_media_url_secret(), user_id, expires, media_path, signature, download_name):
+        abort(403)
+
+    response = send_media_file(media_path, download_name=download_name or None)
+    # Anyone holding the URL may see the file until it expires, so shared caches may too
+    max_age = max(0, min(app.config['MEDIA_MAX_AGE'], expires - int(time.time())))
+    response.headers['Cache-Control'] = f"public, max-age={max_age}"
+    return response
+
+
 # -------------------- Stripe Payment Routes -------------------- #
 @app.route('/courses/<int:course_id>/checkout')
 @login_required
@@ -4806,7 +6855,7 @@ def course_checkout(course_id):
     """
     from stripe_helpers import create_checkout_session, sync_course_with_stripe
 
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     course = Course.query.get_or_404(course_id)
 
     # Check if course is free
@@ -4880,7 +6929,7 @@ def subscription_plans():
     Show available subscription plans.
     """
     plans = SubscriptionPlan.query.filter_by(is_active=True).all()
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     active_subscription = get_user_active_subscription(user.id) if user else None
 
     return render_template('subscription_plans.html', plans=plans, active_subscription=active_subscription)
@@ -4894,7 +6943,7 @@ def subscribe_plan(plan_id):
     """
     from stripe_helpers import create_subscription_checkout_session, sync_plan_with_stripe
 
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     plan = SubscriptionPlan.query.get_or_404(plan_id)
 
     if not plan.is_active:
@@ -4965,7 +7014,7 @@ def my_subscription():
     """
     Show user's subscription details and management options.
     """
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     active_subscription = get_user_active_subscription(user.id)
 
     subscription_data = None
@@ -4993,7 +7042,7 @@ def billing_portal():
     """
     from stripe_helpers import create_customer_portal_session
 
-    user = User.query.filter_by(username=session['user']).first()
+    user = g.user
     active_subscription = get_user_active_subscription(user.id)
 
     if not active_subscription or not active_subscription.stripe_customer_id: